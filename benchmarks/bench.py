@@ -0,0 +1,155 @@
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from contextlib import redirect_stdout
+from glob import glob
+from statistics import median
+from typing import Callable, Dict, List
+
+import main
+from xfbin import *
+
+from .corpus import PRESETS, generate_corpus
+
+OPERATIONS = ('read', 'read_metadata', 'read_faces', 'write', 'roundtrip', 'unpack', 'repack')
+
+
+def unpack_args(input, output) -> Namespace:
+    return Namespace(input=input, output=output, force_overwrite=True, file_data_only=False,
+                     sort_types=False, no_json=False, manifest=False, archive=None, store=None, verbose=False, jobs=1)
+
+
+def repack_args(input, output) -> Namespace:
+    return Namespace(input=input, output=output, force_overwrite=True, verbose=False, jobs=1, cache=False, watch=False,
+                     store=None)
+
+
+def measure(func: Callable, repeat: int) -> Dict[str, object]:
+    """Runs the function `repeat` times for timing, then once more under tracemalloc for the peak memory."""
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'times': times,
+        'best': min(times),
+        'median': median(times),
+        'peak_bytes': peak,
+    }
+
+
+def bench_file(path: str, operations: List[str], repeat: int, work_dir: str) -> List[Dict[str, object]]:
+    size = os.path.getsize(path)
+    xfbin = read_xfbin(path)
+
+    unpack_dir = os.path.join(work_dir, 'unpacked')
+    repack_path = os.path.join(work_dir, 'repacked.xfbin')
+
+    funcs = {
+        'read': lambda: read_xfbin(path),
+        'read_metadata': lambda: read_xfbin(path, nud_level=NudParseLevel.METADATA),
+        'read_faces': lambda: read_xfbin(path, nud_level=NudParseLevel.FACES),
+        'write': lambda: write_xfbin(xfbin),
+        'roundtrip': lambda: write_xfbin(read_xfbin(path)),
+        'unpack': lambda: main.unpack(unpack_args(path, unpack_dir)),
+        'repack': lambda: main.repack(repack_args(unpack_dir, repack_path)),
+    }
+
+    # Keep the script output from polluting the results
+    devnull = open(os.devnull, 'w')
+
+    # Repacking needs an unpacked folder to start from
+    if 'repack' in operations:
+        with redirect_stdout(devnull):
+            main.unpack(unpack_args(path, unpack_dir))
+
+    results = list()
+    for op in operations:
+        with redirect_stdout(devnull):
+            result = measure(funcs[op], repeat)
+
+        result['file'] = os.path.basename(path)
+        result['size'] = size
+        result['op'] = op
+        result['mb_per_s'] = (size / (1024 * 1024)) / result['best'] if result['best'] else None
+
+        print(f'{result["file"]:<24} {op:<10} best {result["best"] * 1000:10.1f} ms  '
+              f'{result["mb_per_s"]:8.2f} MB/s  peak {result["peak_bytes"] / (1024 * 1024):8.1f} MB', file=sys.stderr)
+
+        results.append(result)
+
+    devnull.close()
+    shutil.rmtree(unpack_dir, ignore_errors=True)
+
+    return results
+
+
+def main_bench():
+    parser = ArgumentParser(description='Benchmarks reading, writing, unpacking and repacking XFBIN files.')
+    parser.add_argument('corpus', nargs='*',
+                        help='XFBIN files or glob patterns to benchmark (defaults to a generated synthetic corpus)')
+    parser.add_argument('-p', '--presets', default='small,medium',
+                        help=f'comma separated synthetic corpus presets to generate ({", ".join(PRESETS)})')
+    parser.add_argument('-c', '--corpus-dir', default=None,
+                        help='folder to generate the synthetic corpus in (defaults to a temporary folder)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the synthetic corpus')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of timed runs for each operation')
+    parser.add_argument('-O', '--operations', default=','.join(OPERATIONS),
+                        help=f'comma separated operations to measure ({", ".join(OPERATIONS)})')
+    parser.add_argument('-o', '--output', default=None, help='path to write the JSON results to (defaults to stdout)')
+
+    args = parser.parse_args()
+
+    operations = [op for op in args.operations.split(',') if op]
+    for op in operations:
+        if op not in OPERATIONS:
+            parser.error(f'unknown operation: {op}')
+
+    with tempfile.TemporaryDirectory(prefix='xfbin_bench_') as work_dir:
+        if args.corpus:
+            paths = sorted(p for pattern in args.corpus for p in (glob(pattern) or [pattern]))
+        else:
+            print('Generating synthetic corpus...', file=sys.stderr)
+            paths = generate_corpus(args.corpus_dir or os.path.join(work_dir, 'corpus'),
+                                    [p for p in args.presets.split(',') if p], args.seed)
+
+        results = list()
+        for path in paths:
+            results.extend(bench_file(path, operations, args.repeat, work_dir))
+
+    report = {
+        'version': main.VERSION,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,327 @@
+import math
+import os
+import random
+from typing import Dict, List
+
+from xfbin import *
+from xfbin.structure.nucc import (ClumpModelGroup, CoordNode, Dynamics1, Dynamics2,
+                                  MaterialTextureGroup, RiggingFlag)
+from xfbin.structure.nud import (Nud, NudMaterial, NudMaterialProperty, NudMaterialTexture,
+                                 NudMesh, NudMeshGroup, NudVertex)
+from xfbin.structure.br.br_nud import NudBoneType, NudUvType, NudVertexType
+from xfbin.util import BinaryReader, Endian
+
+# Synthetic XFBIN generator used by the benchmarks.
+# Everything is built from the same classes the writer consumes, so the generated files
+# have the same page layout as a real character XFBIN (texture pages, a clump page and a dynamics page)
+# without having to redistribute any game files.
+
+PRESETS: Dict[str, dict] = {
+    'small': dict(texture_count=2, texture_size=64, model_count=2, mesh_count=1,
+                  vertex_count=500, face_count=800, coord_count=16),
+    'medium': dict(texture_count=8, texture_size=256, model_count=8, mesh_count=2,
+                   vertex_count=4_000, face_count=7_000, coord_count=64),
+    'large': dict(texture_count=24, texture_size=512, model_count=12, mesh_count=3,
+                  vertex_count=12_000, face_count=16_000, coord_count=160),
+}
+
+
+def make_nut(rng: random.Random, width: int, height: int) -> bytearray:
+    """Builds a single texture NTP3 (DXT1) with random pixel data."""
+    data_size = max(8, (width * height) // 2)
+    header_size = 0x50
+
+    br = BinaryReader(endianness=Endian.BIG)
+    br.write_str('NTP3')
+    br.write_uint16(0x0200)  # Version
+    br.write_uint16(1)  # Texture count
+    br.write_uint32([0] * 2)
+
+    br.write_uint32(header_size + data_size)  # Total size
+    br.write_uint32(0)
+    br.write_uint32(data_size)
+    br.write_uint16(header_size)
+    br.write_uint16(0)
+
+    br.write_uint8(0)
+    br.write_uint8(1)  # Mipmap count
+    br.write_uint8(0)
+    br.write_uint8(0)  # Pixel format (DXT1)
+
+    br.write_uint16(width)
+    br.write_uint16(height)
+
+    br.write_uint32(0)
+    br.write_uint32(0)  # Cubemap format
+
+    br.write_uint32([header_size, 0, 0, 0])  # Data offset
+
+    # eXt and GIDX
+    br.write_str('eXt')
+    br.write_uint8(0)
+    br.write_uint32([0x20, 0x10, 0])
+    br.write_str('GIDX')
+    br.write_uint32(0x10)
+
+    br.write_uint32(0)  # Hash ID
+    br.write_uint32(0)
+
+    br.write_bytes(rng.randbytes(data_size))
+
+    return br.buffer()
+
+
+def make_texture(rng: random.Random, file_path: str, name: str, size: int) -> NuccChunkTexture:
+    texture = NuccChunkTexture(file_path, name)
+    texture.extension = '.nut'
+    texture.has_props = True
+    texture.width = texture.height = size
+    texture.file_data = make_nut(rng, size, size)
+
+    return texture
+
+
+def make_material(rng: random.Random, file_path: str, name: str, textures: List[NuccChunkTexture]) -> NuccChunkMaterial:
+    material = NuccChunkMaterial(file_path, name)
+    material.has_props = True
+
+    material.field02 = 0xCD
+    material.field04 = 0.0
+    material.format = 0x3C
+    material.floats = tuple(rng.random() for _ in range(NuccChunkMaterial.float_count(material.format)))
+
+    group = MaterialTextureGroup()
+    group.unk = 0
+    group.texture_chunks = list(textures)
+    material.texture_groups = [group]
+
+    return material
+
+
+def make_coords(rng: random.Random, file_path: str, count: int) -> List[NuccChunkCoord]:
+    coords = list()
+    for i in range(count):
+        coord = NuccChunkCoord(file_path, f'bone{i:03}' if i else 'root')
+        coord.has_props = True
+
+        node = coord.node = CoordNode(coord)
+        node.position = (rng.uniform(-5, 5), rng.uniform(-5, 5), rng.uniform(-5, 5))
+        node.rotation = (rng.uniform(-180, 180), rng.uniform(-180, 180), rng.uniform(-180, 180))
+
+        if i:
+            # Random tree, but parents always come before their children
+            node.parent = coords[rng.randrange(i)].node
+            node.parent.children.append(node)
+
+        coords.append(coord)
+
+    return coords
+
+
+def make_mesh(rng: random.Random, vertex_count: int, face_count: int, bone_count: int,
+              vertex_type: NudVertexType, bone_type: NudBoneType, uv_type: NudUvType, uv_channels: int) -> NudMesh:
+    if vertex_count > NudMesh.MAX_VERTICES or face_count > NudMesh.MAX_FACES:
+        raise ValueError(f'Mesh size ({vertex_count} vertices, {face_count} faces) is over the NUD mesh limits')
+
+    mesh = NudMesh()
+    mesh.vertex_type = vertex_type
+    mesh.bone_type = bone_type
+    mesh.uv_type = uv_type
+    mesh.face_flag = 0
+
+    has_tangents = vertex_type in (NudVertexType.NormalsTanBiTanFloat, NudVertexType.NormalsTanBiTanHalfFloat)
+
+    # Lay the vertices out on a grid to get a realistic triangle adjacency
+    width = max(2, math.ceil(math.sqrt(vertex_count)))
+
+    mesh.vertices = list()
+    for i in range(vertex_count):
+        x, y = i % width, i // width
+
+        vertex = NudVertex()
+        vertex.position = (x * 0.1, rng.uniform(-0.05, 0.05), y * 0.1)
+        vertex.normal = (0.0, 1.0, 0.0)
+        vertex.tangent = (1.0, 0.0, 0.0, 1.0) if has_tangents else None
+        vertex.bitangent = (0.0, 0.0, 1.0, 1.0) if has_tangents else None
+        vertex.color = tuple(rng.randrange(256) for _ in range(4)) if uv_type != NudUvType.Null else None
+        vertex.uv = [(x / width, y / width) for _ in range(uv_channels)]
+
+        if bone_type != NudBoneType.NoBones:
+            vertex.bone_ids = tuple(rng.randrange(bone_count) for _ in range(4))
+            weights = [rng.random() for _ in range(4)]
+            total = sum(weights)
+            vertex.bone_weights = tuple(w / total for w in weights)
+        else:
+            vertex.bone_ids = vertex.bone_weights = None
+
+        mesh.vertices.append(vertex)
+
+    # Two triangles for each complete grid quad
+    grid_faces = list()
+    for y in range((vertex_count // width) - 1):
+        for x in range(width - 1):
+            a = y * width + x
+            b, c, d = a + 1, a + width, a + width + 1
+            grid_faces.append((a, c, b))
+            grid_faces.append((b, c, d))
+
+    mesh.faces = [grid_faces[i % len(grid_faces)] for i in range(face_count)] if grid_faces else list()
+
+    material = NudMaterial()
+    material.flags = 0xF8A04A03
+    material.sourceFactor = material.destFactor = 0
+    material.alphaTest = material.alphaFunction = 0
+    material.refAlpha = 0
+    material.cullMode = 0x405
+    material.unk1 = material.unk2 = 0.0
+    material.zBufferOffset = 0
+
+    texture = NudMaterialTexture()
+    texture.unk0 = -1
+    texture.mapMode = 0
+    texture.wrapModeS = texture.wrapModeT = 1
+    texture.minFilter = texture.magFilter = 2
+    texture.mipDetail = 6
+    texture.unk1 = 0
+    texture.unk2 = 0
+    material.textures = [texture]
+
+    prop = NudMaterialProperty()
+    prop.name = 'NU_materialHash'
+    prop.values = [rng.random(), 0.0, 0.0, 0.0]
+    material.properties = [prop]
+
+    mesh.materials = [material]
+
+    return mesh
+
+
+def make_model(rng: random.Random, file_path: str, name: str, clump: NuccChunkClump,
+               coords: List[NuccChunkCoord], materials: List[NuccChunkMaterial], mesh_count: int, **mesh_args) -> NuccChunkModel:
+    model = NuccChunkModel(file_path, name)
+    model.extension = '.nud'
+    model.has_props = True
+
+    model.rigging_flag = RiggingFlag.FULL | RiggingFlag.BLUR | RiggingFlag.SHADOW
+    model.material_flags = (0, 0, 8, 3)
+    model.flag1_floats = tuple()
+
+    model.clump_chunk = clump
+    model.hit_chunk = NuccChunkNull()
+    model.coord_index = 0
+    model.coord_chunk = coords[0]
+    model.material_chunks = list(materials)
+
+    nud = model.nud = Nud()
+    nud.name = name
+    nud.bounding_sphere = (0.0, 0.0, 0.0, 10.0)
+
+    group = NudMeshGroup()
+    group.name = name
+    group.bone_flags = 4 if mesh_args['bone_type'] != NudBoneType.NoBones else 0
+    group.bounding_sphere = (0.0, 0.0, 0.0, 10.0) * 2
+    group.meshes = [make_mesh(rng, bone_count=len(coords), **mesh_args) for _ in range(mesh_count)]
+    nud.mesh_groups = [group]
+
+    return model
+
+
+def make_dynamics(rng: random.Random, file_path: str, name: str, clump: NuccChunkClump) -> NuccChunkDynamics:
+    dynamics = NuccChunkDynamics(file_path, name)
+    dynamics.has_props = True
+    dynamics.clump_chunk = clump
+
+    coord_count = len(clump.coord_chunks)
+
+    dynamics.section1 = list()
+    for _ in range(max(1, coord_count // 8)):
+        d = Dynamics1()
+        d.floats = tuple(rng.random() for _ in range(4))
+        d.coord_index = rng.randrange(coord_count)
+        d.shorts = [rng.randrange(coord_count) for _ in range(rng.randrange(1, 4))]
+        dynamics.section1.append(d)
+
+    dynamics.section2 = list()
+    for _ in range(max(1, coord_count // 16)):
+        d = Dynamics2()
+        d.floats = tuple(rng.random() for _ in range(6))
+        d.coord_index = rng.randrange(coord_count)
+        d.negative_unk = -1
+        d.unk_short_tuples = [tuple(rng.randrange(coord_count) for _ in range(2))]
+        dynamics.section2.append(d)
+
+    return dynamics
+
+
+def generate_xfbin(name='synthetic', seed=0, texture_count=4, texture_size=256, model_count=4, mesh_count=2,
+                   vertex_count=2_000, face_count=3_000, coord_count=64,
+                   vertex_type=NudVertexType.NormalsTanBiTanHalfFloat, bone_type=NudBoneType.HalfFloat,
+                   uv_type=NudUvType.Byte, uv_channels=1, dynamics=True) -> Xfbin:
+    """Generates a character-like Xfbin object.\n
+    The result has one page per texture, a clump page containing the models, coords and materials,
+    and optionally a dynamics page referencing the clump.
+    """
+    rng = random.Random(seed)
+    file_path = f'c/{name}/max/{name}.max'
+
+    textures = [make_texture(rng, f'c/{name}/tex/{name}_{i:02}.nut', f'{name}_{i:02}', texture_size)
+                for i in range(texture_count)]
+
+    clump = NuccChunkClump(file_path, f'{name}_clump')
+    clump.has_props = True
+    clump.field00 = 0
+    clump.coord_flag0 = clump.coord_flag1 = 0
+    clump.model_flag0 = clump.model_flag1 = 0
+
+    clump.coord_chunks = make_coords(rng, file_path, coord_count)
+    clump.root_nodes = [clump.coord_chunks[0].node]
+
+    # Spread the textures over a few materials
+    materials = list()
+    for i in range(max(1, texture_count // 2)):
+        materials.append(make_material(rng, file_path, f'{name}_mat{i:02}', textures[i * 2: i * 2 + 2]))
+
+    clump.model_chunks = list()
+    for i in range(model_count):
+        clump.model_chunks.append(make_model(rng, file_path, f'{name}_model{i:02}', clump, clump.coord_chunks,
+                                             [materials[i % len(materials)]], mesh_count,
+                                             vertex_count=vertex_count, face_count=face_count,
+                                             vertex_type=vertex_type, bone_type=bone_type,
+                                             uv_type=uv_type, uv_channels=uv_channels))
+
+    group = ClumpModelGroup()
+    group.flag0 = group.flag1 = 0
+    group.unk = 0
+    group.model_chunks = list(clump.model_chunks)
+    clump.model_groups = [group]
+
+    xfbin = Xfbin()
+
+    # Texture pages come first, add_clump_page will only add textures that have data from an existing XFBIN
+    for texture in textures:
+        xfbin.add_chunk_page(texture)
+
+    xfbin.add_clump_page(clump)
+
+    if dynamics:
+        xfbin.add_chunk_page(make_dynamics(rng, file_path, f'{name}_dyn', clump))
+
+    return xfbin
+
+
+def generate_corpus(directory: str, presets: List[str], seed=0) -> List[str]:
+    """Writes one XFBIN per preset into the given directory and returns the list of paths.\n
+    Files that already exist are not regenerated, as the output only depends on the preset and the seed.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    paths = list()
+    for preset in presets:
+        path = os.path.join(directory, f'{preset}_{seed}.xfbin')
+
+        if not os.path.isfile(path):
+            write_xfbin_to_path(generate_xfbin(preset, seed, **PRESETS[preset]), path)
+
+        paths.append(path)
+
+    return paths
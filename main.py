@@ -1,7 +1,20 @@
+import hashlib
+import io
 import json
 import os
 import shutil
-from argparse import ArgumentParser
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import (Future, ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from contextlib import redirect_stdout
+from glob import glob
+from typing import Dict, List, Optional, Tuple, Union
+from xfbin.structure.br.br_xfbin import SerializedPage
 from xfbin.structure.xfbin import ChunkReference
 
 from xfbin import *
@@ -10,10 +23,270 @@ from xfbin.structure.nucc import NuccChunk
 VERSION = 'v1.2.2'
 AUTHOR = 'SutandoTsukai181'
 
+# Maximum size of the data that is waiting to be written by the FileWriter's threads
+MAX_PENDING_BYTES = 256 * 1024 * 1024
+
+# Name of the page manifest file, which replaces the "_page.json" files of an unpacked folder when used
+MANIFEST_FILE = '_pages.manifest'
+
+# Name of the file inside an unpacked folder that stores the serialized pages from the last repack
+REPACK_CACHE_FILE = '_repack.cache'
+
+# Seconds to wait for files to stop changing before repacking in watch mode
+WATCH_SETTLE_TIME = 0.1
+
+# Name of the file that keeps track of the finished inputs of a batch, for resuming
+BATCH_STATE_FILE = '_batch.json'
+
+# Seconds between saving the batch state file
+BATCH_STATE_INTERVAL = 5.0
+
+
+class FileWriter:
+    """Writes files using a thread pool, while limiting the size of the data that has not been written yet.\n
+    If jobs is 1, files will be written immediately in the calling thread.\n
+    Errors are stored for each file instead of being raised, and can be printed with `report_errors`.
+    """
+
+    def __init__(self, jobs: int = 1, max_pending_bytes: int = MAX_PENDING_BYTES):
+        self.executor = ThreadPoolExecutor(jobs) if jobs > 1 else None
+        self.max_pending_bytes = max_pending_bytes
+
+        self.pending_bytes = 0
+        self.condition = threading.Condition()
+
+        # Kept in submission order to report errors in the same order every time
+        self.writes: List[Tuple[str, Future]] = list()
+        self.errors: List[Tuple[str, Exception]] = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, path: str, data: Union[bytes, bytearray, str], encoding: str = None):
+        """Writes the data to the given path. If data is a str, the file will be opened in text mode with the given encoding."""
+        if not self.executor:
+            try:
+                self._write_file(path, data, encoding)
+            except Exception as e:
+                self.errors.append((path, e))
+            return
+
+        size = len(data)
+
+        # Wait until there is room for this file, unless nothing is pending (to allow files larger than the limit)
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending_bytes == 0 or
+                                    self.pending_bytes + size <= self.max_pending_bytes)
+            self.pending_bytes += size
+
+        self.writes.append((path, self.executor.submit(self._write_pending, path, data, encoding, size)))
+
+    def add_error(self, path: str, error: Exception):
+        self.errors.append((path, error))
+
+    def close(self) -> List[Tuple[str, Exception]]:
+        """Waits for all pending files to be written and returns the list of errors."""
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+            for path, future in self.writes:
+                if future.exception():
+                    self.errors.append((path, future.exception()))
+
+            self.writes.clear()
+            self.executor = None
+
+        return self.errors
+
+    def report_errors(self) -> bool:
+        """Prints the errors of all files that failed to be written. Returns True if there were any errors."""
+        for path, error in self.errors:
+            print(f'Failed to write "{path}": {error}')
+
+        return bool(self.errors)
+
+    def _write_pending(self, path, data, encoding, size):
+        try:
+            self._write_file(path, data, encoding)
+        finally:
+            with self.condition:
+                self.pending_bytes -= size
+                self.condition.notify_all()
+
+    @staticmethod
+    def _write_file(path, data, encoding):
+        if isinstance(data, str):
+            with open(path, 'w', encoding=encoding) as f:
+                f.write(data)
+        else:
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def make_dir(self, path: str):
+        os.mkdir(path)
+
+
+class ArchiveWriter:
+    """Writes files into a single uncompressed zip or tar archive instead of the file system.\n
+    Has the same interface as FileWriter. Paths are stored relative to the given root path.
+    """
+
+    def __init__(self, path: str, root: str, format: str):
+        self.root = root
+        self.format = format
+
+        if format == 'zip':
+            self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+        else:
+            self.archive = tarfile.open(path, 'w')
+
+        self.errors: List[Tuple[str, Exception]] = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, path: str, data: Union[bytes, bytearray, str], encoding: str = None):
+        if isinstance(data, str):
+            data = data.encode(encoding)
+
+        name = os.path.relpath(path, self.root).replace(os.sep, '/')
+
+        try:
+            if self.format == 'zip':
+                self.archive.writestr(name, data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self.archive.addfile(info, io.BytesIO(data))
+        except Exception as e:
+            self.errors.append((path, e))
+
+    def make_dir(self, path: str):
+        # Folders are created implicitly by the paths of their files
+        pass
+
+    def add_error(self, path: str, error: Exception):
+        self.errors.append((path, error))
+
+    def close(self) -> List[Tuple[str, Exception]]:
+        if self.archive:
+            self.archive.close()
+            self.archive = None
+
+        return self.errors
+
+    def report_errors(self) -> bool:
+        return FileWriter.report_errors(self)
+
+
+def is_unpacked_archive(path: str) -> bool:
+    return os.path.isfile(path) and os.path.splitext(path)[1].lower() in ('.zip', '.tar')
+
+
+class FolderReader:
+    """Reads the files of an unpacked folder. Paths are relative to the folder, and separated by "/"."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_path(self, name: str) -> str:
+        return os.path.join(self.path, *name.split('/'))
+
+    def page_folders(self) -> List[str]:
+        # Get the page folders in the topmost directory only
+        # Sort them to keep the page order, as the order of os.walk depends on the file system
+        return sorted(next(os.walk(self.path))[1])
+
+    def isfile(self, name: str) -> bool:
+        return os.path.isfile(self.get_path(name))
+
+    def read(self, name: str) -> bytes:
+        with open(self.get_path(name), 'rb') as f:
+            return f.read()
+
+    def folder_stats(self, folder: str) -> list:
+        """Returns a sorted list of (name, size, modification time) of the files inside the folder.\n
+        Zip archives use the CRC of each file instead of its modification time.
+        """
+        path = self.get_path(folder)
+        if not os.path.isdir(path):
+            return []
+
+        return sorted((e.name, e.stat().st_size, e.stat().st_mtime_ns) for e in os.scandir(path) if e.is_file())
+
+    def close(self):
+        pass
+
+
+class ArchiveReader(FolderReader):
+    """Reads the files of an unpacked folder that was stored in a zip or tar archive, without extracting it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+        # Archive member name -> (size, CRC for zip members or modification time for tar members, member).
+        # Zip modification times only have a resolution of 2 seconds, but the CRC is stored in the central directory
+        self.members: Dict[str, tuple] = dict()
+
+        if zipfile.is_zipfile(path):
+            self.archive = zipfile.ZipFile(path, 'r')
+            for info in self.archive.infolist():
+                if not info.is_dir():
+                    self.members[info.filename] = (info.file_size, info.CRC, info)
+        else:
+            self.archive = tarfile.open(path, 'r')
+            for info in self.archive.getmembers():
+                if info.isfile():
+                    self.members[info.name] = (info.size, info.mtime, info)
+
+    def page_folders(self) -> List[str]:
+        return sorted(set(name.split('/', 1)[0] for name in self.members if '/' in name))
+
+    def isfile(self, name: str) -> bool:
+        return name in self.members
+
+    def read(self, name: str) -> bytes:
+        member = self.members[name][2]
+
+        # Tar files do not support reading members from multiple threads
+        with self.lock:
+            if isinstance(self.archive, zipfile.ZipFile):
+                return self.archive.read(member)
+
+            return self.archive.extractfile(member).read()
+
+    def folder_stats(self, folder: str) -> list:
+        prefix = folder + '/'
+        return sorted((name[len(prefix):], size, stamp) for name, (size, stamp, _) in self.members.items()
+                      if name.startswith(prefix) and '/' not in name[len(prefix):])
+
+    def close(self):
+        if self.archive:
+            self.archive.close()
+            self.archive = None
+
+
+def open_unpacked(path: str) -> FolderReader:
+    return ArchiveReader(path) if is_unpacked_archive(path) else FolderReader(path)
+
 
 def unpack(args):
     if not args.output:
-        args.output = os.path.basename(args.input).split('.')[0]
+        args.output = os.path.basename(args.input).split('.')[0] + (f'.{args.archive}' if args.archive else '')
 
     args.output = os.path.abspath(args.output)
     if os.path.exists(args.output):
@@ -21,90 +294,158 @@ def unpack(args):
             print('Aborting.')
             os.system('pause')
             return
-        print(f'Removing old directory: {args.output}\n')
-        shutil.rmtree(args.output)
 
-    os.mkdir(args.output)
+        if os.path.isdir(args.output):
+            print(f'Removing old directory: {args.output}\n')
+            shutil.rmtree(args.output)
+        else:
+            print(f'Removing old file: {args.output}\n')
+            os.remove(args.output)
 
     if args.file_data_only:
         args.no_json = True
 
-    # Read the file
-    xfbin = read_xfbin(args.input)
+    # Blobs can only be referenced from the page jsons
+    store = None
+    if args.store and not (args.file_data_only or args.sort_types or args.no_json):
+        store = BlobStore(args.store)
 
-    if args.sort_types:
-        # Get a dictionary of chunks based on chunk type
-        for k, v in xfbin.get_type_chunk_dict().items():
-            # Create a folder with the chunk's type as its name
-            page_path = os.path.join(args.output, k.__qualname__[len(NuccChunk.__qualname__):])
-            os.mkdir(page_path)
+    # Read the file, and hash the chunks while reading if they will be stored as blobs
+    xfbin = read_xfbin(args.input, store is not None)
 
-            for c in v:
-                chunk_path = os.path.join(page_path, c.name + '.' + (c.extension
-                                                                     if (args.file_data_only and c.extension != '')
-                                                                     else NuccChunk.get_nucc_str_short_from_type(type(c)).lower()))
+    # Pages that will be written to the page manifest
+    manifest_pages = list()
 
-                if args.verbose:
-                    print(f'Writing {chunk_path} ...')
-
-                with open(chunk_path, 'wb') as f:
-                    f.write(c.get_data(args.file_data_only))
+    if args.archive:
+        # The archive's contents are the same as the output folder's contents
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        writer = ArchiveWriter(args.output, args.output, args.archive)
     else:
-        for i, page in enumerate(xfbin.pages):
-            page.cleanup()
+        os.mkdir(args.output)
+        writer = FileWriter(args.jobs)
+
+    with writer:
+        if args.sort_types:
+            # Get a dictionary of chunks based on chunk type
+            for k, v in xfbin.get_type_chunk_dict().items():
+                # Create a folder with the chunk's type as its name
+                page_path = os.path.join(args.output, k.__qualname__[len(NuccChunk.__qualname__):])
+                writer.make_dir(page_path)
+
+                for c in v:
+                    chunk_path = os.path.join(page_path, c.name + '.' + (c.extension
+                                                                         if (args.file_data_only and c.extension != '')
+                                                                         else NuccChunk.get_nucc_str_short_from_type(type(c)).lower()))
 
-            if not page.chunks:
-                print(f'Page {i} does not contain chunks and will be skipped.')
-                continue
+                    if args.verbose:
+                        print(f'Writing {chunk_path} ...')
 
-            # Create the page's folder with the main chunk's name
-            clump_chunk = page.get_chunks_by_type(NuccChunkClump)
-            main_chunk = clump_chunk[0] if len(clump_chunk) else page.chunks[-1]
+                    # Chunks that fail to be converted are reported like files that fail to be written
+                    try:
+                        data = c.get_data(args.file_data_only)
+                    except Exception as e:
+                        writer.add_error(chunk_path, e)
+                        continue
 
-            page_path = os.path.join(
-                args.output, f'[{i:03}] {main_chunk.name} ({NuccChunk.get_nucc_str_from_type(type(main_chunk))})')
-            os.mkdir(page_path)
+                    writer.write(chunk_path, data)
+        else:
+            for i, page in enumerate(xfbin.pages):
+                page.cleanup()
+
+                if not page.chunks:
+                    print(f'Page {i} does not contain chunks and will be skipped.')
+                    continue
+
+                # Create the page's folder with the main chunk's name
+                clump_chunk = page.get_chunks_by_type(NuccChunkClump)
+                main_chunk = clump_chunk[0] if len(clump_chunk) else page.chunks[-1]
+
+                page_path = os.path.join(
+                    args.output, f'[{i:03}] {main_chunk.name} ({NuccChunk.get_nucc_str_from_type(type(main_chunk))})')
+
+                try:
+                    writer.make_dir(page_path)
+                except OSError as e:
+                    writer.add_error(page_path, e)
+                    continue
+
+                # Create the page json dict
+                page_json = dict()
+
+                # Add chunks maps
+                page_json['Chunk Maps'] = list(map(lambda x: x.to_dict(), page.initial_page_chunks))
+
+                # Add chunk references
+                chunk_refs = page_json['Chunk References'] = [None] * len(page.chunk_references)
+                for j, cr in enumerate(page.chunk_references):
+                    d = chunk_refs[j] = dict()
+                    d['Name'] = cr.name
+                    d['Chunk'] = cr.chunk.to_dict()
+
+                # Add chunks
+                chunks = page_json['Chunks'] = [None] * len(page.chunks)
+                for j, c in enumerate(page.chunks):
+                    d = chunks[j] = dict()
+                    d['File Name'] = c.name + '.' + (c.extension
+                                                     if (args.file_data_only and c.extension != '')
+                                                     else NuccChunk.get_nucc_str_short_from_type(type(c)).lower())
+                    d['Chunk'] = c.to_dict()
+
+                    chunk_path = os.path.join(page_path, d['File Name'])
+
+                    if store and isinstance(c, BLOB_CHUNK_TYPES):
+                        # Store the chunk's data in the blob store instead, and refer to it by its hash
+                        try:
+                            d['Hash'] = store.put(c.data, c.content_hash)
+                        except OSError as e:
+                            writer.add_error(chunk_path, e)
+                        continue
 
-            # Create the page json dict
-            page_json = dict()
+                    if args.verbose:
+                        print(f'Writing {chunk_path} ...')
 
-            # Add chunks maps
-            page_json['Chunk Maps'] = list(map(lambda x: x.to_dict(), page.initial_page_chunks))
+                    try:
+                        data = c.get_data(args.file_data_only)
+                    except Exception as e:
+                        writer.add_error(chunk_path, e)
+                        continue
 
-            # Add chunk references
-            chunk_refs = page_json['Chunk References'] = [None] * len(page.chunk_references)
-            for j, cr in enumerate(page.chunk_references):
-                d = chunk_refs[j] = dict()
-                d['Name'] = cr.name
-                d['Chunk'] = cr.chunk.to_dict()
+                    writer.write(chunk_path, data)
 
-            # Add chunks
-            chunks = page_json['Chunks'] = [None] * len(page.chunks)
-            for j, c in enumerate(page.chunks):
-                d = chunks[j] = dict()
-                d['File Name'] = c.name + '.' + (c.extension
-                                                 if (args.file_data_only and c.extension != '')
-                                                 else NuccChunk.get_nucc_str_short_from_type(type(c)).lower())
-                d['Chunk'] = c.to_dict()
+                if args.no_json:
+                    continue
 
-                chunk_path = os.path.join(page_path, d['File Name'])
+                if args.manifest:
+                    manifest_pages.append((os.path.basename(page_path), page_json))
+                else:
+                    writer.write(os.path.join(page_path, '_page.json'),
+                                 json.dumps(page_json, ensure_ascii=False, indent=4), 'cp932')
 
-                if args.verbose:
-                    print(f'Writing {chunk_path} ...')
+        if manifest_pages:
+            manifest_path = os.path.join(args.output, MANIFEST_FILE)
 
-                with open(chunk_path, 'wb') as f:
-                    f.write(c.get_data(args.file_data_only))
+            try:
+                writer.write(manifest_path, page_manifest_to_bytes(manifest_pages))
+            except Exception as e:
+                writer.add_error(manifest_path, e)
 
-            if not args.no_json:
-                with open(os.path.join(page_path, '_page.json'), 'w', encoding='cp932') as f:
-                    json.dump(page_json, f, ensure_ascii=False, indent=4)
+    if writer.report_errors():
+        print(f'\nUnpacked to "{args.output}" with {len(writer.errors)} error(s)')
+        return
+
+    if store:
+        print(f'Stored {store.added} new blob(s) and reused {store.reused} blob(s) in "{store.path}"')
 
     print(f'\nSuccessfully unpacked to "{args.output}"')
+    return True
 
 
 def repack(args):
     if not args.output:
-        args.output = os.path.basename(args.input) + '.xfbin'
+        if is_unpacked_archive(args.input):
+            args.output = os.path.splitext(os.path.basename(args.input))[0] + '.xfbin'
+        else:
+            args.output = os.path.basename(args.input) + '.xfbin'
 
     args.output = os.path.abspath(args.output)
     if os.path.exists(args.output):
@@ -118,60 +459,446 @@ def repack(args):
     # Create the directory in case some path components do not exist
     os.makedirs(os.path.dirname(args.output), exist_ok=True)
 
+    # Keep the cache in memory when watching, even if it will not be saved
+    cache = None
+    if args.cache or args.watch:
+        cache = RepackCache(get_repack_cache_path(args.input) if args.cache else None)
+
+    store = BlobStore(args.store) if args.store else None
+
+    repack_folder(args.input, args.output, cache, args.jobs, args.verbose, store)
+    print(f'\nSuccessfully repacked to "{args.output}"')
+
+    if args.watch:
+        watch(args, cache, store)
+
+    return True
+
+
+def get_repack_cache_path(input: str) -> str:
+    # Archives cannot be modified, so their cache is stored next to them
+    if is_unpacked_archive(input):
+        return input + REPACK_CACHE_FILE
+
+    return os.path.join(input, REPACK_CACHE_FILE)
+
+
+def repack_folder(input: str, output: str, cache: Optional[RepackCache] = None, jobs=1, verbose=False,
+                  store: Optional[BlobStore] = None):
+    """Repacks the page folders inside the input folder (or zip/tar archive) to the output path.\n
+    The output file is replaced only after the XFBIN has been completely written.\n
+    Chunks that refer to a blob by its hash are read from the blob store.
+    """
+    with open_unpacked(input) as reader:
+        if reader.isfile(MANIFEST_FILE):
+            # The manifest contains the pages in order, so there is no need to look for "_page.json" files
+            manifest_pages = page_manifest_from_bytes(reader.read(MANIFEST_FILE))
+
+            page_folders = [name for name, _ in manifest_pages]
+            page_jsons = [page_json for _, page_json in manifest_pages]
+        else:
+            page_folders = reader.page_folders()
+            page_jsons = [None] * len(page_folders)
+
+        def load(folder, page_json):
+            if cache:
+                return cache.load_page(folder, get_folder_stats(reader, folder, page_json),
+                                       lambda hasher: load_page_folder(reader, folder, verbose, hasher, page_json, store))
+
+            return load_page_folder(reader, folder, verbose, page_json=page_json, store=store), None
+
+        # Load the page folders in parallel, while keeping their order
+        if jobs > 1:
+            with ThreadPoolExecutor(jobs) as executor:
+                results = list(executor.map(load, page_folders, page_jsons))
+        else:
+            results = list(map(load, page_folders, page_jsons))
+
     xfbin = Xfbin()
+    serialized_pages: List[Optional[SerializedPage]] = list()
+    page_names: List[str] = list()
+
+    for folder, (page, serialized) in zip(page_folders, results):
+        if not (page or serialized):
+            continue
+
+        # Pages that were loaded from the cache do not need a Page object, as they will not be written again
+        xfbin.pages.append(page or Page())
+        serialized_pages.append(serialized)
+        page_names.append(folder)
+
+    reused = len([s for s in serialized_pages if s])
+
+    # Remove the partially written file if writing fails, so that it is not left next to the output
+    try:
+        write_xfbin_to_path(xfbin, output + '.tmp', serialized_pages if cache else None)
+    except BaseException:
+        if os.path.isfile(output + '.tmp'):
+            os.remove(output + '.tmp')
+        raise
+
+    os.replace(output + '.tmp', output)
+
+    if cache:
+        cache.update(page_names, serialized_pages)
+        cache.save()
+        print(f'Reused {reused} of {len(serialized_pages)} page(s) from the repack cache.')
+
 
-    for root, directories, files in os.walk(args.input):
-        for d in directories:
-            page_json_path = os.path.join(root, d, '_page.json')
-            if not os.path.isfile(page_json_path):
-                print(f'Directory "{d}"" does not have a "_page.json" and will be skipped.')
+def watch(args, cache: RepackCache, store: Optional[BlobStore] = None):
+    """Polls the page folders of the input folder, and repacks them whenever any of their files change."""
+
+    manifest_path = os.path.join(args.input, MANIFEST_FILE)
+
+    def get_snapshot():
+        # Any change to an archive's members changes the archive itself
+        if is_unpacked_archive(args.input):
+            stat = os.stat(args.input)
+            return (stat.st_size, stat.st_mtime_ns)
+
+        reader = FolderReader(args.input)
+        snapshot = {p: reader.folder_stats(p) for p in reader.page_folders()}
+
+        if os.path.isfile(manifest_path):
+            stat = os.stat(manifest_path)
+            snapshot[manifest_path] = (stat.st_size, stat.st_mtime_ns)
+
+        return snapshot
+
+    print(f'\nWatching "{args.input}" for changes (press Ctrl+C to stop)...')
+    snapshot = get_snapshot()
+
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+
+            current = get_snapshot()
+            if current == snapshot:
                 continue
 
-            with open(page_json_path, 'r', encoding='cp932') as f:
-                page_json = json.load(f)
+            # Files might still be in the middle of being saved, so wait until nothing changes for a bit
+            while True:
+                time.sleep(WATCH_SETTLE_TIME)
+                settled = get_snapshot()
+
+                if settled == current:
+                    break
+                current = settled
 
-            # Enclose everything in a try block to avoid having to check if each json element exists or not
+            snapshot = current
+
+            start = time.perf_counter()
             try:
-                page = Page()
-                xfbin.pages.append(page)
-
-                # Read chunk maps
-                chunk_maps = list(map(lambda c: NuccChunk.create_from_nucc_type(
-                    c['Type'], c['Path'], c['Name']), page_json['Chunk Maps']))
-
-                # Read chunk references
-                chunk_refs = page.chunk_references = [None] * len(page_json['Chunk References'])
-                for i, ref in enumerate(page_json['Chunk References']):
-                    c = ref['Chunk']
-                    chunk_refs[i] = ChunkReference(
-                        ref['Name'], NuccChunk.create_from_nucc_type(c['Type'], c['Path'], c['Name']))
-
-                # Read chunks
-                chunks = page.chunks = list()
-                for ch in page_json['Chunks']:
-                    c = ch['Chunk']
-                    chunk = NuccChunk.create_from_nucc_type(c['Type'], c['Path'], c['Name'])
-                    chunk_path = os.path.join(root, d, ch['File Name'])
-
-                    if not os.path.isfile(chunk_path):
-                        print(f'Chunk "{chunk_path}" does not exist and will be skipped.')
-                        continue
+                repack_folder(args.input, args.output, cache, args.jobs, args.verbose, store)
+            except Exception as e:
+                print(f'[{time.strftime("%H:%M:%S")}] Failed to repack: {e}')
+                continue
+
+            print(f'[{time.strftime("%H:%M:%S")}] Repacked to "{args.output}" in {time.perf_counter() - start:.2f}s')
+    except KeyboardInterrupt:
+        print('\nStopped watching.')
+
+
+def get_folder_stats(reader: FolderReader, name: str, page_json: dict = None) -> list:
+    """Returns the stats of the files of a page folder, which are used for checking if it changed since the last repack."""
+    stats = reader.folder_stats(name)
+
+    if page_json is not None:
+        # The page's entry in the manifest is part of the page, just like a "_page.json" file
+        stats.append(('', hashlib.blake2b(json.dumps(page_json).encode('utf-8'), digest_size=16).hexdigest()))
+
+    return stats
+
+
+def load_page_folder(reader: FolderReader, d: str, verbose=False, hasher=None, page_json: dict = None,
+                     store: Optional[BlobStore] = None) -> Optional[Page]:
+    """Reads the "_page.json" and the chunk files of a page folder, and returns a Page, or None if the folder is invalid.\n
+    If hasher is given, it will be updated with the contents of every file that was read.\n
+    If page_json is given (from a page manifest), it will be used instead of the folder's "_page.json".\n
+    Chunks with a "Hash" are read from the blob store instead of the folder.
+    """
+    page_json_path = f'{d}/_page.json'
+    if page_json is None and not reader.isfile(page_json_path):
+        print(f'Directory "{d}"" does not have a "_page.json" and will be skipped.')
+        return None
+
+    # Enclose everything in a try block to avoid having to check if each json element exists or not
+    try:
+        if page_json is None:
+            page_json_bytes = reader.read(page_json_path)
+            page_json = json.loads(page_json_bytes.decode('cp932'))
+        else:
+            page_json_bytes = json.dumps(page_json, ensure_ascii=False).encode('utf-8')
+
+        if hasher:
+            hasher.update(page_json_bytes)
+
+        page = Page()
+
+        # Read chunk maps
+        chunk_maps = list(map(lambda c: NuccChunk.create_from_nucc_type(
+            c['Type'], c['Path'], c['Name']), page_json['Chunk Maps']))
+
+        # Read chunk references
+        chunk_refs = page.chunk_references = [None] * len(page_json['Chunk References'])
+        for i, ref in enumerate(page_json['Chunk References']):
+            c = ref['Chunk']
+            chunk_refs[i] = ChunkReference(
+                ref['Name'], NuccChunk.create_from_nucc_type(c['Type'], c['Path'], c['Name']))
+
+        # Read chunks
+        chunks = page.chunks = list()
+        for ch in page_json['Chunks']:
+            c = ch['Chunk']
+            chunk = NuccChunk.create_from_nucc_type(c['Type'], c['Path'], c['Name'])
+            chunk_path = f'{d}/{ch["File Name"]}'
+
+            if ch.get('Hash'):
+                if not (store and store.has(ch['Hash'])):
+                    print(f'Chunk "{chunk_path}" does not exist in the blob store and will be skipped.')
+                    continue
+
+                chunks.append(chunk)
+
+                if verbose:
+                    print(f'Reading {chunk_path} from blob {ch["Hash"]} ...')
+
+                data = store.get(ch['Hash'])
+
+                # Blobs cannot change without changing their hash, which is already a part of the page json
+                if hasher:
+                    hasher.update(ch['File Name'].encode('utf-8'))
+            else:
+                if not reader.isfile(chunk_path):
+                    print(f'Chunk "{chunk_path}" does not exist and will be skipped.')
+                    continue
+
+                chunks.append(chunk)
+
+                if verbose:
+                    print(f'Reading {chunk_path} ...')
+
+                data = reader.read(chunk_path)
+
+                if hasher:
+                    hasher.update(ch['File Name'].encode('utf-8'))
+                    hasher.update(len(data).to_bytes(8, 'little'))
+                    hasher.update(data)
 
-                    chunks.append(chunk)
+            chunk.set_data(bytearray(data), chunk_maps)
+    except:
+        print(f'"_page.json" of directory "{d}" is invalid and will be skipped.')
+        return None
+
+    return page
+
+
+def get_fingerprint(path: str) -> List[int]:
+    """Returns a list of values that change when the file, or any file inside the folder, is modified."""
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [1, stat.st_size, stat.st_mtime_ns]
+
+    count = size = mtime = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            # The repack cache does not affect the result of repacking
+            if name == REPACK_CACHE_FILE:
+                continue
+
+            stat = os.stat(os.path.join(root, name))
+            count += 1
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime_ns)
+
+    return [count, size, mtime]
+
+
+def find_batch_inputs(args) -> Tuple[str, List[str]]:
+    """Returns the root path of the batch inputs and the list of input paths to unpack or repack."""
+    if os.path.isdir(args.input):
+        root = os.path.abspath(args.input)
+
+        if args.batch == 'unpack':
+            inputs = [os.path.join(r, f) for r, _, files in os.walk(root) for f in files
+                      if f.lower().endswith('.xfbin')]
+        else:
+            # Folders that contain a page manifest or at least one page folder with a "_page.json"
+            inputs = [r for r, dirs, files in os.walk(root) if r != root and (MANIFEST_FILE in files or
+                      any(os.path.isfile(os.path.join(r, d, '_page.json')) for d in dirs))]
+
+            # Unpacked archives
+            inputs.extend(os.path.join(r, f) for r, _, files in os.walk(root) for f in files
+                          if is_unpacked_archive(os.path.join(r, f)))
+    else:
+        inputs = [os.path.abspath(p) for p in glob(args.input, recursive=True)]
+        inputs = [p for p in inputs if (os.path.isfile(p) if args.batch == 'unpack'
+                                        else os.path.isdir(p) or is_unpacked_archive(p))]
+
+        if len(inputs) > 1:
+            root = os.path.commonpath(inputs)
+        else:
+            root = os.path.dirname(inputs[0]) if inputs else os.getcwd()
+
+    return root, sorted(inputs)
+
+
+def batch_worker(mode: str, input: str, output: str, options: dict) -> Tuple[bool, str]:
+    """Unpacks or repacks a single input in a worker process. Returns the result and the captured output."""
+    log = io.StringIO()
+
+    try:
+        with redirect_stdout(log):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+
+            args = Namespace(input=input, output=output, force_overwrite=True, **options)
+            result = unpack(args) if mode == 'unpack' else repack(args)
+    except Exception as e:
+        log.write(f'{type(e).__name__}: {e}\n')
+        result = False
+
+    return bool(result), log.getvalue()
+
+
+def diff(args) -> bool:
+    """Compares the INPUT and OUTPUT XFBIN files and prints the differences. Returns True if the files are equal."""
+    if not (args.output and os.path.isfile(args.input) and os.path.isfile(args.output)):
+        print('Both INPUT and OUTPUT have to be XFBIN files to compare.\nAborting.')
+        return False
+
+    result = diff_xfbin(args.input, args.output, not args.no_decode)
+    print(result)
+
+    return not result
+
+
+def index(args):
+    """Updates the index database with every XFBIN inside INPUT, or prints the chunks that match the find pattern."""
+    with XfbinIndex(args.index) as xfbin_index:
+        if args.find:
+            for archive, page, chunk_type, path, name, size, _ in xfbin_index.find(args.find):
+                print(f'{archive} [{page:03}] {chunk_type} "{name}" ({path}) {size} bytes')
+            return
+
+        if not os.path.isdir(args.input):
+            print('INPUT has to be a folder to index.\nAborting.')
+            return
+
+        def progress(path, count, error):
+            if error:
+                print(f'Could not index "{path}": {error}')
+            elif args.verbose:
+                print(f'Indexed {count} chunk(s) from "{path}"')
+
+        start = time.perf_counter()
+        indexed, skipped, removed = xfbin_index.scan(args.input, jobs=args.processes or os.cpu_count() or 1,
+                                                     progress=progress)
+
+        print(f'Indexed {indexed} file(s), skipped {skipped} unchanged file(s), removed {removed} file(s) '
+              f'in {time.perf_counter() - start:.2f}s.')
+
+
+def batch(args):
+    root, inputs = find_batch_inputs(args)
+
+    if not inputs:
+        print(f'No inputs to {args.batch} were found.')
+        return
+
+    if not args.output:
+        args.output = root + ('_unpacked' if args.batch == 'unpack' else '_repacked')
+
+    args.output = os.path.abspath(args.output)
+    os.makedirs(args.output, exist_ok=True)
+
+    options = dict(verbose=False, jobs=args.jobs, store=os.path.abspath(args.store) if args.store else None)
+    if args.batch == 'unpack':
+        options.update(file_data_only=args.file_data_only, sort_types=args.sort_types, no_json=args.no_json,
+                       manifest=args.manifest, archive=args.archive)
+    else:
+        options.update(cache=args.cache, watch=False)
+
+    # Options that change the outputs. Inputs that were finished with other options have to be processed again
+    state_options = {'mode': args.batch, **{k: v for k, v in options.items() if k not in ('verbose', 'jobs', 'cache', 'watch')}}
+
+    # Load the fingerprints of the inputs that were finished by a previous run with the same options
+    state_path = os.path.join(args.output, BATCH_STATE_FILE)
+    state: Dict[str, List[int]] = dict()
+    if os.path.isfile(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+
+        if saved.get('Options') == state_options:
+            state = saved.get('Inputs', dict())
+        else:
+            print('The options are different from the previous run, so every input will be processed again.')
+
+    def save_state():
+        with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'Options': state_options, 'Inputs': state}, f)
+        os.replace(state_path + '.tmp', state_path)
+
+    jobs = list()
+    skipped = 0
+    for input in inputs:
+        rel_path = os.path.relpath(input, root)
+
+        if args.batch == 'unpack':
+            output = os.path.join(args.output, os.path.splitext(rel_path)[0] + (f'.{args.archive}' if args.archive else ''))
+        elif is_unpacked_archive(input):
+            output = os.path.join(args.output, os.path.splitext(rel_path)[0] + '.xfbin')
+        else:
+            output = os.path.join(args.output, rel_path + '.xfbin')
+
+        fingerprint = get_fingerprint(input)
+        if (not args.force_overwrite) and state.get(rel_path) == fingerprint and os.path.exists(output):
+            skipped += 1
+            continue
+
+        jobs.append((input, rel_path, output, fingerprint))
+
+    print(f'Found {len(inputs)} input(s) to {args.batch}, {skipped} already up to date.\n')
+
+    done = failed = 0
+    total_bytes = 0
+    start = last_save = time.perf_counter()
+
+    try:
+        with ProcessPoolExecutor(args.processes) as executor:
+            futures = {executor.submit(batch_worker, args.batch, input, output, options): (input, rel_path, fingerprint)
+                       for input, rel_path, output, fingerprint in jobs}
+
+            for future in as_completed(futures):
+                input, rel_path, fingerprint = futures[future]
+                result, log = future.result()
+
+                if result:
+                    done += 1
+                    total_bytes += fingerprint[1]
+                    state[rel_path] = fingerprint
 
                     if args.verbose:
-                        print(f'Reading {chunk_path} ...')
+                        print(f'[{done + failed}/{len(jobs)}] {rel_path}')
+                else:
+                    failed += 1
+                    state.pop(rel_path, None)
+                    print(f'[{done + failed}/{len(jobs)}] Failed to {args.batch} "{rel_path}":\n{log}')
 
-                    with open(chunk_path, 'rb') as f:
-                        chunk.set_data(bytearray(f.read()), chunk_maps)
-            except:
-                print(f'"_page.json" of directory "{d}" is invalid and will be skipped.')
+                if time.perf_counter() - last_save >= BATCH_STATE_INTERVAL:
+                    save_state()
+                    last_save = time.perf_counter()
+    finally:
+        # Save the state even when interrupted, so the next run can skip the finished inputs
+        save_state()
 
-        # We only want to look in the topmost directory
-        break
+    elapsed = time.perf_counter() - start
+    size_mb = total_bytes / (1024 * 1024)
 
-    write_xfbin_to_path(xfbin, args.output)
-    print(f'\nSuccessfully repacked to "{args.output}"')
+    print(f'\n{args.batch.capitalize()}ed {done} input(s) ({size_mb:.2f} MB) in {elapsed:.2f}s, '
+          f'{failed} failed, {skipped} skipped')
+
+    if elapsed and done:
+        print(f'Throughput: {done / elapsed:.2f} files/s, {size_mb / elapsed:.2f} MB/s')
 
 
 def main():
@@ -193,17 +920,67 @@ def main():
                         help='sort nuccChunks by type instead of page (will disable repacking)')
     parser.add_argument('-j', '--no-json', dest='no_json', action='store_true',
                         help='do not write "_page.json" for extracted pages (will disable repacking)')
+    parser.add_argument('-m', '--manifest', action='store_true',
+                        help=f'write a single "{MANIFEST_FILE}" for all extracted pages instead of a "_page.json" for each page')
+    parser.add_argument('-a', '--archive', choices=('zip', 'tar'),
+                        help='unpack to a single uncompressed zip/tar archive instead of a folder. '
+                        'The archive can be repacked directly by passing it as INPUT')
+    parser.add_argument('-S', '--store', metavar='DIR',
+                        help='when unpacking, write each unique NUT/NUD chunk once into a shared blob store in DIR, and refer '
+                        'to it by its hash instead of writing it to the page folder. When repacking, read the referred '
+                        'chunks from DIR')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='print info about each extracted chunk')
+    parser.add_argument('-J', '--jobs', type=int, default=1, metavar='N',
+                        help='number of threads to use for writing extracted files or reading page folders (default: 1)')
+    parser.add_argument('-D', '--diff', action='store_true',
+                        help='compare the INPUT and OUTPUT XFBIN files chunk by chunk, and print the differences instead of '
+                        'unpacking. Exits with 1 if the files are different')
+    parser.add_argument('--no-decode', action='store_true',
+                        help='in diff mode, only compare the hashes of the chunks, without decoding the changed chunks')
+    parser.add_argument('-I', '--index', metavar='DATABASE',
+                        help='index the chunks of every XFBIN inside INPUT (a folder) into a SQLite DATABASE. '
+                        'Files that did not change since the last index are skipped')
+    parser.add_argument('--find', metavar='PATTERN',
+                        help='with -I, print the chunks with names that match PATTERN (SQL LIKE, %% is a wildcard) '
+                        'instead of indexing')
+    parser.add_argument('-b', '--batch', choices=('unpack', 'repack'),
+                        help='unpack/repack every XFBIN file/unpacked folder inside INPUT (a folder or a glob pattern) '
+                        'to OUTPUT. Inputs that were already processed and did not change will be skipped, unless -f is used')
+    parser.add_argument('-c', '--cache', action='store_true',
+                        help=f'when repacking, store the written pages in "{REPACK_CACHE_FILE}" inside the folder, and reuse '
+                        'the pages that did not change since the last repack instead of writing them again')
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help='after repacking, keep watching the folder and repack the pages that change')
+    parser.add_argument('--watch-interval', type=float, default=0.5, metavar='SECONDS',
+                        help='seconds between checking the folder for changes in watch mode (default: 0.5)')
+    parser.add_argument('-P', '--processes', type=int, default=None, metavar='N',
+                        help='number of processes to use in batch and index modes (default: number of CPUs)')
 
     args = parser.parse_args()
 
+    if args.index and args.find:
+        index(args)
+        return
+
     if not args.input:
         print('No INPUT was given.\nAborting.')
         os.system('pause')
         return
 
-    if os.path.isfile(args.input):
+    if args.diff:
+        # Exit code can be used by scripts to check if the files are equal
+        sys.exit(0 if diff(args) else 1)
+    elif args.index:
+        print('Index mode - Attempting to index...')
+        index(args)
+    elif args.batch:
+        print(f'Batch mode - Attempting to {args.batch}...')
+        batch(args)
+    elif is_unpacked_archive(args.input):
+        print('INPUT is an archive - Attempting to repack...')
+        repack(args)
+    elif os.path.isfile(args.input):
         print('INPUT is a file - Attempting to unpack...')
         unpack(args)
     elif os.path.isdir(args.input):
@@ -1,4 +1,12 @@
 from .structure.nucc import *
 from .structure.xfbin import Page, Xfbin
 from .xfbin_reader import read_xfbin
-from .xfbin_writer import write_xfbin, write_xfbin_to_path
+from .xfbin_writer import write_xfbin, write_xfbin_to_path, write_xfbin_to_stream
+from .page_manifest import (page_manifest_from_bytes, page_manifest_to_bytes,
+                            read_page_manifest, write_page_manifest)
+from .repack_cache import RepackCache, repack_cache_from_bytes, repack_cache_to_bytes
+from .blob_store import BLOB_CHUNK_TYPES, BlobStore
+from .xfbin_async import read_xfbin_async, write_xfbin_to_path_async, write_xfbin_to_stream_async
+from .cpk import Cpk, CpkEntry, decompress_crilayla, read_cpk
+from .xfbin_diff import ChunkDiff, XfbinDiff, diff_xfbin
+from .xfbin_index import XfbinIndex
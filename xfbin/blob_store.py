@@ -0,0 +1,57 @@
+import os
+import threading
+from typing import Optional, Union
+
+from .structure.br.br_xfbin import get_chunk_hash
+from .structure.nucc import NuccChunkModel, NuccChunkTexture
+
+# Chunk types that are stored in the blob store, as they are often duplicated between XFBINs
+BLOB_CHUNK_TYPES = (NuccChunkTexture, NuccChunkModel)
+
+
+class BlobStore:
+    """A content addressed store of chunk data, which can be shared between any number of unpacked folders.\n
+    Each unique blob is stored once, in a file named by its hash. Safe to use from multiple threads and processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        os.makedirs(self.path, exist_ok=True)
+
+        # Number of blobs that were written and reused by this instance
+        self.added = 0
+        self.reused = 0
+
+    def get_path(self, digest: str) -> str:
+        # Use the first 2 characters as a sub folder to avoid having too many files in a single folder
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def has(self, digest: str) -> bool:
+        return os.path.isfile(self.get_path(digest))
+
+    def get(self, digest: str) -> bytes:
+        with open(self.get_path(digest), 'rb') as f:
+            return f.read()
+
+    def put(self, data: Union[bytes, bytearray], content_hash: Optional[bytes] = None) -> str:
+        """Stores the data if it does not exist, and returns its hash as a hex string.\n
+        content_hash can be given if the hash of the data is already known (e.g. from read_xfbin).
+        """
+        digest = (content_hash or get_chunk_hash(data)).hex()
+        path = self.get_path(digest)
+
+        if os.path.isfile(path):
+            self.reused += 1
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a unique temporary file first, so that other processes never see a partially written blob
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+        os.replace(tmp_path, path)
+        self.added += 1
+
+        return digest
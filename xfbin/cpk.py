@@ -0,0 +1,380 @@
+import io
+import struct
+import threading
+from typing import BinaryIO, Dict, List, Optional, Union
+
+from .util import *
+
+# CPK archives contain a header @UTF table, and a TOC @UTF table with an entry for each file.
+# Files inside the archive can be compressed with CRILAYLA, which is a backwards LZ77 variant.
+
+CRILAYLA_MAGIC = b'CRILAYLA'
+
+# Size of the uncompressed header that is stored at the end of CRILAYLA data
+CRILAYLA_HEADER_SIZE = 0x100
+
+# Bit counts of each of the levels of a CRILAYLA backreference length
+CRILAYLA_LENGTH_LEVELS = (2, 3, 5, 8)
+
+
+def is_crilayla(data: Union[bytes, bytearray]) -> bool:
+    return data[:8] == CRILAYLA_MAGIC
+
+
+def decompress_crilayla(data: Union[bytes, bytearray]) -> bytearray:
+    """Decompresses CRILAYLA compressed data and returns the decompressed bytearray."""
+    if not is_crilayla(data):
+        raise Exception('Invalid CRILAYLA magic.')
+
+    uncompressed_size, header_offset = struct.unpack_from('<II', data, 8)
+
+    # The first 0x100 bytes are stored uncompressed after the compressed data
+    result = bytearray(CRILAYLA_HEADER_SIZE + uncompressed_size)
+    result[:CRILAYLA_HEADER_SIZE] = data[0x10 + header_offset: 0x10 + header_offset + CRILAYLA_HEADER_SIZE]
+
+    # Both the compressed and the decompressed data are processed from the end to the start
+    input_pos = len(data) - CRILAYLA_HEADER_SIZE - 1
+    output_pos = len(result) - 1
+
+    # Bits are read from the most significant bit of each byte
+    pool = 0
+    pool_bits = 0
+
+    # Variables are kept local and the bit reading is inlined, as this loop runs for every output byte
+    while output_pos >= CRILAYLA_HEADER_SIZE:
+        while pool_bits < 9:
+            pool = (pool << 8) | data[input_pos]
+            input_pos -= 1
+            pool_bits += 8
+
+        pool_bits -= 1
+        if not (pool >> pool_bits) & 1:
+            # Literal byte
+            pool_bits -= 8
+            result[output_pos] = (pool >> pool_bits) & 0xFF
+            output_pos -= 1
+            pool &= (1 << pool_bits) - 1
+            continue
+
+        # Backreference with a 13 bit offset
+        while pool_bits < 13:
+            pool = (pool << 8) | data[input_pos]
+            input_pos -= 1
+            pool_bits += 8
+
+        pool_bits -= 13
+        source = output_pos + ((pool >> pool_bits) & 0x1FFF) + 3
+        length = 3
+
+        for level in CRILAYLA_LENGTH_LEVELS:
+            while pool_bits < level:
+                pool = (pool << 8) | data[input_pos]
+                input_pos -= 1
+                pool_bits += 8
+
+            pool_bits -= level
+            value = (pool >> pool_bits) & ((1 << level) - 1)
+            length += value
+
+            if value != (1 << level) - 1:
+                break
+        else:
+            # Lengths that do not fit in the levels continue with 8 bits until a value that is not 0xFF
+            value = 0xFF
+            while value == 0xFF:
+                while pool_bits < 8:
+                    pool = (pool << 8) | data[input_pos]
+                    input_pos -= 1
+                    pool_bits += 8
+
+                pool_bits -= 8
+                value = (pool >> pool_bits) & 0xFF
+                length += value
+
+        pool &= (1 << pool_bits) - 1
+
+        if length > output_pos - CRILAYLA_HEADER_SIZE + 1:
+            raise Exception('Invalid CRILAYLA data.')
+
+        if length <= source - output_pos:
+            # The source and the destination do not overlap, so the whole backreference can be copied at once
+            result[output_pos - length + 1: output_pos + 1] = result[source - length + 1: source + 1]
+            output_pos -= length
+        else:
+            for _ in range(length):
+                result[output_pos] = result[source]
+                output_pos -= 1
+                source -= 1
+
+    return result
+
+
+# @UTF column storage flags
+UTF_STORAGE_MASK = 0xF0
+UTF_STORAGE_ZERO = 0x10
+UTF_STORAGE_CONSTANT = 0x30
+UTF_STORAGE_PER_ROW = 0x50
+
+# @UTF column types
+UTF_TYPE_MASK = 0x0F
+
+
+class BrUtfTable(BrStruct):
+    """An @UTF table, which is used by CPK archives for storing their header and TOC.\n
+    Each row is stored as a dictionary of column names to values.
+    """
+
+    name: str
+    rows: List[Dict[str, object]]
+
+    def __br_read__(self, br: BinaryReader):
+        if br.read_str(4) != '@UTF':
+            raise Exception('Invalid @UTF table magic.')
+
+        br.read_uint32()  # Table size
+
+        # Offsets are relative to the position after the table size
+        rows_offset = br.read_uint32() + 8
+        strings_offset = br.read_uint32() + 8
+        data_offset = br.read_uint32() + 8
+
+        name_offset = br.read_uint32()
+        column_count = br.read_uint16()
+        row_length = br.read_uint16()
+        row_count = br.read_uint32()
+
+        def read_string(offset: int) -> str:
+            with br.seek_to(strings_offset + offset):
+                return br.read_str()
+
+        def read_value(column_type: int):
+            if column_type == 0xA:
+                return read_string(br.read_uint32())
+
+            if column_type == 0xB:
+                offset = br.read_uint32()
+                size = br.read_uint32()
+
+                with br.seek_to(data_offset + offset):
+                    return br.read_bytes(size)
+
+            if column_type == 0x9:
+                return struct.unpack('>d', br.read_bytes(8))[0]
+
+            return UTF_READERS[column_type](br)
+
+        self.name = read_string(name_offset)
+
+        # List of (flags, name, constant value) tuples
+        columns = list()
+        for _ in range(column_count):
+            flags = br.read_uint8()
+            column_name = read_string(br.read_uint32())
+
+            constant = None
+            if (flags & UTF_STORAGE_MASK) == UTF_STORAGE_CONSTANT:
+                constant = read_value(flags & UTF_TYPE_MASK)
+
+            columns.append((flags, column_name, constant))
+
+        self.rows = list()
+        for i in range(row_count):
+            br.seek(rows_offset + i * row_length)
+
+            row = dict()
+            for flags, column_name, constant in columns:
+                storage = flags & UTF_STORAGE_MASK
+
+                if storage == UTF_STORAGE_PER_ROW:
+                    row[column_name] = read_value(flags & UTF_TYPE_MASK)
+                elif storage == UTF_STORAGE_CONSTANT:
+                    row[column_name] = constant
+                else:
+                    row[column_name] = None
+
+            self.rows.append(row)
+
+
+UTF_READERS = {
+    0x0: BinaryReader.read_uint8,
+    0x1: BinaryReader.read_int8,
+    0x2: BinaryReader.read_uint16,
+    0x3: BinaryReader.read_int16,
+    0x4: BinaryReader.read_uint32,
+    0x5: BinaryReader.read_int32,
+    0x6: BinaryReader.read_uint64,
+    0x7: BinaryReader.read_int64,
+    0x8: BinaryReader.read_float,
+}
+
+
+def decrypt_utf(data: bytes) -> bytes:
+    """Decrypts an encrypted @UTF table. Tables that are not encrypted are returned as is."""
+    if data[:4] == b'@UTF':
+        return data
+
+    result = bytearray(data)
+
+    key = 0x655F
+    for i in range(len(result)):
+        result[i] ^= key & 0xFF
+        key = (key * 0x4115) & 0xFFFFFFFF
+
+    return bytes(result)
+
+
+class CpkEntry:
+    """A file inside a CPK archive."""
+
+    def __init__(self, dir_name: str, file_name: str, file_size: int, extract_size: int, offset: int, id: int):
+        self.dir_name = dir_name
+        self.file_name = file_name
+
+        # Size inside the archive (compressed size if the file is compressed)
+        self.file_size = file_size
+
+        # Size after decompression
+        self.extract_size = extract_size
+
+        # Absolute offset inside the CPK
+        self.offset = offset
+        self.id = id
+
+    @property
+    def path(self) -> str:
+        return f'{self.dir_name}/{self.file_name}' if self.dir_name else self.file_name
+
+    @property
+    def is_compressed(self) -> bool:
+        return self.extract_size != self.file_size
+
+    def __repr__(self):
+        return f'<CpkEntry {self.path} ({self.file_size} bytes)>'
+
+
+class CpkEntryStream(io.RawIOBase):
+    """A read only stream over an uncompressed entry inside a CPK, without reading the entry first."""
+
+    def __init__(self, cpk: 'Cpk', entry: CpkEntry):
+        self.cpk = cpk
+        self.entry = entry
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        size = min(len(b), self.entry.file_size - self.position)
+        if size <= 0:
+            return 0
+
+        data = self.cpk.read_at(self.entry.offset + self.position, size)
+        b[:len(data)] = data
+        self.position += len(data)
+
+        return len(data)
+
+
+class Cpk:
+    """Reads the TOC of a CPK archive, and allows reading its files without extracting them first.\n
+    Can be used as a context manager, which closes the CPK file on exit.
+    """
+
+    def __init__(self, file: Union[str, BinaryIO]):
+        if isinstance(file, str):
+            self.file = open(file, 'rb')
+            self.owns_file = True
+        else:
+            self.file = file
+            self.owns_file = False
+
+        # Entries share the file, so reading them has to be synchronized
+        self.lock = threading.Lock()
+
+        try:
+            self.header = self.read_utf_packet(0, 'CPK ').rows[0]
+            self.entries = self.read_toc()
+        except Exception:
+            self.close()
+            raise
+
+        self.entries_dict: Dict[str, CpkEntry] = {e.path: e for e in self.entries}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(size)
+
+    def read_utf_packet(self, offset: int, magic: str) -> BrUtfTable:
+        # Packets have a 4 byte magic, 4 unknown bytes, and the little endian size of the @UTF table
+        packet_header = self.read_at(offset, 0x10)
+        if packet_header[:4] != magic.encode('ascii'):
+            raise Exception(f'Invalid CPK packet magic: expected "{magic}".')
+
+        size = struct.unpack_from('<Q', packet_header, 8)[0]
+
+        with BinaryReader(decrypt_utf(self.read_at(offset + 0x10, size)), Endian.BIG, 'cp932') as br:
+            return br.read_struct(BrUtfTable)
+
+    def read_toc(self) -> List[CpkEntry]:
+        toc_offset = self.header.get('TocOffset')
+        if not toc_offset:
+            raise Exception('CPK does not have a TOC. ID only CPKs are not supported.')
+
+        content_offset = self.header.get('ContentOffset')
+
+        # File offsets are relative to either the TOC or the content, whichever comes first
+        base_offset = min(toc_offset, content_offset) if content_offset else toc_offset
+
+        entries = list()
+        for row in self.read_utf_packet(toc_offset, 'TOC ').rows:
+            entries.append(CpkEntry(row.get('DirName') or '', row['FileName'], row['FileSize'],
+                                    row.get('ExtractSize') or row['FileSize'],
+                                    base_offset + row['FileOffset'], row.get('ID') or 0))
+
+        return entries
+
+    def get_entry(self, path: str) -> Optional[CpkEntry]:
+        return self.entries_dict.get(path)
+
+    def read(self, entry: Union[str, CpkEntry]) -> Union[bytes, bytearray]:
+        """Reads and returns the data of an entry, which will be decompressed if needed."""
+        entry = self.entries_dict[entry] if isinstance(entry, str) else entry
+        data = self.read_at(entry.offset, entry.file_size)
+
+        return decompress_crilayla(data) if is_crilayla(data) else data
+
+    def open(self, entry: Union[str, CpkEntry]) -> BinaryIO:
+        """Returns a binary file-like object for reading an entry.\n
+        Uncompressed entries are read from the CPK as they are needed. Compressed entries are decompressed first,
+        as CRILAYLA data has to be decompressed from the end.
+        """
+        entry = self.entries_dict[entry] if isinstance(entry, str) else entry
+
+        if entry.is_compressed or is_crilayla(self.read_at(entry.offset, len(CRILAYLA_MAGIC))):
+            return io.BytesIO(self.read(entry))
+
+        return io.BufferedReader(CpkEntryStream(self, entry))
+
+    def close(self):
+        if self.owns_file and self.file:
+            self.file.close()
+
+        self.file = None
+
+
+def read_cpk(file: Union[str, BinaryIO]) -> Cpk:
+    """Reads the TOC of a CPK archive and returns a Cpk object.
+    :param file: Path to file as a string, or seekable binary file-like object
+    :return: The Cpk object
+    """
+    return Cpk(file)
@@ -0,0 +1,143 @@
+from typing import Dict, List, Tuple, Union
+
+from .util import *
+
+# A page manifest stores the same data as the "_page.json" files of all the pages of an unpacked XFBIN, in a single file.
+# Strings and chunk maps are only stored once, and everything else refers to them by index.
+
+MANIFEST_MAGIC = 'XFPM'
+MANIFEST_VERSION = 2
+
+# Used instead of a string index for chunks that do not have a blob hash
+NO_HASH = 0xFFFFFFFF
+
+
+class BrPageManifest(BrStruct):
+    # List of (page folder name, page json dict) tuples
+    # Page dicts have the same structure as the "_page.json" files, and the chunk dicts are shared between pages
+    pages: List[Tuple[str, dict]]
+
+    def __br_read__(self, br: BinaryReader):
+        if br.read_str(4) != MANIFEST_MAGIC:
+            raise Exception('Invalid page manifest magic.')
+
+        version = br.read_uint16()
+        if version not in (1, MANIFEST_VERSION):
+            raise Exception(f'Unsupported page manifest version: {version}')
+
+        br.read_uint16()
+
+        # All strings are stored in a single null separated block
+        string_count = br.read_uint32()
+        string_size = br.read_uint32()
+        strings = br.read_bytes(string_size).decode('cp932').split('\x00')[:string_count]
+
+        br.align_pos(4)
+
+        # Chunk maps are (type, path, name) string indices
+        chunk_map_count = br.read_uint32()
+        indices = br.read_uint32(chunk_map_count * 3)
+        chunk_maps = [{'Name': strings[indices[i + 2]], 'Type': strings[indices[i]], 'Path': strings[indices[i + 1]]}
+                      for i in range(0, len(indices), 3)]
+
+        page_count = br.read_uint32()
+
+        self.pages = list()
+        for _ in range(page_count):
+            name_index, map_count, reference_count, chunk_count = br.read_uint32(4)
+
+            page_json = dict()
+            page_json['Chunk Maps'] = [chunk_maps[i] for i in br.read_uint32(map_count)]
+
+            indices = br.read_uint32(reference_count * 2)
+            page_json['Chunk References'] = [{'Name': strings[indices[i]], 'Chunk': chunk_maps[indices[i + 1]]}
+                                             for i in range(0, len(indices), 2)]
+
+            # Version 2 adds the blob hash of each chunk
+            stride = 3 if version >= 2 else 2
+
+            indices = br.read_uint32(chunk_count * stride)
+            page_json['Chunks'] = [{'File Name': strings[indices[i]], 'Chunk': chunk_maps[indices[i + 1]]}
+                                   for i in range(0, len(indices), stride)]
+
+            if version >= 2:
+                for i, chunk in enumerate(page_json['Chunks']):
+                    if indices[i * 3 + 2] != NO_HASH:
+                        chunk['Hash'] = strings[indices[i * 3 + 2]]
+
+            self.pages.append((strings[name_index], page_json))
+
+    def __br_write__(self, br: BinaryReader):
+        strings = IterativeDict()
+        chunk_maps = IterativeDict()
+
+        def chunk_map_index(c: Dict[str, str]) -> int:
+            return chunk_maps.get_or_next((strings.get_or_next(c['Type']),
+                                           strings.get_or_next(c['Path']),
+                                           strings.get_or_next(c['Name'])))
+
+        # Write the pages first to fill the string and chunk map tables
+        with BinaryReader(endianness=Endian.BIG) as br_pages:
+            for name, page_json in self.pages:
+                br_pages.write_uint32(strings.get_or_next(name))
+                br_pages.write_uint32(len(page_json['Chunk Maps']))
+                br_pages.write_uint32(len(page_json['Chunk References']))
+                br_pages.write_uint32(len(page_json['Chunks']))
+
+                br_pages.write_uint32(list(map(chunk_map_index, page_json['Chunk Maps'])))
+
+                for ref in page_json['Chunk References']:
+                    br_pages.write_uint32((strings.get_or_next(ref['Name']), chunk_map_index(ref['Chunk'])))
+
+                for chunk in page_json['Chunks']:
+                    br_pages.write_uint32((strings.get_or_next(chunk['File Name']), chunk_map_index(chunk['Chunk']),
+                                           strings.get_or_next(chunk['Hash']) if chunk.get('Hash') else NO_HASH))
+
+            pages_buffer = br_pages.buffer()
+
+        string_buffer = '\x00'.join(strings.keys()).encode('cp932') + b'\x00'
+
+        br.write_str(MANIFEST_MAGIC)
+        br.write_uint16(MANIFEST_VERSION)
+        br.write_uint16(0)
+
+        br.write_uint32(len(strings))
+        br.write_uint32(len(string_buffer))
+        br.write_bytes(string_buffer)
+        br.align(4)
+        br.seek(0, Whence.END)
+
+        br.write_uint32(len(chunk_maps))
+        br.write_uint32([i for chunk_map in chunk_maps for i in chunk_map])
+
+        br.write_uint32(len(self.pages))
+        br.extend(pages_buffer)
+        br.seek(len(pages_buffer), Whence.CUR)
+
+
+def page_manifest_from_bytes(data: Union[bytes, bytearray]) -> List[Tuple[str, dict]]:
+    """Reads a page manifest from a buffer and returns a list of (page folder name, page json dict) tuples."""
+    with BinaryReader(data, Endian.BIG) as br:
+        return br.read_struct(BrPageManifest).pages
+
+
+def page_manifest_to_bytes(pages: List[Tuple[str, dict]]) -> bytearray:
+    """Writes a list of (page folder name, page json dict) tuples to a page manifest buffer."""
+    manifest = BrPageManifest()
+    manifest.pages = pages
+
+    with BinaryReader(endianness=Endian.BIG) as br:
+        br.write_struct(manifest)
+        return br.buffer()
+
+
+def read_page_manifest(path: str) -> List[Tuple[str, dict]]:
+    """Reads a page manifest file and returns a list of (page folder name, page json dict) tuples."""
+    with open(path, 'rb') as f:
+        return page_manifest_from_bytes(f.read())
+
+
+def write_page_manifest(path: str, pages: List[Tuple[str, dict]]) -> None:
+    """Writes a list of (page folder name, page json dict) tuples to a page manifest file."""
+    with open(path, 'wb') as f:
+        f.write(page_manifest_to_bytes(pages))
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .structure.br.br_xfbin import SerializedPage
+from .structure.xfbin import Page
+from .util import *
+
+# A repack cache stores the written data of each page folder of an unpacked XFBIN, along with what is needed to check
+# if the folder changed since then. It only contains a json block and the raw data of the pages, so reading a cache
+# from an untrusted folder cannot do anything other than fail or give back page data.
+
+REPACK_CACHE_MAGIC = 'XFRC'
+
+# Caches with a different version are ignored.
+# This has to be bumped whenever the format changes, or whenever the writer's output for the same page changes
+REPACK_CACHE_VERSION = 1
+
+
+class BrRepackCache(BrStruct):
+    # Page folder name -> (file stats, content hash, SerializedPage)
+    # File stats are lists of tuples of json compatible values
+    pages: Dict[str, Tuple[list, bytes, SerializedPage]]
+
+    def __br_read__(self, br: BinaryReader):
+        if br.read_str(4) != REPACK_CACHE_MAGIC:
+            raise Exception('Invalid repack cache magic.')
+
+        version = br.read_uint16()
+        if version != REPACK_CACHE_VERSION:
+            raise Exception(f'Unsupported repack cache version: {version}')
+
+        br.read_uint16()
+
+        entries = json.loads(br.read_bytes(br.read_uint32()).decode('utf-8'))
+        br.align_pos(4)
+
+        # The data of the pages is stored after the json, in the same order
+        self.pages = dict()
+        for entry in entries:
+            page = SerializedPage(br.read_bytes(entry['Size']),
+                                  [tuple(c) for c in entry['Chunk Maps']],
+                                  [(name, tuple(c)) for name, c in entry['Chunk References']])
+
+            self.pages[entry['Name']] = ([tuple(s) for s in entry['Stats']], bytes.fromhex(entry['Hash']), page)
+
+    def __br_write__(self, br: BinaryReader):
+        entries = list()
+        for name, (stats, digest, page) in self.pages.items():
+            entries.append({
+                'Name': name,
+                'Stats': stats,
+                'Hash': digest.hex(),
+                'Chunk Maps': page.chunk_maps,
+                'Chunk References': page.chunk_references,
+                'Size': len(page.data),
+            })
+
+        entries_buffer = json.dumps(entries, ensure_ascii=False).encode('utf-8')
+
+        br.write_str(REPACK_CACHE_MAGIC)
+        br.write_uint16(REPACK_CACHE_VERSION)
+        br.write_uint16(0)
+
+        br.write_uint32(len(entries_buffer))
+        br.write_bytes(entries_buffer)
+        br.align(4)
+        br.seek(0, Whence.END)
+
+        for _, _, page in self.pages.values():
+            br.write_bytes(page.data)
+
+
+def repack_cache_from_bytes(data: Union[bytes, bytearray]) -> Dict[str, Tuple[list, bytes, SerializedPage]]:
+    """Reads a repack cache from a buffer and returns a dict of page folder name -> (file stats, content hash, SerializedPage)."""
+    with BinaryReader(data, Endian.BIG) as br:
+        return br.read_struct(BrRepackCache).pages
+
+
+def repack_cache_to_bytes(pages: Dict[str, Tuple[list, bytes, SerializedPage]]) -> bytearray:
+    """Writes a dict of page folder name -> (file stats, content hash, SerializedPage) to a repack cache buffer."""
+    cache = BrRepackCache()
+    cache.pages = pages
+
+    with BinaryReader(endianness=Endian.BIG) as br:
+        br.write_struct(cache)
+        return br.buffer()
+
+
+class RepackCache:
+    """Stores the serialized data of each page folder from the last repack of an unpacked folder.\n
+    A page is reused if the stats of its folder's files did not change (e.g. sizes and modification times),
+    or if the hash of its files is the same as before.
+    """
+
+    def __init__(self, path: Optional[str]):
+        # If path is None, the cache will only be kept in memory
+        self.path = path
+
+        # Page folder name -> (file stats, content hash, SerializedPage)
+        self.pages: Dict[str, Tuple[list, bytes, SerializedPage]] = dict()
+
+        # Updated by load_page, and stored in the cache after the xfbin has been written
+        self.loaded: Dict[str, Tuple[list, bytes]] = dict()
+
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    self.pages = repack_cache_from_bytes(f.read())
+            except Exception:
+                print(f'Repack cache "{path}" is invalid or outdated and will be ignored.')
+
+    def load_page(self, name: str, stats: list,
+                  load: Callable[..., Optional[Page]]) -> Tuple[Optional[Page], Optional[SerializedPage]]:
+        """Returns a tuple of (Page, None) if the page folder has to be written, or (None, SerializedPage) if it can be reused.\n
+        Safe to call from multiple threads.
+        :param name: Name of the page folder
+        :param stats: List of tuples of json compatible values that change when any of the folder's files change
+        :param load: Loads the page folder and returns a Page (or None if it is invalid), while updating the given hasher
+        with the contents of every file that was read. Only called if the stats changed
+        """
+        cached = self.pages.get(name)
+
+        # Nothing changed since the last repack, so the files do not need to be read at all
+        if cached and cached[0] == stats:
+            self.loaded[name] = (stats, cached[1])
+            return None, cached[2]
+
+        hasher = hashlib.blake2b(digest_size=16)
+        page = load(hasher)
+        digest = hasher.digest()
+
+        self.loaded[name] = (stats, digest)
+
+        # The files were touched, but their contents are the same
+        if page and cached and cached[1] == digest:
+            return None, cached[2]
+
+        return page, None
+
+    def update(self, page_names: List[str], serialized_pages: List[SerializedPage]):
+        """Replaces the cached pages with the pages from the last repack."""
+        self.pages = dict()
+        for name, serialized in zip(page_names, serialized_pages):
+            if serialized and name in self.loaded:
+                self.pages[name] = (*self.loaded[name], serialized)
+
+    def save(self):
+        if not self.path:
+            return
+
+        try:
+            with open(self.path + '.tmp', 'wb') as f:
+                f.write(repack_cache_to_bytes(self.pages))
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            print(f'Failed to save the repack cache: {e}')
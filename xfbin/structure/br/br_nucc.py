@@ -1,7 +1,11 @@
+import threading
+
 from ...util import *
 from .br_nud import *
 from .br_nut import *
 
+_br_nucc_types_lock = threading.Lock()
+
 
 class BrNuccChunk(BrStruct):
     name: str
@@ -11,12 +15,15 @@ class BrNuccChunk(BrStruct):
     # Only used when writing
     nuccChunk: 'NuccChunk'
 
-    def __br_read__(self, br: 'BinaryReader', file_path, name) -> None:
+    def __br_read__(self, br: 'BinaryReader', file_path, name, nud_level=NudParseLevel.FULL) -> None:
         # When the BrNuccChunk is read, the init_data method of the BrNuccChunk type will be called,
         # which means that this method does not have to be overrided in each subclass
         self.filePath = file_path
         self.name = name
 
+        # Only used by BrNuccChunkModel
+        self.nudLevel = nud_level
+
         self.init_data(br)
 
     def init_data(self, br: BinaryReader):
@@ -41,16 +48,21 @@ class BrNuccChunk(BrStruct):
         result = globals().get(type_name, None)
 
         if result is None:
-            # Create a new type and add it to the globals
-            result = type(type_name, (cls,), {})
-            globals()[type_name] = result
+            # Lock to make sure that only one type gets created when called from multiple threads
+            with _br_nucc_types_lock:
+                result = globals().get(type_name, None)
+
+                if result is None:
+                    # Create a new type and add it to the globals
+                    result = type(type_name, (cls,), {})
+                    globals()[type_name] = result
 
         return result
 
     @classmethod
-    def create_from_nucc_type(cls, type_str, file_path, name, data) -> 'BrNuccChunk':
+    def create_from_nucc_type(cls, type_str, file_path, name, data, nud_level=NudParseLevel.FULL) -> 'BrNuccChunk':
         # Read a BrNuccChunk struct from the data using the type and set the name and file path
-        return BinaryReader(data, Endian.BIG).read_struct(cls.get_br_nucc_type_from_str(type_str), None, file_path, name)
+        return BinaryReader(data, Endian.BIG).read_struct(cls.get_br_nucc_type_from_str(type_str), None, file_path, name, nud_level)
 
 
 class BrNuccChunkNull(BrNuccChunk):
@@ -334,7 +346,7 @@ class BrNuccChunkModel(BrNuccChunk):
 
         try:
             self.nud_data = br.buffer()[br.pos(): br.pos() + self.nudSize]
-            self.brNud = BinaryReader(self.nud_data, Endian.BIG).read_struct(BrNud)
+            self.brNud = BinaryReader(self.nud_data, Endian.BIG).read_struct(BrNud, None, self.nudLevel)
         except:
             print(f'Failed to read chunk: {self.name} of type: {type(self).__qualname__}')
             self.brNud = None
@@ -1,13 +1,29 @@
-from enum import IntFlag
+from enum import IntEnum, IntFlag
 from typing import List, Tuple
 
 from ...util import *
+from ..nud_optimize import VERTEX_CACHE_SIZE, optimize_vertex_cache
+from ..nud_strips import join_strips, stripify
+from ..nud_tangents import generate_tangents
+
+
+class NudParseLevel(IntEnum):
+    # Header, mesh groups (names and bounding spheres), mesh formats and counts, and materials.
+    # Faces and vertices are read from the NUD's buffer when they are first accessed
+    METADATA = 0
+
+    # Everything except the vertices, which are built from the NUD's buffer when they are first accessed.
+    # Single vertex attributes can be decoded from the buffer without building the vertices (see NudMesh.get_stream)
+    FACES = 1
+
+    # Everything
+    FULL = 2
 
 
 # Based on Smash Forge Nud implementation
 # https://github.com/jam1garner/Smash-Forge/blob/master/Smash%20Forge/Filetypes/Models/Nuds/NUD.cs
 class BrNud(BrStruct):
-    def __br_read__(self, br: BinaryReader) -> None:
+    def __br_read__(self, br: BinaryReader, level=NudParseLevel.FULL) -> None:
         self.magic = br.read_str(4)
 
         if self.magic != 'NDP3':
@@ -35,18 +51,25 @@ class BrNud(BrStruct):
 
         self.boundingSphere = br.read_float(4)
 
+        # Keep a single copy of the buffer for reading the faces and vertices of all meshes later
+        self.buffer = br.buffer() if level < NudParseLevel.FULL else None
+
         self.meshGroups: Tuple[BrNudMeshGroup] = br.read_struct(BrNudMeshGroup, self.meshGroupCount, self)
 
         for g in self.meshGroups:
-            g.meshes = br.read_struct(BrNudMesh, g.meshCount, self)
+            g.meshes = br.read_struct(BrNudMesh, g.meshCount, self, level)
 
     def __br_write__(self, br: 'BinaryReader', nud: 'Nud'):
+        # Meshes that are over the limits would not be readable, so they are written as multiple meshes.
+        # The parts (and the optimized/compacted copies) are only used for writing, and the NUD's meshes are not changed
+        group_meshes = [[part for mesh in g.meshes for part in mesh.get_write_meshes()] for g in nud.mesh_groups]
+
         buffers = NudBuffers()
         with BinaryReader(endianness=Endian.BIG) as br_internal:
             mesh_group_count = len(nud.mesh_groups)
-            mesh_count = sum(map(lambda x: len(x.meshes), nud.mesh_groups))
-            for mesh_group in nud.mesh_groups:
-                br_internal.write_struct(BrNudMeshGroup(), mesh_group, buffers, mesh_group_count, mesh_count)
+            mesh_count = sum(map(len, group_meshes))
+            for mesh_group, meshes in zip(nud.mesh_groups, group_meshes):
+                br_internal.write_struct(BrNudMeshGroup(), mesh_group, meshes, buffers, mesh_group_count, mesh_count)
 
             # Write the mesh and material buffers
             br_internal.extend(buffers.meshes.buffer())
@@ -78,7 +101,8 @@ class BrNud(BrStruct):
         br.write_uint32(0)  # vertAddClumpSize
 
         # Bounding sphere affects if some meshes appear at all (tested with Storm 1 eyes)
-        br.write_float(nud.bounding_sphere)
+        # The original sphere is kept only if it still contains the (possibly changed) vertices
+        br.write_float(nud.get_write_bounding_sphere())
 
         # Write the mesh groups buffer
         br.extend(mesh_groups_buffer)
@@ -131,9 +155,11 @@ class BrNudMeshGroup(BrStruct):
 
         self.positionb = br.read_uint32()
 
-    def __br_write__(self, br: 'BinaryReader', mesh_group: 'NudMeshGroup', buffers: NudBuffers, mesh_groups_count, mesh_count):
-        # Bounding sphere
-        br.write_float(mesh_group.bounding_sphere)
+    def __br_write__(self, br: 'BinaryReader', mesh_group: 'NudMeshGroup', meshes: List['NudMesh'], buffers: NudBuffers,
+                     mesh_groups_count, mesh_count):
+        # Bounding sphere (kept or recalculated in the same way as the NUD's bounding sphere)
+        # Both halves are the same sphere in most NUDs
+        br.write_float(mesh_group.get_write_bounding_sphere())
 
         # Name start in names buffer
         br.write_uint32(buffers.names.size())
@@ -145,18 +171,18 @@ class BrNudMeshGroup(BrStruct):
         br.write_uint16(0)
         br.write_uint16(mesh_group.bone_flags)
         br.write_int16(-1)
-        br.write_int16(len(mesh_group.meshes))
+        br.write_int16(len(meshes))
 
         # Start offset of mesh info
         br.write_uint32(buffers.meshes.size() + 0x30 + (mesh_groups_count * 0x30))
 
-        # Write each mesh in this group
-        for mesh in mesh_group.meshes:
+        # Write each mesh in this group (after splitting)
+        for mesh in meshes:
             buffers.meshes.write_struct(BrNudMesh(), mesh, buffers, mesh_groups_count, mesh_count)
 
 
 class BrNudMesh(BrStruct):
-    def __br_read__(self, br: BinaryReader, nud: BrNud) -> None:
+    def __br_read__(self, br: BinaryReader, nud: BrNud, level=NudParseLevel.FULL) -> None:
         self.polyClumpStart = br.read_uint32() + nud.polyClumpStart
         self.vertClumpStart = br.read_uint32() + nud.vertClumpStart
         self.vertAddClumpStart = br.read_uint32() + nud.vertAddClumpStart
@@ -172,9 +198,38 @@ class BrNudMesh(BrStruct):
         self.faceFlag = br.read_uint8()
         br.seek(0xC, Whence.CUR)
 
-        # Faces
+        # The NUD's buffer, for reading the faces and vertices later (shared by all meshes)
+        self.buffer = nud.buffer
+
+        self.faces = self.vertices = None
+        if level >= NudParseLevel.FACES:
+            self.faces = self.read_faces(br)
+
+        if level >= NudParseLevel.FULL:
+            self.vertices = self.read_vertices(br)
+
+        # Materials
+        i = 0
+        self.materials: List[BrNudMaterial] = list()
+        while i < 4 and self.texProps[i] != 0:
+            with br.seek_to(self.texProps[i]):
+                self.materials.append(br.read_struct(BrNudMaterial, None, self, nud.nameStart))
+            i += 1
+
+    def read_faces(self, br: BinaryReader = None) -> List[int]:
+        """Reads the face indices of the mesh from the NUD's buffer."""
+        if br is None:
+            with BinaryReader(self.buffer, Endian.BIG) as br:
+                return self.read_faces(br)
+
         with br.seek_to(self.polyClumpStart):
-            self.faces = br.read_int16(self.faceCount)
+            return br.read_int16(self.faceCount)
+
+    def read_vertices(self, br: BinaryReader = None) -> List['BrNudVertex']:
+        """Reads the vertices of the mesh from the NUD's buffer."""
+        if br is None:
+            with BinaryReader(self.buffer, Endian.BIG) as br:
+                return self.read_vertices(br)
 
         # UV + Vertices
         with br.seek_to(self.vertClumpStart):
@@ -201,22 +256,17 @@ class BrNudMesh(BrStruct):
 
                 br.seek(self.vertAddClumpStart)
 
-            self.vertices = br.read_struct(BrNudVertex, self.vertexCount, vertexType, boneType, self.uvSize)
+            vertices = br.read_struct(BrNudVertex, self.vertexCount, vertexType, boneType, self.uvSize)
 
             if boneType > 0:
                 for i in range(self.vertexCount):
-                    self.vertices[i].color = colors[i]
-                    self.vertices[i].uv = uvs[i]
+                    vertices[i].color = colors[i]
+                    vertices[i].uv = uvs[i]
 
-        # Materials
-        i = 0
-        self.materials: List[BrNudMaterial] = list()
-        while i < 4 and self.texProps[i] != 0:
-            with br.seek_to(self.texProps[i]):
-                self.materials.append(br.read_struct(BrNudMaterial, None, self, nud.nameStart))
-            i += 1
+        return vertices
 
     def __br_write__(self, br: 'BinaryReader', mesh: 'NudMesh', buffers: NudBuffers, mesh_groups_count, mesh_count):
+        # The mesh was already optimized, compacted and given tangents by NudMesh.get_write_meshes
         # Set the formats we're going to use
         vertex_type = mesh.vertex_type
         bone_type = mesh.bone_type if mesh.has_bones() else NudBoneType.NoBones
@@ -229,10 +279,10 @@ class BrNudMesh(BrStruct):
         br.write_uint16(len(mesh.vertices))
 
         # Write vertex size
-        br.write_uint8(vertex_type | bone_type)
+        br.write_uint8(int(vertex_type | bone_type))
 
         # Write UV and vertex color format
-        br.write_uint8((mesh.get_uv_channel_count() << 4) | uv_type)
+        br.write_uint8(int((mesh.get_uv_channel_count() << 4) | uv_type))
 
         # Write materials
         tex_props = [0] * 4
@@ -244,8 +294,12 @@ class BrNudMesh(BrStruct):
         for tex_prop in tex_props:
             br.write_uint32(tex_prop)
 
+        # Triangles are merged into strips, which only need a restart index between each other
+        # Optimized meshes use short strips that keep the optimized order of their faces
+        face_indices = join_strips(stripify(mesh.faces, VERTEX_CACHE_SIZE if mesh.optimize_on_write else None))
+
         # Write face count and format
-        br.write_uint16((len(mesh.faces) * 4) - 1)
+        br.write_uint16(len(face_indices))
 
         # Unlike the usual 0x04 and 0x40 formats, CC2 NUDs only support strips (0x04) but this flag is always 0
         br.write_uint8(0)
@@ -255,12 +309,7 @@ class BrNudMesh(BrStruct):
         br.write_uint32([0] * 3)
 
         # Write faces
-        for face in mesh.faces[:-1]:
-            buffers.polyClump.write_int16((face[2], face[0], face[1]))
-            buffers.polyClump.write_int16(-1)
-
-        # Write the last triangle (without the -1)
-        buffers.polyClump.write_int16((mesh.faces[-1][2], mesh.faces[-1][0], mesh.faces[-1][1]))
+        buffers.polyClump.write_int16(face_indices)
 
         # Write UV + vertices
         vertex_br = buffers.vertClump
@@ -281,6 +330,14 @@ class BrNudMesh(BrStruct):
         buffers.vertAddClump.align(4)
 
 
+def get_vector4(values) -> Tuple[float, float, float, float]:
+    """Returns the first 4 components of a tangent or bitangent, padded with zeros (or all zeros if it is None).\n
+    The 4th component of tangents is the handedness calculated by `generate_tangents`, so it has to be kept.
+    """
+    values = tuple(values[:4]) if values else ()
+    return values + (0.0,) * (4 - len(values))
+
+
 class NudVertexType(IntFlag):
     NoNormals = 0
     NormalsFloat = 1
@@ -383,20 +440,16 @@ class BrNudVertex(BrStruct):
             br.write_float(1.0)
             br.write_float(vertex.normal if vertex.normal else [0] * 3)
             br.write_float(1.0)
-            br.write_float(vertex.bitangent[:3] if vertex.bitangent else [0] * 3)
-            br.write_float(0)
-            br.write_float(vertex.tangent[:3] if vertex.tangent else [0] * 3)
-            br.write_float(0)
+            br.write_float(get_vector4(vertex.bitangent))
+            br.write_float(get_vector4(vertex.tangent))
         elif vertexType == NudVertexType.NormalsHalfFloat:
             br.write_half_float(vertex.normal)
             br.write_half_float(1.0)
         elif vertexType == NudVertexType.NormalsTanBiTanHalfFloat:
             br.write_half_float(vertex.normal)
             br.write_half_float(1.0)
-            br.write_half_float(vertex.bitangent[:3])
-            br.write_half_float(0)
-            br.write_half_float(vertex.tangent[:3])
-            br.write_half_float(0)
+            br.write_half_float(get_vector4(vertex.bitangent))
+            br.write_half_float(get_vector4(vertex.tangent))
         else:
             raise Exception(f'Unsupported vertex type: {vertexType}')
 
@@ -414,7 +467,7 @@ class BrNudVertex(BrStruct):
             br.write_half_float(vertex.bone_weights)
         elif boneType == NudBoneType.Byte:
             br.write_uint8(vertex.bone_ids)
-            br.write_float(tuple(map(lambda x: int(x * 255), vertex.bone_weights)))
+            br.write_uint8(tuple(map(lambda x: round(x * 255), vertex.bone_weights)))
 
 
 class BrNudMaterial(BrStruct):
@@ -1,13 +1,25 @@
-from typing import Dict, List, Tuple
+import hashlib
+import io
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 
+from ...cpk import decompress_crilayla, is_crilayla
 from ...util import *
 from ..nucc import *
 from ..xfbin import *
 from .br_nucc import *
 
 
+# Size of the content hashes of the chunks' data
+CHUNK_HASH_SIZE = 16
+
+
+def get_chunk_hash(data: Union[bytes, bytearray]) -> bytes:
+    """Returns the content hash of a chunk's data, which is used for finding duplicate or changed chunks."""
+    return hashlib.blake2b(data, digest_size=CHUNK_HASH_SIZE).digest()
+
+
 class BrXfbin(BrStruct):
-    def __br_read__(self, br: BinaryReader):
+    def __br_read__(self, br: BinaryReader, hash_chunks=False, nud_level=NudParseLevel.FULL):
         self.header: BrNuccHeader = br.read_struct(BrNuccHeader)
         self.chunkTable: BrChunkTable = br.read_struct(BrChunkTable)
 
@@ -20,7 +32,7 @@ class BrXfbin(BrStruct):
 
         # Assume that the file ends with a nuccChunkPage
         while not br.eof():
-            br_page: BrPage = br.read_struct(BrPage, None, self)
+            br_page: BrPage = br.read_struct(BrPage, None, self, True, hash_chunks, nud_level)
 
             # Add the page size to the current page index to "flip" to the next page
             self.curPageStart += br_page.pageChunk.pageSize
@@ -32,49 +44,86 @@ class BrXfbin(BrStruct):
             # Add the page to the br_xfbin
             self.pages.append(br_page)
 
-    def __br_write__(self, br: 'BinaryReader', xfbin: Xfbin):
+    def __br_write__(self, br: 'BinaryReader', xfbin: Xfbin, serialized_pages: Optional[List['SerializedPage']] = None):
         # Store the pages in a separate buffer and merge it with the main buffer later
         br_page_writer = BinaryReader(endianness=Endian.BIG)
 
+        for data in self.write_pages(xfbin, serialized_pages):
+            br_page_writer.extend(data)
+            br_page_writer.seek(len(data), Whence.CUR)
+
+        # After all of the pages have been written, write the header and the table
+        self.write_table(br)
+
+        # Write the page buffer to the main buffer
+        br.extend(br_page_writer.buffer())
+        br.seek(br_page_writer.size(), Whence.CUR)
+
+    def write_pages(self, xfbin: Xfbin, serialized_pages: Optional[List['SerializedPage']] = None) -> Iterator[bytes]:
+        """Writes each page of the xfbin and yields its data, while collecting the chunk table's data.\n
+        The first buffer yielded is the extra null chunk before the first page.\n
+        `write_table` should be called after all of the pages have been written.
+        """
+        # serialized_pages is an optional list with an entry for each page of the xfbin:
+        # pages that have a SerializedPage entry will not be written again, and their serialized data will be used instead.
+        # Entries that are None will be set to the SerializedPage of the newly written page
+
         # First page always has an extra null chunk (doesn't affect anything though)
-        null_chunk = BrNuccChunkNull()
-        null_chunk.nuccChunk = NuccChunkNull()
-        br_page_writer.write_struct(BrChunk(), null_chunk, IterativeDict())
+        with BinaryReader(endianness=Endian.BIG) as br_internal:
+            null_chunk = BrNuccChunkNull()
+            null_chunk.nuccChunk = NuccChunkNull()
+            br_internal.write_struct(BrChunk(), null_chunk, IterativeDict())
+
+            yield br_internal.buffer()
 
         # This will contain all unique chunks
-        chunk_map_dict = IterativeDict()
+        self.chunkMapDict = IterativeDict()
 
         # # This will contain the references list for all pages combined
-        chunk_references = list()
+        self.chunkReferences = list()
 
         # This will contain the indices list for all pages combined
-        chunk_map_indices = list()
+        self.chunkMapIndices = list()
 
         # Write each page
-        for page in xfbin:
+        for i, page in enumerate(xfbin):
             br_page = BrPage()
 
-            # Write the BrPage
-            br_page_writer.write_struct(br_page, page)
+            if serialized_pages and serialized_pages[i]:
+                # Reuse the page's data instead of writing it again
+                serialized_pages[i].restore(br_page)
+                data = serialized_pages[i].data
+            else:
+                # Write the BrPage to its own buffer
+                with BinaryReader(endianness=Endian.BIG) as br_internal:
+                    br_internal.write_struct(br_page, page)
+                    data = br_internal.buffer()
+
+                # Keep a copy of the page
+                if serialized_pages is not None:
+                    serialized_pages[i] = SerializedPage.from_br_page(br_page, data)
 
             # Add the non-existent NuccChunkIndex chunk, as it should not be written as a BrChunk
             br_page.chunkIndexDict.get_or_next(NuccChunkIndex())
 
             # Update the global chunk list using this BrPage's chunk index dict
-            chunk_map_dict.update_or_next(br_page.chunkIndexDict)
+            self.chunkMapDict.update_or_next(br_page.chunkIndexDict)
 
-            chunk_references.extend(br_page.chunkReferences)
+            self.chunkReferences.extend(br_page.chunkReferences)
 
             # Add all of the chunks in the current page to the indices list (in order)
-            chunk_map_indices.extend(br_page.chunkIndexDict.keys())
+            self.chunkMapIndices.extend(br_page.chunkIndexDict.keys())
+
+            yield data
 
-        # After all of the pages have been written, start writing the table
+    def write_table(self, br: 'BinaryReader'):
+        """Writes the header and the chunk table using the data collected by `write_pages`."""
         br_chunk_table_writer = BinaryReader(endianness=Endian.BIG)
         br_chunk_table = BrChunkTable()
 
-        br_chunk_table.chunkMapDict = chunk_map_dict
-        br_chunk_table.chunkReferences = chunk_references
-        br_chunk_table.chunkMapIndices = chunk_map_indices
+        br_chunk_table.chunkMapDict = self.chunkMapDict
+        br_chunk_table.chunkReferences = self.chunkReferences
+        br_chunk_table.chunkMapIndices = self.chunkMapIndices
 
         br_chunk_table_writer.write_struct(br_chunk_table)
 
@@ -88,9 +137,117 @@ class BrXfbin(BrStruct):
         br.extend(br_chunk_table_writer.buffer())
         br.seek(br_chunk_table_writer.size(), Whence.CUR)
 
-        # Write the page buffer to the main buffer
-        br.extend(br_page_writer.buffer())
-        br.seek(br_page_writer.size(), Whence.CUR)
+
+# Sizes of the fixed parts of the XFBIN structures, used for reading them from streams
+NUCC_HEADER_SIZE = 0x1C
+CHUNK_TABLE_HEADER_SIZE = 0x28
+CHUNK_HEADER_SIZE = 0xC
+
+
+def read_exact(stream: BinaryIO, size: int, allow_eof=False) -> bytes:
+    """Reads exactly `size` bytes from the stream, even if the stream returns less data per read (e.g. pipes).\n
+    If allow_eof is True, an empty bytes object is returned when the stream has already reached its end.
+    """
+    data = stream.read(size)
+    if len(data) == size or (allow_eof and not data):
+        return data
+
+    parts = [data]
+    remaining = size - len(data)
+
+    while remaining:
+        data = stream.read(remaining)
+        if not data:
+            raise Exception('Unexpected end of XFBIN stream.')
+
+        parts.append(data)
+        remaining -= len(data)
+
+    return b''.join(parts)
+
+
+class BrXfbinStream:
+    """Reads an XFBIN from a binary file-like object without reading the whole file first.\n
+    The header and the chunk table are read on creation, and each iteration reads and returns a single BrPage.\n
+    The stream only has to support `read`, so pipes and archive members can be used as well.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+        header_data = read_exact(stream, NUCC_HEADER_SIZE)
+
+        # CRILAYLA data can only be decompressed from the end, so the whole stream has to be read first
+        if is_crilayla(header_data):
+            self.stream = stream = io.BytesIO(decompress_crilayla(header_data + stream.read()))
+            header_data = read_exact(stream, NUCC_HEADER_SIZE)
+
+        with BinaryReader(header_data, Endian.BIG) as br:
+            self.header: BrNuccHeader = br.read_struct(BrNuccHeader)
+
+        # The size of the chunk table depends on the counts and sizes in its header
+        table_header = read_exact(stream, CHUNK_TABLE_HEADER_SIZE)
+        with BinaryReader(table_header, Endian.BIG) as br:
+            (_, chunk_type_size, _, file_path_size, _, chunk_name_size,
+             chunk_map_count, _, chunk_map_indices_count, chunk_map_references_count) = br.read_uint32(10)
+
+        # Strings are aligned to 4 bytes from the start of the file
+        strings_end = NUCC_HEADER_SIZE + CHUNK_TABLE_HEADER_SIZE + chunk_type_size + file_path_size + chunk_name_size
+        table_end = (strings_end + 3) & ~3
+        table_end += chunk_map_count * 0xC + chunk_map_references_count * 0x8 + chunk_map_indices_count * 0x4
+
+        table_data = read_exact(stream, table_end - NUCC_HEADER_SIZE - CHUNK_TABLE_HEADER_SIZE)
+
+        # Keep the header in the buffer to have the same alignment as when reading the whole file
+        with BinaryReader(header_data + table_header + table_data, Endian.BIG, 'cp932') as br:
+            br.seek(NUCC_HEADER_SIZE)
+            self.chunkTable: BrChunkTable = br.read_struct(BrChunkTable)
+
+        # Same as BrXfbin, used inside BrPage read method
+        self.curPageStart = 0
+        self.curReferenceStart = 0
+
+    def is_page_chunk(self, chunk_map_index: int) -> bool:
+        return self.chunkTable.get_props_from_index(self.curPageStart + chunk_map_index)[0] == 'nuccChunkPage'
+
+    def __iter__(self) -> Iterator['BrPage']:
+        return self.read_pages()
+
+    def read_pages(self, decode=True, hash_chunks=False, nud_level=NudParseLevel.FULL) -> Iterator['BrPage']:
+        """Reads and yields each BrPage. If decode is False, the chunks of the pages will not be decoded.\n
+        If hash_chunks is True, the content hash of each chunk will be stored in the BrPage's chunkHashes.\n
+        nud_level is the NudParseLevel of the NUDs inside model chunks.
+        """
+        page_data = list()
+
+        while True:
+            chunk_header = read_exact(self.stream, CHUNK_HEADER_SIZE, True)
+            if not chunk_header:
+                break
+
+            size = int.from_bytes(chunk_header[:4], 'big')
+            chunk_map_index = int.from_bytes(chunk_header[4:8], 'big')
+
+            page_data.append(chunk_header)
+            page_data.append(read_exact(self.stream, size))
+
+            # Only read a page after all of its chunks have been read
+            if not self.is_page_chunk(chunk_map_index):
+                continue
+
+            with BinaryReader(b''.join(page_data), Endian.BIG, 'cp932') as br:
+                br_page: BrPage = br.read_struct(BrPage, None, self, decode, hash_chunks, nud_level)
+
+            page_data.clear()
+
+            # Add the page size to the current page index to "flip" to the next page
+            self.curPageStart += br_page.pageChunk.pageSize
+            self.curReferenceStart += br_page.pageChunk.referenceSize
+
+            yield br_page
+
+        if page_data:
+            raise Exception('Unexpected end of XFBIN stream: last page does not end with a nuccChunkPage.')
 
 
 class BrNuccHeader(BrStruct):
@@ -102,7 +259,7 @@ class BrNuccHeader(BrStruct):
 
         if self.magic != 'NUCC':
             if self.magic == 'CPK ':
-                raise Exception('Invalid magic. XFBIN file is possibly CPK compressed.')
+                raise Exception('Invalid magic. File is a CPK archive, use read_cpk to read the XFBINs inside it.')
 
             raise Exception('Invalid magic.')
 
@@ -183,12 +340,14 @@ class BrChunkTable(BrStruct):
                 self.filePaths[chunk_map.filePathIndex],
                 self.chunkNames[chunk_map.chunkNameIndex])
 
-    def get_br_nucc_chunk(self, br_chunk: 'BrChunk', page_start_index: int) -> BrNuccChunk:
-        # Get the chunk map of the br_chunk
-        chunk_map = self.chunkMaps[self.chunkMapIndices[page_start_index + br_chunk.chunkMapIndex]]
+    def get_props_from_index(self, index: int) -> Tuple[str, str, str]:
+        # Return a tuple of (type, path, name) using the chunk map at the index from the chunk map indices
+        return self.get_props_from_chunk_map(self.chunkMaps[self.chunkMapIndices[index]])
 
-        # Create and return a BrNuccChunk with the correct type from the map
-        return BrNuccChunk.create_from_nucc_type(*self.get_props_from_chunk_map(chunk_map), br_chunk.data)
+    def get_br_nucc_chunk(self, br_chunk: 'BrChunk', page_start_index: int, nud_level=NudParseLevel.FULL) -> BrNuccChunk:
+        # Create and return a BrNuccChunk with the correct type from the chunk map of the br_chunk
+        return BrNuccChunk.create_from_nucc_type(*self.get_props_from_index(page_start_index + br_chunk.chunkMapIndex),
+                                                 br_chunk.data, nud_level)
 
     def __br_write__(self, br: 'BinaryReader'):
         # Set up the indices dictionaries
@@ -309,15 +468,31 @@ class BrPage(BrStruct):
     # Only used when writing
     chunkIndexDict: IterativeDict
 
-    def __br_read__(self, br: BinaryReader, br_xfbin: BrXfbin):
+    def __br_read__(self, br: BinaryReader, br_xfbin: BrXfbin, decode=True, hash_chunks=False, nud_level=NudParseLevel.FULL):
         self.chunksDict: Dict[int, BrNuccChunk] = dict()
 
+        # Only used when not decoding: contains the BrChunks of the page by their local map index
+        self.rawChunksDict: Dict[int, BrChunk] = dict()
+
+        # Only used when hashing: contains the content hashes of the chunks by their local map index
+        self.chunkHashes: Dict[int, bytes] = dict()
+
         while True:
             # Read a BrChunk
             br_chunk: BrChunk = br.read_struct(BrChunk)
 
+            if hash_chunks:
+                self.chunkHashes[br_chunk.chunkMapIndex] = get_chunk_hash(br_chunk.data)
+
+            if not decode:
+                self.rawChunksDict[br_chunk.chunkMapIndex] = br_chunk
+
+                # The page chunk still has to be decoded to get the page's size
+                if br_xfbin.chunkTable.get_props_from_index(br_xfbin.curPageStart + br_chunk.chunkMapIndex)[0] != 'nuccChunkPage':
+                    continue
+
             # Convert the BrChunk to a BrNuccChunk
-            chunk = br_xfbin.chunkTable.get_br_nucc_chunk(br_chunk, br_xfbin.curPageStart)
+            chunk = br_xfbin.chunkTable.get_br_nucc_chunk(br_chunk, br_xfbin.curPageStart, nud_level)
 
             # Add the BrNuccChunk to the dictionary by its local map index (for use when converting BrNuccChunks to NuccChunks)
             self.chunksDict[br_chunk.chunkMapIndex] = chunk
@@ -377,3 +552,32 @@ class BrPage(BrStruct):
         br_nucc_page = BrNuccChunkPage()
         br_nucc_page.nuccChunk = NuccChunkPage()
         br.write_struct(BrChunk(), br_nucc_page, self.chunkIndexDict, self.chunkReferences)
+
+
+class SerializedPage:
+    """Contains the written data of a BrPage, along with the chunk maps and the chunk references of the page.\n
+    This allows writing the page to an XFBIN again without having to process its chunks.\n
+    Chunk maps are stored as (type, file path, name) tuples, and references as (name, chunk map) tuples.
+    """
+
+    def __init__(self, data: bytes, chunk_maps: List[Tuple[str, str, str]], chunk_references: List[Tuple[str, Tuple[str, str, str]]]):
+        self.data = data
+        self.chunk_maps = chunk_maps
+        self.chunk_references = chunk_references
+
+    @classmethod
+    def from_br_page(cls, br_page: BrPage, data: bytes) -> 'SerializedPage':
+        def to_tuple(chunk: NuccChunk):
+            return (NuccChunk.get_nucc_str_from_type(type(chunk)), chunk.filePath, chunk.name)
+
+        return cls(bytes(data),
+                   list(map(to_tuple, br_page.chunkIndexDict)),
+                   list(map(lambda x: (x.name, to_tuple(x.chunk)), br_page.chunkReferences)))
+
+    def restore(self, br_page: BrPage):
+        """Sets up the chunk index dictionary and the chunk references of a BrPage, as if it was written from this page."""
+        br_page.chunkIndexDict = IterativeDict()
+        br_page.chunkIndexDict.update_or_next(map(lambda x: NuccChunk.create_from_nucc_type(*x), self.chunk_maps))
+
+        br_page.chunkReferences = list(map(lambda x: ChunkReference(
+            x[0], NuccChunk.create_from_nucc_type(*x[1])), self.chunk_references))
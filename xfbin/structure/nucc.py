@@ -1,3 +1,4 @@
+import threading
 from enum import IntFlag
 from typing import Dict, Iterator, List, Optional, Set
 
@@ -6,6 +7,9 @@ from .br.br_nucc import *
 from .br.br_nud import *
 from .br.br_nut import *
 from .nud import Nud
+from .skeleton import Skeleton
+
+_nucc_types_lock = threading.Lock()
 
 
 class NuccChunk:
@@ -17,6 +21,12 @@ class NuccChunk:
 
     chunks: List['NuccChunk']
 
+    # Content hash of the chunk's data when it was read, if hashing was enabled while reading
+    content_hash: Optional[bytes]
+
+    # Attributes that are not compared by xfbin_diff: raw data, and the chunks of the page
+    transient_attributes = ('data', 'file_data', 'content_hash', 'chunks', 'has_data', 'has_props')
+
     def __init__(self, file_path, name):
         self.extension = ''
         self.filePath = file_path
@@ -25,11 +35,15 @@ class NuccChunk:
         self.has_data = False
         self.has_props = False
         self.chunks = list()
+        self.content_hash = None
 
     def set_data(self, data: bytearray, chunks):
         self.data = data
         self.has_data = True
 
+        # The data was replaced, so the hash is no longer valid
+        self.content_hash = None
+
         self.chunks = [c for c in chunks if not isinstance(c, (NuccChunkPage, NuccChunkIndex))]
 
     def init_data(self, br_chunk: BrNuccChunk, chunk_list: List['NuccChunk'], chunk_indices: List[int], reference_indices: List[int]):
@@ -68,9 +82,14 @@ class NuccChunk:
         result = globals().get(type_name, None)
 
         if result is None:
-            # Create a new type and add it to the globals
-            result = type(type_name, (cls,), {})
-            globals()[type_name] = result
+            # Lock to make sure that only one type gets created when called from multiple threads
+            with _nucc_types_lock:
+                result = globals().get(type_name, None)
+
+                if result is None:
+                    # Create a new type and add it to the globals
+                    result = type(type_name, (cls,), {})
+                    globals()[type_name] = result
 
         return result
 
@@ -239,6 +258,12 @@ class NuccChunkClump(NuccChunk):
             self.model_groups.append(ClumpModelGroup())
             self.model_groups[-1].init_data(model_group, self.coord_chunks, chunk_list, chunk_indices)
 
+    def get_skeleton(self) -> Skeleton:
+        """Returns a flattened view of the coord node hierarchy of this clump.\n
+        The skeleton is not updated automatically, so it should be created again after changing the hierarchy.
+        """
+        return Skeleton(self.root_nodes)
+
     def clear_non_model_chunks(self, model_list: bool = True, model_groups: bool = True, none_refs: bool = False) -> int:
         """Removes all chunks that are not NuccChunkModel from the model list and model groups of this clump, based on the arguments.\n
         If none_refs is True, will also remove "None" entries.\n
@@ -295,6 +320,9 @@ class CoordNode:
     parent: Optional['CoordNode']
     children: List['CoordNode']
 
+    # References back to other objects are not compared by xfbin_diff
+    transient_attributes = ('chunk', 'parent', 'children')
+
     def __init__(self, chunk: NuccChunkCoord):
         self.chunk = chunk
 
@@ -316,10 +344,14 @@ class CoordNode:
         self.unkShort = coord.unkShort
 
     def get_children_recursive(self) -> List['CoordNode']:
+        """Returns all of the descendants of this node in depth first order, without the node itself."""
         result = list()
 
-        for child in self.children:
-            result.extend(child.get_children_recursive())
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            result.append(node)
+            stack.extend(reversed(node.children))
 
         return result
 
@@ -378,6 +410,7 @@ class NuccChunkModel(NuccChunk):
 
         if hasattr(other, 'data'):
             self.data = other.data
+            self.content_hash = other.content_hash
 
         self.extension = other.extension
 
@@ -1,7 +1,13 @@
+import copy
 from itertools import chain
-from typing import List, Tuple
+from math import sqrt
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from .br.br_nud import *
+from .nud_formats import NORMAL_ERROR, WEIGHT_ERROR, compact_vertex_formats
+from .nud_optimize import optimize_vertex_cache
+from .nud_streams import STREAM_ATTRIBUTES, STREAM_NAMES, read_stream
+from .nud_tangents import generate_tangents
 
 
 class Nud:
@@ -24,16 +30,38 @@ class Nud:
                 self.mesh_groups[0].meshes[0].bone_type != NudBoneType.NoBones):
             return (0, 0)
 
-        lower = 0xFF_FF
-        higher = 0
-        for mesh in [m for m in self.mesh_groups[0].meshes if m.vertices and m.vertices[0].bone_ids]:
-            lower = min(lower, min(chain(*map(lambda x: x.bone_ids, mesh.vertices))))
-            higher = max(higher, max(chain(*map(lambda x: x.bone_ids, mesh.vertices))))
+        stats = [m.get_stats() for m in self.mesh_groups[0].meshes]
+        stats = [s for s in stats if s.bone_range]
 
-        if lower > higher:
+        if not stats:
             return (0, 0)
 
-        return (lower, higher)
+        return (min(s.bone_range[0] for s in stats), max(s.bone_range[1] for s in stats))
+
+    def get_bounding_box(self) -> Optional[Tuple[Tuple[float, float, float], Tuple[float, float, float]]]:
+        """Returns the (min, max) corners of the box that contains the vertices of all meshes, or None if there are no vertices."""
+        return merge_bounding_boxes(g.get_bounding_box() for g in self.mesh_groups)
+
+    def get_bounding_sphere(self) -> Tuple[float, float, float, float]:
+        """Returns a sphere (x, y, z, radius) that contains the bounding spheres of all mesh groups."""
+        return merge_bounding_spheres(g.get_bounding_sphere() for g in self.mesh_groups)
+
+    def get_write_bounding_sphere(self) -> Tuple[float, float, float, float]:
+        """Returns the bounding sphere that should be written: the original one if it still contains the meshes,
+        or the recalculated one otherwise.
+        """
+        sphere = self.get_bounding_sphere()
+        original = getattr(self, 'bounding_sphere', None)
+
+        return tuple(original) if original and sphere_contains(original, sphere) else sphere
+
+    def compact_vertex_formats(self, normal_error=NORMAL_ERROR, weight_error=WEIGHT_ERROR) -> Tuple[int, int]:
+        """Changes the vertex formats of every mesh to the most compact ones within the error budgets.
+        :return: A tuple of the total size of the vertices (in bytes) before and after changing the formats
+        """
+        sizes = [m.compact_vertex_formats(normal_error, weight_error) for g in self.mesh_groups for m in g.meshes]
+
+        return sum(s[0] for s in sizes), sum(s[1] for s in sizes)
 
 
 class NudMeshGroup:
@@ -51,6 +79,43 @@ class NudMeshGroup:
             mesh.init_data(br_mesh)
             self.meshes.append(mesh)
 
+    def get_bounding_box(self) -> Optional[Tuple[Tuple[float, float, float], Tuple[float, float, float]]]:
+        """Returns the (min, max) corners of the box that contains the vertices of all meshes, or None if there are no vertices."""
+        return merge_bounding_boxes(m.get_stats().bounding_box for m in self.meshes)
+
+    def get_bounding_sphere(self) -> Tuple[float, float, float, float]:
+        """Returns a sphere (x, y, z, radius) that contains the bounding spheres of all meshes."""
+        return merge_bounding_spheres(m.get_stats().bounding_sphere for m in self.meshes)
+
+    def get_write_bounding_sphere(self) -> Tuple[float, ...]:
+        """Returns the 2 bounding spheres (8 floats) that should be written: the original ones if they still contain
+        the meshes, or the recalculated sphere twice otherwise.
+        """
+        sphere = self.get_bounding_sphere()
+        original = getattr(self, 'bounding_sphere', None)
+
+        if original and sphere_contains(original[:4], sphere) and sphere_contains(original[4:], sphere):
+            return tuple(original)
+
+        return sphere * 2
+
+    def split_meshes(self, max_vertices=None, max_faces=None) -> int:
+        """Replaces each mesh that is over the NUD mesh limits with multiple meshes that fit (see `NudMesh.split`).
+        :return: The number of meshes that were split
+        """
+        meshes = list()
+        split_count = 0
+
+        for mesh in self.meshes:
+            parts = mesh.split(max_vertices, max_faces)
+            meshes.extend(parts)
+            split_count += len(parts) > 1
+
+        if split_count:
+            self.meshes = meshes
+
+        return split_count
+
 
 class NudMesh:
     MAX_VERTICES = 32_767
@@ -64,9 +129,32 @@ class NudMesh:
     bone_type: NudBoneType
     uv_type: NudUvType
 
+    # Cached stats of the vertices, and the vertices list they were calculated for (as the list and its length)
+    stats: Optional['NudMeshStats'] = None
+    stats_key: Optional[Tuple[list, int]] = None
+
+    # Cached vertex streams (see `get_stream`), and the vertices list they were taken from.
+    # The key is None for streams that were decoded from the NUD's buffer
+    streams: Optional[Dict[object, Optional[List[tuple]]]] = None
+    streams_key: Optional[Tuple[list, int]] = None
+
+    # Attributes that are loaded on first access for meshes that were not read with NudParseLevel.FULL
+    lazy_attributes = ('vertices', 'faces')
+
+    # Caches, the retained BrNudMesh and the results of the last write, which are not compared by xfbin_diff
+    transient_attributes = ('stats', 'stats_key', 'br_mesh', 'streams', 'streams_key', 'write_acmr', 'write_vertex_sizes')
+
+    # If True, the faces and vertices will be reordered for the vertex cache when writing (see `optimize_vertex_cache`).
+    # The mesh itself is not changed, and the ACMR before and after optimizing is stored in write_acmr
+    optimize_on_write = False
+    write_acmr: Optional[Tuple[float, float]] = None
+
+    # If True, the most compact vertex formats will be used when writing (see `compact_vertex_formats`).
+    # The mesh itself is not changed, and the size of the vertices before and after is stored in write_vertex_sizes
+    compact_on_write = False
+    write_vertex_sizes: Optional[Tuple[int, int]] = None
+
     def init_data(self, br_mesh: BrNudMesh):
-        self.add_vertices(br_mesh.vertices)
-        self.add_faces(br_mesh.faces, br_mesh.faceSize)
         self.add_materials(br_mesh.materials)
 
         self.vertex_type = NudVertexType(br_mesh.vertexSize & 0x0F)
@@ -74,6 +162,235 @@ class NudMesh:
         self.uv_type = NudUvType(br_mesh.uvSize & 0x0F)
         self.face_flag = br_mesh.faceFlag
 
+        if br_mesh.faces is not None:
+            self.add_faces(br_mesh.faces, br_mesh.faceSize)
+
+        if br_mesh.vertices is not None:
+            self.add_vertices(br_mesh.vertices)
+        else:
+            # The vertices (and the faces with NudParseLevel.METADATA) are loaded when they are first accessed
+            self.br_mesh = br_mesh
+
+    def __getattr__(self, name):
+        # Only called when the attribute was not found, so the faces and vertices have not been loaded yet
+        if name in self.lazy_attributes and self.__dict__.get('br_mesh') is not None:
+            self.load(name == 'vertices', name == 'faces')
+            return self.__dict__[name]
+
+        raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+    def load(self, vertices=True, faces=True):
+        """Reads the vertices and/or faces of a mesh that were not read with the NUD from the NUD's buffer.\n
+        This is done automatically when they are first accessed, and does nothing if they were already loaded.
+        """
+        br_mesh = self.__dict__.get('br_mesh')
+        if br_mesh is None:
+            return
+
+        if vertices and 'vertices' not in self.__dict__:
+            self.add_vertices(br_mesh.read_vertices())
+
+        if faces and 'faces' not in self.__dict__:
+            self.add_faces(br_mesh.read_faces(), br_mesh.faceSize)
+
+        # The buffer is no longer needed once everything is loaded
+        if 'vertices' in self.__dict__ and 'faces' in self.__dict__:
+            del self.br_mesh
+
+    def is_loaded(self) -> bool:
+        return self.__dict__.get('br_mesh') is None
+
+    def get_vertex_count(self) -> int:
+        """Returns the number of vertices without loading them."""
+        if 'vertices' not in self.__dict__ and self.__dict__.get('br_mesh') is not None:
+            return self.br_mesh.vertexCount
+
+        return len(self.vertices)
+
+    def is_cache_valid(self, key: Optional[Tuple[list, int]]) -> bool:
+        """Returns True if a cache key still matches the vertices list (the same list object with the same length)."""
+        return key is not None and key[0] is self.vertices and key[1] == len(self.vertices)
+
+    def get_stats(self) -> 'NudMeshStats':
+        """Returns the bone range and bounding volumes of the vertices, which are cached until the vertices list is
+        replaced or resized. Editing existing vertices is not detected, so `invalidate()` has to be called after that.
+        """
+        if self.stats is None or not self.is_cache_valid(self.stats_key):
+            self.stats = NudMeshStats(self.vertices)
+            self.stats_key = (self.vertices, len(self.vertices))
+
+        return self.stats
+
+    def invalidate(self):
+        """Clears the cached stats and streams. Has to be called after editing existing vertices."""
+        self.stats = self.stats_key = None
+        self.streams = self.streams_key = None
+
+    def get_stream(self, name: str, channel=0) -> Optional[List[tuple]]:
+        """Returns a single attribute of all vertices, or None if the vertices do not have it.\n
+        If the vertices were not loaded yet (see NudParseLevel), only this attribute is decoded from the NUD's
+        buffer. Otherwise, it is taken from the vertices. Streams are cached in the same way as `get_stats`.
+        :param name: One of 'positions', 'normals', 'tangents', 'bitangents', 'colors', 'uvs', 'bone_ids', 'bone_weights'
+        :param channel: UV channel, only used with 'uvs'
+        """
+        if name not in STREAM_NAMES:
+            raise Exception(f'Unknown vertex stream: {name}')
+
+        loaded = 'vertices' in self.__dict__ or self.__dict__.get('br_mesh') is None
+
+        if self.streams is None or (loaded and not self.is_cache_valid(self.streams_key)):
+            self.streams = dict()
+            self.streams_key = (self.vertices, len(self.vertices)) if loaded else None
+
+        stream_key = (name, channel) if name == 'uvs' else name
+        if stream_key not in self.streams:
+            if not loaded:
+                stream = read_stream(self.br_mesh, name, channel)
+            elif name == 'uvs':
+                stream = [v.uv[channel] if v.uv and channel < len(v.uv) else None for v in self.vertices]
+            else:
+                stream = [getattr(v, STREAM_ATTRIBUTES[name]) for v in self.vertices]
+
+            if stream is not None and all(x is None for x in stream):
+                stream = None
+
+            self.streams[stream_key] = stream
+
+        return self.streams[stream_key]
+
+    @property
+    def positions(self) -> List[Tuple[float, float, float]]:
+        return self.get_stream('positions')
+
+    @property
+    def normals(self) -> Optional[List[Tuple[float, float, float]]]:
+        return self.get_stream('normals')
+
+    @property
+    def tangents(self) -> Optional[List[Tuple[float, float, float, float]]]:
+        return self.get_stream('tangents')
+
+    @property
+    def bitangents(self) -> Optional[List[Tuple[float, float, float, float]]]:
+        return self.get_stream('bitangents')
+
+    @property
+    def colors(self) -> Optional[List[Tuple[int, int, int, int]]]:
+        return self.get_stream('colors')
+
+    def get_uvs(self, channel=0) -> Optional[List[Tuple[float, float]]]:
+        return self.get_stream('uvs', channel)
+
+    @property
+    def bone_ids(self) -> Optional[List[Tuple[int, int, int, int]]]:
+        return self.get_stream('bone_ids')
+
+    @property
+    def bone_weights(self) -> Optional[List[Tuple[float, float, float, float]]]:
+        return self.get_stream('bone_weights')
+
+    def is_over_limits(self, max_vertices=None, max_faces=None) -> bool:
+        return len(self.vertices) > (max_vertices or self.MAX_VERTICES) or len(self.faces) > (max_faces or self.MAX_FACES)
+
+    def split(self, max_vertices=None, max_faces=None) -> List['NudMesh']:
+        """Splits the faces of the mesh into multiple meshes that are within the vertex and face limits.\n
+        Faces are grouped by the most weighted bone of their first vertex, so that each part uses as few bones as possible.
+        Only the vertices that are shared between parts are duplicated, and vertices that are not used by any face are removed.
+        The vertex objects themselves are not copied.
+        :return: A list of the new meshes, or a list with this mesh if it is already within the limits
+        """
+        max_vertices = max_vertices or self.MAX_VERTICES
+        max_faces = max_faces or self.MAX_FACES
+
+        if not self.is_over_limits(max_vertices, max_faces):
+            return [self]
+
+        faces = [tuple(f) for f in self.faces]
+
+        if self.has_bones():
+            # Most weighted bone of each vertex
+            main_bones = [v.bone_ids[max(range(len(v.bone_weights)), key=v.bone_weights.__getitem__)] for v in self.vertices]
+            faces.sort(key=lambda f: main_bones[f[0]])
+
+        # Index of each vertex in the current part, valid only if its part number matches the current part
+        local_indices = [0] * len(self.vertices)
+        vertex_parts = [-1] * len(self.vertices)
+
+        parts = list()
+        part_faces = list()
+        part_vertices = list()
+
+        def add_part():
+            mesh = copy.copy(self)
+            mesh.vertices = [self.vertices[v] for v in part_vertices]
+            mesh.faces = part_faces
+            mesh.materials = list(self.materials)
+            mesh.invalidate()
+            parts.append(mesh)
+
+        for face in faces:
+            new_vertices = sum(1 for v in set(face) if vertex_parts[v] != len(parts))
+
+            if len(part_faces) + 1 > max_faces or len(part_vertices) + new_vertices > max_vertices:
+                add_part()
+                part_faces = list()
+                part_vertices = list()
+
+            part = len(parts)
+            for v in face:
+                if vertex_parts[v] != part:
+                    vertex_parts[v] = part
+                    local_indices[v] = len(part_vertices)
+                    part_vertices.append(v)
+
+            part_faces.append((local_indices[face[0]], local_indices[face[1]], local_indices[face[2]]))
+
+        if part_faces:
+            add_part()
+
+        return parts
+
+    def get_write_meshes(self) -> List['NudMesh']:
+        """Returns the meshes that are written in place of this mesh: its parts (see `split`), which are optimized
+        and compacted if `optimize_on_write` and `compact_on_write` are set.\n
+        The faces, vertices list and formats of this mesh are never changed, but missing tangents are calculated for
+        meshes with a tangent vertex type (see `generate_tangents`).
+        """
+        parts = self.split()
+
+        # The parts are already copies if the mesh was split
+        if (self.optimize_on_write or self.compact_on_write) and parts[0] is self:
+            parts = [copy.copy(self)]
+
+        if self.optimize_on_write:
+            # The ACMR of all parts is the total number of cache misses over the total number of faces
+            misses = [0.0, 0.0]
+            for part in parts:
+                before, after = optimize_vertex_cache(part)
+                misses[0] += before * len(part.faces)
+                misses[1] += after * len(part.faces)
+
+            face_count = sum(len(part.faces) for part in parts)
+            self.write_acmr = tuple(m / face_count for m in misses) if face_count else (0.0, 0.0)
+
+        # Vertices without tangents would be written as zeros (or not at all with half floats), so calculate them.
+        # This has to be done before compacting, as the compact formats can only be used if all vertices have tangents
+        if self.vertex_type in (NudVertexType.NormalsTanBiTanFloat, NudVertexType.NormalsTanBiTanHalfFloat):
+            for part in parts:
+                generate_tangents(part)
+
+        if self.compact_on_write:
+            sizes = [part.compact_vertex_formats() for part in parts]
+            self.write_vertex_sizes = (sum(s[0] for s in sizes), sum(s[1] for s in sizes))
+
+        return parts
+
+    def compact_vertex_formats(self, normal_error=NORMAL_ERROR, weight_error=WEIGHT_ERROR) -> Tuple[int, int]:
+        """Changes the vertex, bone and UV types to the most compact ones within the error budgets.
+        :return: A tuple of the size of the vertices (in bytes) before and after changing the types
+        """
+        return compact_vertex_formats(self, normal_error, weight_error)
+
     def has_bones(self):
         return bool(self.vertices and self.vertices[0].bone_ids)
 
@@ -95,7 +412,7 @@ class NudMesh:
 
         if faceSize & 0x40:
             # 0x40 format does not have -1 indices nor changing directions
-            self.faces = zip(faces, faces, faces)
+            self.faces = list(zip(faces, faces, faces))
             return
 
         self.faces = list()
@@ -135,6 +452,118 @@ class NudMesh:
             self.materials.append(material)
 
 
+class NudMeshStats:
+    """Bone range, bounding box and bounding sphere of a list of vertices."""
+
+    # (min, max) of the bone IDs, or None if the vertices do not have bones
+    bone_range: Optional[Tuple[int, int]]
+
+    # (min, max) corners, or None if there are no vertices
+    bounding_box: Optional[Tuple[Tuple[float, float, float], Tuple[float, float, float]]]
+
+    # (x, y, z, radius)
+    bounding_sphere: Tuple[float, float, float, float]
+
+    def __init__(self, vertices: List['NudVertex']):
+        self.bone_range = None
+        if vertices and vertices[0].bone_ids:
+            bone_ids = list(chain.from_iterable(v.bone_ids for v in vertices))
+            self.bone_range = (min(bone_ids), max(bone_ids))
+
+        positions = [v.position for v in vertices]
+
+        self.bounding_box = None
+        self.bounding_sphere = (0.0, 0.0, 0.0, 0.0)
+
+        if positions:
+            xs, ys, zs = zip(*positions)
+            self.bounding_box = ((min(xs), min(ys), min(zs)), (max(xs), max(ys), max(zs)))
+            self.bounding_sphere = get_bounding_sphere(positions, self.bounding_box)
+
+
+def get_bounding_sphere(positions: List[Tuple[float, float, float]],
+                        bounding_box: Tuple[Tuple[float, float, float], Tuple[float, float, float]]) -> Tuple[float, float, float, float]:
+    """Returns a sphere that contains all of the positions, using Ritter's algorithm.\n
+    The sphere around the center of the bounding box is used instead if it is smaller.
+    """
+    # Sphere around the center of the bounding box
+    (x0, y0, z0), (x1, y1, z1) = bounding_box
+    bx, by, bz = (x0 + x1) / 2, (y0 + y1) / 2, (z0 + z1) / 2
+    box_radius = sqrt(max((x - bx) ** 2 + (y - by) ** 2 + (z - bz) ** 2 for x, y, z in positions))
+
+    # Start with the two points that are (roughly) the farthest apart
+    px, py, pz = positions[0]
+    distances = [(x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2 for x, y, z in positions]
+    px, py, pz = positions[distances.index(max(distances))]
+    distances = [(x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2 for x, y, z in positions]
+    qx, qy, qz = positions[distances.index(max(distances))]
+
+    cx, cy, cz = (px + qx) / 2, (py + qy) / 2, (pz + qz) / 2
+    radius = sqrt(max(distances)) / 2
+
+    # Every expanded sphere contains the previous one, so only the points outside of the first sphere have to be checked
+    radius_sq = radius ** 2
+    for x, y, z in [p for p in positions if (p[0] - cx) ** 2 + (p[1] - cy) ** 2 + (p[2] - cz) ** 2 > radius_sq]:
+        distance = sqrt((x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2)
+        if distance > radius:
+            new_radius = (radius + distance) / 2
+            t = (new_radius - radius) / distance
+            cx, cy, cz = cx + (x - cx) * t, cy + (y - cy) * t, cz + (z - cz) * t
+            radius = new_radius
+
+    if box_radius < radius:
+        return (bx, by, bz, box_radius)
+
+    return (cx, cy, cz, radius)
+
+
+def merge_bounding_boxes(boxes: Iterable[Optional[Tuple[Tuple[float, float, float], Tuple[float, float, float]]]]):
+    boxes = [b for b in boxes if b]
+    if not boxes:
+        return None
+
+    return (tuple(min(b[0][i] for b in boxes) for i in range(3)),
+            tuple(max(b[1][i] for b in boxes) for i in range(3)))
+
+
+def sphere_contains(outer: Tuple[float, float, float, float], inner: Tuple[float, float, float, float]) -> bool:
+    """Returns True if the outer sphere contains the inner sphere, allowing for the precision of 32-bit floats."""
+    (x0, y0, z0, r0), (x1, y1, z1, r1) = outer, inner
+    distance = sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2 + (z1 - z0) ** 2)
+
+    return distance + r1 <= r0 + 1e-5 * max(1.0, r0, abs(x0), abs(y0), abs(z0))
+
+
+def merge_bounding_spheres(spheres: Iterable[Tuple[float, float, float, float]]) -> Tuple[float, float, float, float]:
+    """Returns a sphere that contains all of the spheres. Spheres with a radius of 0 are ignored."""
+    result = None
+
+    for sphere in spheres:
+        if not sphere[3]:
+            continue
+
+        if result is None:
+            result = sphere
+            continue
+
+        (cx, cy, cz, radius), (x, y, z, r) = result, sphere
+        distance = sqrt((x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2)
+
+        if distance + r <= radius:
+            # Already contained
+            continue
+
+        if distance + radius <= r:
+            result = sphere
+            continue
+
+        new_radius = (distance + radius + r) / 2
+        t = (new_radius - radius) / distance
+        result = (cx + (x - cx) * t, cy + (y - cy) * t, cz + (z - cz) * t, new_radius)
+
+    return tuple(result) if result else (0.0, 0.0, 0.0, 0.0)
+
+
 class NudVertex:
     position: Tuple[float, float, float]
     normal: Tuple[float, float, float]
@@ -159,18 +588,25 @@ class NudVertex:
         self.bone_ids = br_vertex.boneIds
         self.bone_weights = br_vertex.boneWeights
 
+    def get_key(self) -> tuple:
+        """Returns a hashable tuple of all attributes. Attributes that are None stay None."""
+        return (tuple(self.position),
+                tuple(self.normal) if self.normal is not None else None,
+                tuple(self.tangent) if self.tangent is not None else None,
+                tuple(self.bitangent) if self.bitangent is not None else None,
+                tuple(self.color) if self.color is not None else None,
+                tuple(map(tuple, self.uv)) if self.uv is not None else None,
+                tuple(self.bone_ids) if self.bone_ids is not None else None,
+                tuple(self.bone_weights) if self.bone_weights is not None else None)
+
     def __eq__(self, o: 'NudVertex') -> bool:
-        return all(map(lambda x, y: x == y, self.position, o.position)) \
-            and all(map(lambda x, y: x == y, self.normal, o.normal)) \
-            and all(map(lambda x, y: all(map(lambda a, b: a == b, x, y)), self.uv, o.uv)) \
-            and all(map(lambda x, y: x == y, self.tangent, o.tangent)) \
-            and all(map(lambda x, y: x == y, self.bitangent, o.bitangent)) \
-            and all(map(lambda x, y: x == y, self.color, o.color)) \
-            and all(map(lambda x, y: x == y, self.bone_ids, o.bone_ids)) \
-            and all(map(lambda x, y: x == y, self.bone_weights, o.bone_weights))
+        if not isinstance(o, NudVertex):
+            return NotImplemented
+
+        return self.get_key() == o.get_key()
 
     def __hash__(self) -> int:
-        return hash(tuple(self.position)) ^ hash(tuple(self.normal)) ^ hash(tuple(self.color)) ^ hash(tuple(self.uv))
+        return hash(self.get_key())
 
 
 class NudMaterial:
@@ -0,0 +1,138 @@
+import struct
+from itertools import chain
+from math import inf
+from typing import List, Tuple
+
+from .br.br_nud import NudBoneType, NudUvType, NudVertexType
+
+# Max absolute error for normals, tangents and bitangents when converting them to half floats
+NORMAL_ERROR = 1e-3
+
+# Max absolute error for bone weights when converting them to half floats or bytes.
+# Byte weights have an error of up to 1/510, so they are used by default if the bone IDs fit
+WEIGHT_ERROR = 2e-3
+
+# Size of the normals/tangents part of a vertex for each vertex type (including the position)
+VERTEX_TYPE_SIZES = {
+    NudVertexType.NoNormals: 0x10,
+    NudVertexType.NormalsFloat: 0x20,
+    NudVertexType.Unknown: 0x40,
+    NudVertexType.NormalsTanBiTanFloat: 0x40,
+    NudVertexType.NormalsHalfFloat: 0x14,
+    NudVertexType.NormalsTanBiTanHalfFloat: 0x24,
+}
+
+# Size of the bone IDs and weights of a vertex for each bone type
+BONE_TYPE_SIZES = {
+    NudBoneType.NoBones: 0,
+    NudBoneType.Float: 0x20,
+    NudBoneType.HalfFloat: 0x10,
+    NudBoneType.Byte: 0x8,
+}
+
+# Size of the color of a vertex for each UV type. Meshes without bones always store colors as bytes
+UV_TYPE_SIZES = {
+    NudUvType.Null: 0,
+    NudUvType.Byte: 4,
+    NudUvType.HalfFloat: 8,
+}
+
+# Float vertex types and the half float types that store the same attributes
+HALF_FLOAT_VERTEX_TYPES = {
+    NudVertexType.NormalsFloat: NudVertexType.NormalsHalfFloat,
+    NudVertexType.NormalsTanBiTanFloat: NudVertexType.NormalsTanBiTanHalfFloat,
+}
+
+
+def get_vertex_size(vertex_type: NudVertexType, bone_type: NudBoneType, uv_type: NudUvType, uv_channel_count: int) -> int:
+    """Returns the total size of a vertex in the vertClump and vertAddClump buffers."""
+    if bone_type == NudBoneType.NoBones:
+        color_size = 4 if uv_type else 0
+    else:
+        color_size = UV_TYPE_SIZES[uv_type]
+
+    return VERTEX_TYPE_SIZES[vertex_type] + BONE_TYPE_SIZES[bone_type] + color_size + (uv_channel_count * 4)
+
+
+def get_mesh_vertex_size(mesh: 'NudMesh') -> int:
+    """Returns the size of all vertices of a mesh, using the formats that the writer will use."""
+    bone_type = mesh.bone_type if mesh.has_bones() else NudBoneType.NoBones
+    uv_type = mesh.uv_type if mesh.has_color() else NudUvType.Null
+
+    return len(mesh.vertices) * get_vertex_size(mesh.vertex_type, bone_type, uv_type, mesh.get_uv_channel_count())
+
+
+def get_half_float_error(values: List[float]) -> float:
+    """Returns the max absolute error of converting the values to half floats, or inf if some values do not fit."""
+    if not values:
+        return 0.0
+
+    fmt = f'<{len(values)}e'
+
+    try:
+        rounded = struct.unpack(fmt, struct.pack(fmt, *values))
+    except (OverflowError, struct.error):
+        return inf
+
+    return max(abs(a - b) for a, b in zip(values, rounded))
+
+
+def get_byte_weight_error(values: List[float]) -> float:
+    """Returns the max absolute error of storing the weights as bytes (weight * 255), or inf if some weights do not fit."""
+    if not values:
+        return 0.0
+
+    if min(values) < 0 or max(values) > 1:
+        return inf
+
+    return max(abs(w - round(w * 255) / 255) for w in values)
+
+
+def select_vertex_formats(mesh: 'NudMesh', normal_error=NORMAL_ERROR,
+                          weight_error=WEIGHT_ERROR) -> Tuple[NudVertexType, NudBoneType, NudUvType]:
+    """Returns the most compact vertex, bone and UV types that can store the vertices of a mesh within the error budgets.\n
+    Positions and UVs are never changed, and attributes are never removed (e.g. tangents are kept if the mesh has them).
+    """
+    vertices = mesh.vertices
+    vertex_type, bone_type, uv_type = mesh.vertex_type, mesh.bone_type, mesh.uv_type
+
+    if vertex_type in HALF_FLOAT_VERTEX_TYPES and vertices:
+        attributes = [v.normal for v in vertices]
+        if vertex_type == NudVertexType.NormalsTanBiTanFloat:
+            attributes += [v.tangent and v.tangent[:3] for v in vertices]
+            attributes += [v.bitangent and v.bitangent[:3] for v in vertices]
+
+        # Missing attributes can only be written by the float types
+        if all(attributes) and get_half_float_error(list(chain.from_iterable(attributes))) <= normal_error:
+            vertex_type = HALF_FLOAT_VERTEX_TYPES[vertex_type]
+
+    # Meshes with a NoBones type are written without bones even if their vertices have bone IDs, so they are not changed
+    if mesh.has_bones() and bone_type in (NudBoneType.Float, NudBoneType.HalfFloat):
+        bone_ids = list(chain.from_iterable(v.bone_ids for v in vertices))
+        bone_weights = list(chain.from_iterable(v.bone_weights for v in vertices))
+
+        if min(bone_ids) >= 0 and max(bone_ids) <= 0xFF and get_byte_weight_error(bone_weights) <= weight_error:
+            bone_type = NudBoneType.Byte
+        elif (bone_type == NudBoneType.Float and min(bone_ids) >= 0 and max(bone_ids) <= 0xFFFF
+              and get_half_float_error(bone_weights) <= weight_error):
+            bone_type = NudBoneType.HalfFloat
+
+    if mesh.has_color() and uv_type == NudUvType.HalfFloat:
+        # Colors are stored as integers, so bytes are lossless if they are in range.
+        # Half float colors are also truncated when reading, so bytes are always better
+        colors = list(chain.from_iterable(v.color for v in vertices))
+        if min(colors) >= 0 and max(colors) <= 0xFF:
+            uv_type = NudUvType.Byte
+
+    return vertex_type, bone_type, uv_type
+
+
+def compact_vertex_formats(mesh: 'NudMesh', normal_error=NORMAL_ERROR, weight_error=WEIGHT_ERROR) -> Tuple[int, int]:
+    """Changes the vertex, bone and UV types of a mesh to the most compact ones within the error budgets
+    (see `select_vertex_formats`).
+    :return: A tuple of the size of the mesh's vertices (in bytes) before and after changing the types
+    """
+    before = get_mesh_vertex_size(mesh)
+    mesh.vertex_type, mesh.bone_type, mesh.uv_type = select_vertex_formats(mesh, normal_error, weight_error)
+
+    return before, get_mesh_vertex_size(mesh)
@@ -0,0 +1,155 @@
+from collections import deque
+from typing import List, Tuple
+
+# Triangle and vertex reordering for the post-transform vertex cache, using Tipsify:
+# Sander, Nehab and Barczak, "Fast Triangle Reordering for Vertex Locality and Reduced Overdraw" (2007)
+
+# Number of vertices in the simulated post-transform cache
+VERTEX_CACHE_SIZE = 16
+
+
+def get_acmr(faces: List[Tuple[int, int, int]], cache_size=VERTEX_CACHE_SIZE) -> float:
+    """Returns the average cache miss ratio (transformed vertices per triangle) of the faces, using a FIFO cache.\n
+    Values are between 0.5 (best possible) and 3 (no vertex reuse at all).
+    """
+    if not faces:
+        return 0.0
+
+    cache = deque()
+    cached = set()
+    misses = 0
+
+    for face in faces:
+        for v in face:
+            if v not in cached:
+                misses += 1
+                cache.append(v)
+                cached.add(v)
+
+                if len(cache) > cache_size:
+                    cached.discard(cache.popleft())
+
+    return misses / len(faces)
+
+
+def optimize_face_order(faces: List[Tuple[int, int, int]], vertex_count: int,
+                        cache_size=VERTEX_CACHE_SIZE) -> List[Tuple[int, int, int]]:
+    """Returns the faces reordered for the post-transform vertex cache."""
+    face_count = len(faces)
+    if not face_count:
+        return list()
+
+    # Triangles that use each vertex, as a flat array with an offset for each vertex
+    live = [0] * vertex_count
+    for face in faces:
+        for v in face:
+            live[v] += 1
+
+    offsets = [0] * (vertex_count + 1)
+    for v in range(vertex_count):
+        offsets[v + 1] = offsets[v] + live[v]
+
+    adjacency = [0] * offsets[-1]
+    fill = offsets[:-1]
+    for t, face in enumerate(faces):
+        for v in face:
+            adjacency[fill[v]] = t
+            fill[v] += 1
+
+    # Time stamp of when each vertex entered the cache
+    cache_time = [0] * vertex_count
+    emitted = bytearray(face_count)
+    dead_end = list()
+    result = list()
+
+    time = cache_size + 1
+    cursor = 0
+    fan = faces[0][0]
+
+    while fan >= 0:
+        candidates = list()
+
+        for t in adjacency[offsets[fan]: offsets[fan + 1]]:
+            if emitted[t]:
+                continue
+
+            emitted[t] = 1
+            face = faces[t]
+            result.append(face)
+
+            for v in face:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+
+                if time - cache_time[v] > cache_size:
+                    cache_time[v] = time
+                    time += 1
+
+        # Next fanning vertex: the candidate that will still be in the cache after its remaining triangles are emitted,
+        # and that entered the cache the earliest
+        fan = -1
+        best = -1
+        for v in candidates:
+            if live[v]:
+                priority = 0
+                if time - cache_time[v] + 2 * live[v] <= cache_size:
+                    priority = time - cache_time[v]
+
+                if priority > best:
+                    best = priority
+                    fan = v
+
+        if fan == -1:
+            # Dead end: use the most recent vertex that still has triangles, or the next one in the vertex order
+            while dead_end:
+                v = dead_end.pop()
+                if live[v]:
+                    fan = v
+                    break
+            else:
+                while cursor < vertex_count:
+                    if live[cursor]:
+                        fan = cursor
+                        break
+                    cursor += 1
+
+    return result
+
+
+def get_vertex_order(faces: List[Tuple[int, int, int]], vertex_count: int) -> Tuple[List[int], List[int]]:
+    """Returns the order of the vertices by their first use in the faces, and the new index of each old vertex.\n
+    Vertices that are not used by any face are moved to the end.
+    """
+    remap = [-1] * vertex_count
+    order = list()
+
+    for face in faces:
+        for v in face:
+            if remap[v] == -1:
+                remap[v] = len(order)
+                order.append(v)
+
+    for v in range(vertex_count):
+        if remap[v] == -1:
+            remap[v] = len(order)
+            order.append(v)
+
+    return order, remap
+
+
+def optimize_vertex_cache(mesh: 'NudMesh', cache_size=VERTEX_CACHE_SIZE) -> Tuple[float, float]:
+    """Reorders the faces of a mesh for the post-transform vertex cache, then reorders its vertices by their first use.\n
+    The mesh is modified in place.
+    :return: A tuple of the ACMR (average cache miss ratio) of the faces before and after optimizing
+    """
+    faces = [tuple(f) for f in mesh.faces]
+    before = get_acmr(faces, cache_size)
+
+    faces = optimize_face_order(faces, len(mesh.vertices), cache_size)
+    order, remap = get_vertex_order(faces, len(mesh.vertices))
+
+    mesh.vertices = [mesh.vertices[v] for v in order]
+    mesh.faces = [(remap[a], remap[b], remap[c]) for a, b, c in faces]
+
+    return before, get_acmr(mesh.faces, cache_size)
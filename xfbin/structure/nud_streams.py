@@ -0,0 +1,133 @@
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from .br.br_nud import NudBoneType, NudUvType, NudVertexType
+
+# Vertex attributes can be decoded one at a time, straight from the vertClump/vertAddClump bytes of a mesh.
+# Each attribute is unpacked for all vertices at once with a struct format that skips the rest of the vertex.
+
+STREAM_NAMES = ('positions', 'normals', 'tangents', 'bitangents', 'colors', 'uvs', 'bone_ids', 'bone_weights')
+
+# NudVertex attribute of each stream
+STREAM_ATTRIBUTES = {
+    'positions': 'position',
+    'normals': 'normal',
+    'tangents': 'tangent',
+    'bitangents': 'bitangent',
+    'colors': 'color',
+    'uvs': 'uv',
+    'bone_ids': 'bone_ids',
+    'bone_weights': 'bone_weights',
+}
+
+# (offset, format) of the normals, bitangents and tangents after the position, and the size of that part of the vertex
+VERTEX_TYPE_LAYOUTS = {
+    NudVertexType.NoNormals: (dict(), 0x10),
+    NudVertexType.NormalsFloat: (dict(normals=(0x10, '3f')), 0x20),
+    NudVertexType.Unknown: (dict(normals=(0xC, '3f')), 0x40),
+    NudVertexType.NormalsTanBiTanFloat: (dict(normals=(0x10, '3f'), bitangents=(0x20, '4f'), tangents=(0x30, '4f')), 0x40),
+    NudVertexType.NormalsHalfFloat: (dict(normals=(0xC, '3e')), 0x14),
+    NudVertexType.NormalsTanBiTanHalfFloat: (dict(normals=(0xC, '3e'), bitangents=(0x14, '4e'), tangents=(0x1C, '4e')), 0x24),
+}
+
+# (bone IDs format, bone weights format) for each bone type
+BONE_TYPE_FORMATS = {
+    NudBoneType.Float: ('4I', '4f'),
+    NudBoneType.HalfFloat: ('4H', '4e'),
+    NudBoneType.Byte: ('4B', '4B'),
+}
+
+# Color format of meshes with bones for each UV type
+COLOR_FORMATS = {
+    NudUvType.Byte: '4B',
+    NudUvType.HalfFloat: '4e',
+}
+
+
+class NudVertexLayout:
+    """Offsets and formats of the vertex attributes of a mesh, as they are stored by BrNudMesh.\n
+    Meshes with bones store their colors and UVs in the vertClump, and everything else in the vertAddClump.
+    Meshes without bones store everything in the vertClump.
+    """
+
+    # Attribute key -> (True if it is in the vertAddClump, offset in the vertex, struct format).
+    # UV channels use ('uvs', channel) as their key
+    attributes: Dict[object, Tuple[bool, int, str]]
+
+    # Size of each vertex in the vertClump and vertAddClump
+    stride: int
+    add_stride: int
+
+    def __init__(self, vertex_size: int, uv_size: int):
+        vertex_type = NudVertexType(vertex_size & 0x0F)
+        bone_type = NudBoneType(vertex_size & 0xF0)
+        uv_type = NudUvType(uv_size & 0x0F)
+        uv_count = uv_size >> 4
+
+        if vertex_type not in VERTEX_TYPE_LAYOUTS:
+            raise Exception(f'Unsupported vertex type: {vertex_type}')
+
+        if bone_type != NudBoneType.NoBones and bone_type not in BONE_TYPE_FORMATS:
+            raise Exception(f'Unsupported bone type: {bone_type}')
+
+        has_bones = bone_type != NudBoneType.NoBones
+        normal_layout, offset = VERTEX_TYPE_LAYOUTS[vertex_type]
+
+        self.attributes = dict(positions=(has_bones, 0, '3f'))
+        self.attributes.update({k: (has_bones, o, f) for k, (o, f) in normal_layout.items()})
+
+        if has_bones:
+            ids_format, weights_format = BONE_TYPE_FORMATS[bone_type]
+            self.attributes['bone_ids'] = (True, offset, ids_format)
+            self.attributes['bone_weights'] = (True, offset + struct.calcsize('>' + ids_format), weights_format)
+            self.add_stride = offset + struct.calcsize('>' + ids_format + weights_format)
+
+            # Colors and UVs in the vertClump
+            offset = 0
+            if uv_type in COLOR_FORMATS:
+                self.attributes['colors'] = (False, 0, COLOR_FORMATS[uv_type])
+                offset = struct.calcsize('>' + COLOR_FORMATS[uv_type])
+        else:
+            self.add_stride = 0
+
+            # Same condition as BrNudVertex
+            if uv_size >= 18:
+                self.attributes['colors'] = (False, offset, '4B')
+                offset += 4
+
+        for i in range(uv_count):
+            self.attributes[('uvs', i)] = (False, offset + i * 4, '2e')
+
+        self.stride = offset + uv_count * 4
+
+
+def read_stream(br_mesh: 'BrNudMesh', name: str, channel=0) -> Optional[List[tuple]]:
+    """Decodes a single vertex attribute of all vertices of a mesh from the NUD's buffer.\n
+    The values are the same as the ones of the decoded NudVertex objects.
+    :param name: One of STREAM_NAMES
+    :param channel: UV channel, only used with 'uvs'
+    :return: A list with a tuple for each vertex, or None if the mesh does not have the attribute
+    """
+    if name not in STREAM_NAMES:
+        raise Exception(f'Unknown vertex stream: {name}')
+
+    layout = NudVertexLayout(br_mesh.vertexSize, br_mesh.uvSize)
+    attribute = layout.attributes.get(('uvs', channel) if name == 'uvs' else name)
+    if attribute is None:
+        return None
+
+    in_add_clump, offset, fmt = attribute
+    stride = layout.add_stride if in_add_clump else layout.stride
+    start = br_mesh.vertAddClumpStart if in_add_clump else br_mesh.vertClumpStart
+    size = struct.calcsize('>' + fmt)
+
+    # Skip the bytes before and after the attribute in each vertex
+    data = memoryview(br_mesh.buffer)[start: start + stride * br_mesh.vertexCount]
+    values = list(struct.iter_unpack(f'>{offset}x{fmt}{stride - offset - size}x', data))
+
+    if name == 'bone_weights' and fmt == '4B':
+        values = [tuple(x / 255 for x in v) for v in values]
+    elif name == 'colors' and fmt == '4e':
+        values = [tuple(int(x * 255) for x in v) for v in values]
+
+    return values
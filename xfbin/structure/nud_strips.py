@@ -0,0 +1,91 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# NUD faces are stored as triangle strips separated by -1 (restart) indices.
+# Each strip starts with a front facing triangle, and every other triangle in a strip has its winding flipped,
+# so a triangle (a, b, c) can only follow a triangle that ends with the edge (a, b) if it has the opposite parity.
+
+STRIP_RESTART = -1
+
+
+def stripify(faces: Iterable[Tuple[int, int, int]], window: Optional[int] = None) -> List[List[int]]:
+    """Converts a list of triangles to a list of triangle strips, keeping the winding of each triangle.\n
+    Degenerate triangles are removed, as they are skipped when reading.\n
+    Strips are started from the triangles with the fewest neighbors first, which gives longer strips.
+    If window is given, strips are started in the order of the triangles instead, and can only contain triangles that
+    are less than window triangles away from the first one. This keeps a triangle order that was optimized for the
+    vertex cache, at the cost of shorter strips.
+    """
+    faces = [tuple(f) for f in faces if f[0] != f[1] and f[1] != f[2] and f[0] != f[2]]
+
+    # Directed edge -> list of (face index, opposite vertex)
+    edges: Dict[Tuple[int, int], List[Tuple[int, int]]] = dict()
+    for i, (a, b, c) in enumerate(faces):
+        edges.setdefault((a, b), list()).append((i, c))
+        edges.setdefault((b, c), list()).append((i, a))
+        edges.setdefault((c, a), list()).append((i, b))
+
+    if window:
+        start_order = range(len(faces))
+    else:
+        # Number of triangles that share an edge with each triangle (in the opposite direction)
+        def neighbor_count(i):
+            a, b, c = faces[i]
+            return len(edges.get((b, a), ())) + len(edges.get((c, b), ())) + len(edges.get((a, c), ()))
+
+        start_order = sorted(range(len(faces)), key=neighbor_count)
+
+    used = bytearray(len(faces))
+
+    def extend(strip: List[int], strip_faces: List[int]):
+        while True:
+            # Even triangles continue the directed edge of the last two indices, odd ones continue the reversed edge
+            edge = (strip[-1], strip[-2]) if len(strip) % 2 else (strip[-2], strip[-1])
+
+            for face, vertex in edges.get(edge, ()):
+                if not used[face] and (not window or abs(face - strip_faces[0]) < window):
+                    used[face] = 1
+                    strip.append(vertex)
+                    strip_faces.append(face)
+                    break
+            else:
+                return
+
+    strips = list()
+    for start in start_order:
+        if used[start]:
+            continue
+
+        a, b, c = faces[start]
+        best_strip = best_faces = None
+
+        # Try starting from each edge of the triangle and keep the longest strip
+        for rotation in ((a, b, c), (b, c, a), (c, a, b)):
+            used[start] = 1
+            strip = list(rotation)
+            strip_faces = [start]
+            extend(strip, strip_faces)
+
+            for face in strip_faces:
+                used[face] = 0
+
+            if best_strip is None or len(strip) > len(best_strip):
+                best_strip, best_faces = strip, strip_faces
+
+        for face in best_faces:
+            used[face] = 1
+
+        strips.append(best_strip)
+
+    return strips
+
+
+def join_strips(strips: List[List[int]]) -> List[int]:
+    """Returns the indices of all strips, separated by restart indices."""
+    result = list()
+
+    for strip in strips:
+        if result:
+            result.append(STRIP_RESTART)
+        result.extend(strip)
+
+    return result
@@ -0,0 +1,112 @@
+from math import sqrt
+from typing import List
+
+# Tangents are calculated from the first UV channel, by accumulating the UV gradient of each triangle on its vertices
+# (Lengyel's method), then orthogonalizing them against the normals.
+# Tangents have the handedness of the tangent space as their 4th component, and bitangents are cross(normal, tangent)
+
+
+def generate_tangents(mesh: 'NudMesh', overwrite=False) -> int:
+    """Calculates the tangents and bitangents of the vertices of a mesh that do not have them.\n
+    Vertices that do not have normals use the average normal of their faces for the calculation.
+    Meshes without UVs get an arbitrary tangent that is perpendicular to each normal.
+    :param overwrite: If True, the tangents and bitangents of all vertices will be calculated again
+    :return: The number of vertices that were changed
+    """
+    vertices = mesh.vertices
+    targets = [i for i, v in enumerate(vertices) if overwrite or not (v.tangent and v.bitangent)]
+    if not targets:
+        return 0
+
+    count = len(vertices)
+
+    # Flat arrays of the accumulated tangents, bitangents and face normals (x, y, z for each vertex)
+    tangents = [0.0] * (count * 3)
+    bitangents = [0.0] * (count * 3)
+    face_normals = [0.0] * (count * 3)
+
+    positions = [v.position for v in vertices]
+    uvs = [v.uv[0] if v.uv else (0.0, 0.0) for v in vertices]
+
+    for face in mesh.faces:
+        a, b, c = face
+        (x0, y0, z0), (x1, y1, z1), (x2, y2, z2) = positions[a], positions[b], positions[c]
+        (u0, v0), (u1, v1), (u2, v2) = uvs[a], uvs[b], uvs[c]
+
+        e1x, e1y, e1z = x1 - x0, y1 - y0, z1 - z0
+        e2x, e2y, e2z = x2 - x0, y2 - y0, z2 - z0
+        du1, dv1 = u1 - u0, v1 - v0
+        du2, dv2 = u2 - u0, v2 - v0
+
+        # Area weighted normal
+        nx, ny, nz = e1y * e2z - e1z * e2y, e1z * e2x - e1x * e2z, e1x * e2y - e1y * e2x
+
+        det = du1 * dv2 - du2 * dv1
+        if det:
+            r = 1.0 / det
+            tx, ty, tz = (e1x * dv2 - e2x * dv1) * r, (e1y * dv2 - e2y * dv1) * r, (e1z * dv2 - e2z * dv1) * r
+            bx, by, bz = (e2x * du1 - e1x * du2) * r, (e2y * du1 - e1y * du2) * r, (e2z * du1 - e1z * du2) * r
+        else:
+            tx = ty = tz = bx = by = bz = 0.0
+
+        for i in (a * 3, b * 3, c * 3):
+            tangents[i] += tx
+            tangents[i + 1] += ty
+            tangents[i + 2] += tz
+            bitangents[i] += bx
+            bitangents[i + 1] += by
+            bitangents[i + 2] += bz
+            face_normals[i] += nx
+            face_normals[i + 1] += ny
+            face_normals[i + 2] += nz
+
+    for index in targets:
+        vertex = vertices[index]
+        i = index * 3
+
+        if vertex.normal:
+            nx, ny, nz = vertex.normal[:3]
+        else:
+            nx, ny, nz = face_normals[i: i + 3]
+
+        length = sqrt(nx * nx + ny * ny + nz * nz)
+        if length:
+            nx, ny, nz = nx / length, ny / length, nz / length
+        else:
+            nx, ny, nz = 0.0, 1.0, 0.0
+
+        # Gram-Schmidt orthogonalize
+        tx, ty, tz = tangents[i: i + 3]
+        d = nx * tx + ny * ty + nz * tz
+        tx, ty, tz = tx - nx * d, ty - ny * d, tz - nz * d
+
+        length = sqrt(tx * tx + ty * ty + tz * tz)
+        if length < 1e-12:
+            # No usable UV gradient, so use any direction that is perpendicular to the normal
+            tx, ty, tz = get_perpendicular(nx, ny, nz)
+        else:
+            tx, ty, tz = tx / length, ty / length, tz / length
+
+        # Bitangent from the normal and the tangent, flipped if the UVs are mirrored
+        bx, by, bz = ny * tz - nz * ty, nz * tx - nx * tz, nx * ty - ny * tx
+        handedness = -1.0 if (bx * bitangents[i] + by * bitangents[i + 1] + bz * bitangents[i + 2]) < 0 else 1.0
+
+        vertex.tangent = (tx, ty, tz, handedness)
+        vertex.bitangent = (bx * handedness, by * handedness, bz * handedness, 1.0)
+
+    # The vertices were edited in place
+    mesh.invalidate()
+
+    return len(targets)
+
+
+def get_perpendicular(x: float, y: float, z: float) -> List[float]:
+    """Returns a unit vector that is perpendicular to a unit vector."""
+    # Cross with the axis that is the least parallel to the vector
+    if abs(x) < 0.9:
+        px, py, pz = 0.0, z, -y
+    else:
+        px, py, pz = -z, 0.0, x
+
+    length = sqrt(px * px + py * py + pz * pz)
+    return [px / length, py / length, pz / length]
@@ -0,0 +1,101 @@
+from itertools import chain, repeat
+from operator import mul
+from typing import List, Optional, Sequence, Tuple
+
+# Vertices are welded by quantizing each of their attributes to a grid with the given step, and packing the results
+# into a single tuple key. Vertices with the same key are merged into the first one of them.
+# A step of 0 compares the attribute exactly.
+
+POSITION_STEP = 1e-5
+NORMAL_STEP = 1e-3
+UV_STEP = 1e-5
+WEIGHT_STEP = 1e-3
+
+
+def quantize(values: Optional[Sequence[float]], scale: float) -> Optional[tuple]:
+    if values is None:
+        return None
+
+    if not scale:
+        return tuple(values)
+
+    return tuple(round(x * scale) for x in values)
+
+
+def quantize_column(column: List[Optional[Sequence[float]]], scale: float) -> List[Optional[tuple]]:
+    """Quantizes an attribute of every vertex. If all vertices have the same number of values for the attribute,
+    the values are quantized as a single flat list, which is much faster than quantizing each vertex separately.
+    """
+    if not column or None in column or len(set(map(len, column))) != 1:
+        return [quantize(c, scale) for c in column]
+
+    width = len(column[0])
+
+    flat = chain.from_iterable(column)
+    if scale:
+        flat = map(round, map(mul, flat, repeat(scale)))
+
+    flat = iter(flat)
+    return list(zip(*[flat] * width))
+
+
+def get_weld_keys(vertices: List['NudVertex'], position_step=POSITION_STEP, normal_step=NORMAL_STEP,
+                  uv_step=UV_STEP, weight_step=WEIGHT_STEP) -> List[tuple]:
+    """Returns the quantized key of each vertex. Colors and bone IDs are always compared exactly."""
+    position_scale = 1 / position_step if position_step else 0
+    normal_scale = 1 / normal_step if normal_step else 0
+    uv_scale = 1 / uv_step if uv_step else 0
+    weight_scale = 1 / weight_step if weight_step else 0
+
+    # UV channels are flattened into a single sequence for each vertex
+    uvs = [tuple(chain.from_iterable(v.uv)) if v.uv is not None else None for v in vertices]
+
+    return list(zip(quantize_column([v.position for v in vertices], position_scale),
+                    quantize_column([v.normal for v in vertices], normal_scale),
+                    quantize_column([v.tangent for v in vertices], normal_scale),
+                    quantize_column([v.bitangent for v in vertices], normal_scale),
+                    quantize_column([v.color for v in vertices], 0),
+                    quantize_column(uvs, uv_scale),
+                    quantize_column([v.bone_ids for v in vertices], 0),
+                    quantize_column([v.bone_weights for v in vertices], weight_scale)))
+
+
+def weld_vertices(vertices: List['NudVertex'], faces: List[Tuple[int, int, int]], position_step=POSITION_STEP,
+                  normal_step=NORMAL_STEP, uv_step=UV_STEP,
+                  weight_step=WEIGHT_STEP) -> Tuple[List['NudVertex'], List[Tuple[int, int, int]], List[int]]:
+    """Merges the vertices that have the same attributes after quantizing them with the given steps.\n
+    Faces that become degenerate after merging are removed.
+    :return: A tuple of the remaining vertices, the remapped faces, and the new index of each old vertex
+    """
+    keys = get_weld_keys(vertices, position_step, normal_step, uv_step, weight_step)
+
+    indices = dict()
+    remap = [0] * len(vertices)
+    result = list()
+
+    for i, key in enumerate(keys):
+        index = indices.setdefault(key, len(result))
+        if index == len(result):
+            result.append(vertices[i])
+
+        remap[i] = index
+
+    result_faces = list()
+    for a, b, c in faces:
+        a, b, c = remap[a], remap[b], remap[c]
+        if a != b and b != c and a != c:
+            result_faces.append((a, b, c))
+
+    return result, result_faces, remap
+
+
+def weld_mesh(mesh: 'NudMesh', position_step=POSITION_STEP, normal_step=NORMAL_STEP, uv_step=UV_STEP,
+              weight_step=WEIGHT_STEP) -> int:
+    """Welds the vertices of a mesh in place (see `weld_vertices`).
+    :return: The number of vertices that were removed
+    """
+    count = len(mesh.vertices)
+    mesh.vertices, mesh.faces, _ = weld_vertices(mesh.vertices, mesh.faces, position_step, normal_step, uv_step,
+                                                 weight_step)
+
+    return count - len(mesh.vertices)
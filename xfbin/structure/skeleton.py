@@ -0,0 +1,143 @@
+from math import cos, radians, sin
+from typing import Dict, List, Tuple
+
+# 4x4 matrices are stored as flat tuples of 16 floats in row-major order, and transform column vectors
+# (i.e. the translation is stored in elements 3, 7 and 11).
+Matrix = Tuple[float, ...]
+
+IDENTITY_MATRIX: Matrix = (1.0, 0.0, 0.0, 0.0,
+                           0.0, 1.0, 0.0, 0.0,
+                           0.0, 0.0, 1.0, 0.0,
+                           0.0, 0.0, 0.0, 1.0)
+
+
+class Skeleton:
+    """A flattened view of a coord node hierarchy, with a parent index and transform for each bone.\n
+    Bones are ordered depth first, so parents always come before their children,
+    and the subtree of each bone is a contiguous range that starts at the bone itself.\n
+    Rotations are euler angles in degrees, applied in X, Y, then Z order (ZYX).
+    """
+
+    # CoordNode of each bone
+    nodes: List['CoordNode']
+
+    names: List[str]
+
+    # Index of the parent of each bone, or -1 for root bones
+    parents: List[int]
+
+    positions: List[Tuple[float, float, float]]
+    rotations: List[Tuple[float, float, float]]
+    scales: List[Tuple[float, float, float]]
+
+    # Index after the last bone in the subtree of each bone
+    subtree_ends: List[int]
+
+    def __init__(self, root_nodes: List['CoordNode']):
+        self.nodes = list()
+        self.parents = list()
+
+        # Iterative depth first traversal: (node, parent index) pairs, with the first child on top of the stack
+        stack = [(node, -1) for node in reversed(root_nodes)]
+        while stack:
+            node, parent = stack.pop()
+
+            index = len(self.nodes)
+            self.nodes.append(node)
+            self.parents.append(parent)
+
+            stack.extend((child, index) for child in reversed(node.children))
+
+        self.names = [node.name for node in self.nodes]
+        self.indices: Dict[str, int] = {name: i for i, name in reversed(list(enumerate(self.names)))}
+
+        # Children come after their parents, so a reverse pass is enough to find the end of each subtree
+        self.subtree_ends = list(range(1, len(self.nodes) + 1))
+        for i in range(len(self.nodes) - 1, -1, -1):
+            parent = self.parents[i]
+            if parent != -1 and self.subtree_ends[i] > self.subtree_ends[parent]:
+                self.subtree_ends[parent] = self.subtree_ends[i]
+
+        self.update_from_nodes()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def update_from_nodes(self):
+        """Copies the transforms of the coord nodes into the skeleton's arrays."""
+        self.positions = [tuple(node.position) for node in self.nodes]
+        self.rotations = [tuple(node.rotation) for node in self.nodes]
+        self.scales = [tuple(node.scale) for node in self.nodes]
+
+    def apply_to_nodes(self):
+        """Copies the skeleton's transforms back into the coord nodes."""
+        for node, position, rotation, scale in zip(self.nodes, self.positions, self.rotations, self.scales):
+            node.position = position
+            node.rotation = rotation
+            node.scale = scale
+
+    def index(self, name: str) -> int:
+        """Returns the index of the first bone with the name, or -1 if it does not exist."""
+        return self.indices.get(name, -1)
+
+    def get_subtree(self, index: int) -> range:
+        """Returns the range of the indices of a bone and all of its descendants."""
+        return range(index, self.subtree_ends[index])
+
+    def get_children(self, index: int) -> List[int]:
+        """Returns the indices of the direct children of a bone."""
+        return [i for i in range(index + 1, self.subtree_ends[index]) if self.parents[i] == index]
+
+    def local_matrices(self) -> List[Matrix]:
+        """Returns the local matrix (translation * rotation * scale) of every bone."""
+        result = list()
+
+        for (px, py, pz), (rx, ry, rz), (sx, sy, sz) in zip(self.positions, self.rotations, self.scales):
+            rx, ry, rz = radians(rx), radians(ry), radians(rz)
+            cx, sxr = cos(rx), sin(rx)
+            cy, syr = cos(ry), sin(ry)
+            cz, szr = cos(rz), sin(rz)
+
+            # Rz * Ry * Rx, with the scale applied to the columns
+            result.append((
+                cz * cy * sx, (cz * syr * sxr - szr * cx) * sy, (cz * syr * cx + szr * sxr) * sz, px,
+                szr * cy * sx, (szr * syr * sxr + cz * cx) * sy, (szr * syr * cx - cz * sxr) * sz, py,
+                -syr * sx, cy * sxr * sy, cy * cx * sz, pz,
+                0.0, 0.0, 0.0, 1.0,
+            ))
+
+        return result
+
+    def world_matrices(self, local_matrices: List[Matrix] = None) -> List[Matrix]:
+        """Returns the world matrix of every bone, computed in a single pass over the bones.\n
+        local_matrices can be given to avoid computing them again (e.g. after modifying some of them).
+        """
+        local_matrices = local_matrices or self.local_matrices()
+        result: List[Matrix] = list()
+
+        for parent, local in zip(self.parents, local_matrices):
+            if parent == -1:
+                result.append(local)
+                continue
+
+            # Both matrices are affine, so the last row is always (0, 0, 0, 1)
+            a00, a01, a02, a03, a10, a11, a12, a13, a20, a21, a22, a23 = result[parent][:12]
+            b00, b01, b02, b03, b10, b11, b12, b13, b20, b21, b22, b23 = local[:12]
+
+            result.append((
+                a00 * b00 + a01 * b10 + a02 * b20,
+                a00 * b01 + a01 * b11 + a02 * b21,
+                a00 * b02 + a01 * b12 + a02 * b22,
+                a00 * b03 + a01 * b13 + a02 * b23 + a03,
+                a10 * b00 + a11 * b10 + a12 * b20,
+                a10 * b01 + a11 * b11 + a12 * b21,
+                a10 * b02 + a11 * b12 + a12 * b22,
+                a10 * b03 + a11 * b13 + a12 * b23 + a13,
+                a20 * b00 + a21 * b10 + a22 * b20,
+                a20 * b01 + a21 * b11 + a22 * b21,
+                a20 * b02 + a21 * b12 + a22 * b22,
+                a20 * b03 + a21 * b13 + a22 * b23 + a23,
+                0.0, 0.0, 0.0, 1.0,
+            ))
+
+        return result
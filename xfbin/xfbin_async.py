@@ -0,0 +1,131 @@
+import asyncio
+import os
+from concurrent.futures import Executor
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, List, Optional, Union
+
+from .structure.br.br_xfbin import *
+from .structure.xfbin import Page, Xfbin
+from .util import *
+from .xfbin_reader import create_chunks, create_page
+from .xfbin_writer import SPOOL_SIZE
+
+# Size of the blocks used when copying the spooled pages to the output file
+COPY_SIZE = 0x100000
+
+# The async functions run each step (opening the file, reading/writing a single page, etc.) as a separate call to the
+# executor, so they can be cancelled between pages, and calls from other tasks can run in between.
+# The executor has to be a thread executor (or None for the event loop's default executor), as the steps share state.
+
+
+async def run_step(executor: Optional[Executor], func, *args):
+    """Runs a single step in the executor and returns its result.\n
+    If the task is cancelled while the step is running, the step is allowed to finish first, so that cleaning up
+    after cancellation never runs at the same time as a step.
+    """
+    future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+async def read_xfbin_async(file: Union[str, bytearray, BinaryIO], executor: Optional[Executor] = None,
+                           hash_chunks=False, nud_level=NudParseLevel.FULL) -> Xfbin:
+    """Reads an XFBIN file without blocking the event loop and returns an Xfbin object.
+    :param file: Same as in `read_xfbin`. File-like objects are read from the executor's threads
+    :param executor: Thread executor to run the reading and decoding in (defaults to the event loop's executor)
+    :param hash_chunks: Same as in `read_xfbin`
+    :param nud_level: Same as in `read_xfbin`
+    :return: The Xfbin object
+    """
+    if isinstance(file, str):
+        f = await run_step(executor, open, file, 'rb')
+        try:
+            return await read_xfbin_async(f, executor, hash_chunks, nud_level)
+        finally:
+            await run_step(executor, f.close)
+
+    if not hasattr(file, 'read'):
+        file = BytesIO(file)
+
+    br_stream: BrXfbinStream = await run_step(executor, BrXfbinStream, file)
+    table = br_stream.chunkTable
+    chunks = create_chunks(table)
+    pages = br_stream.read_pages(True, hash_chunks, nud_level)
+
+    def read_page() -> Optional[Page]:
+        br_page = next(pages, None)
+        return create_page(table, chunks, br_page) if br_page else None
+
+    xfbin = Xfbin()
+    while True:
+        page = await run_step(executor, read_page)
+        if not page:
+            break
+
+        xfbin.pages.append(page)
+
+    return xfbin
+
+
+async def write_xfbin_to_stream_async(xfbin: Xfbin, stream: BinaryIO, executor: Optional[Executor] = None,
+                                      serialized_pages: Optional[List[SerializedPage]] = None,
+                                      spool_size=SPOOL_SIZE) -> None:
+    """Writes an XFBIN object to a binary file-like object without blocking the event loop.
+    :param xfbin: Xfbin object
+    :param stream: Writable binary file-like object. Writes to it are done from the executor's threads
+    :param executor: Thread executor to run the encoding and writing in (defaults to the event loop's executor)
+    :param serialized_pages: Same as in `write_xfbin`
+    :param spool_size: Same as in `write_xfbin_to_stream`
+    """
+    br_xfbin = BrXfbin()
+    pages = br_xfbin.write_pages(xfbin, serialized_pages)
+
+    with SpooledTemporaryFile(spool_size) as pages_file:
+        def write_page() -> bool:
+            data = next(pages, None)
+            if data is None:
+                return False
+
+            pages_file.write(data)
+            return True
+
+        while await run_step(executor, write_page):
+            pass
+
+        def write_table():
+            with BinaryReader(endianness=Endian.BIG) as br:
+                br_xfbin.write_table(br)
+                stream.write(br.buffer())
+
+            pages_file.seek(0)
+
+        await run_step(executor, write_table)
+
+        def copy_block() -> bool:
+            data = pages_file.read(COPY_SIZE)
+            stream.write(data)
+            return len(data) != 0
+
+        while await run_step(executor, copy_block):
+            pass
+
+
+async def write_xfbin_to_path_async(xfbin: Xfbin, path: str, executor: Optional[Executor] = None,
+                                    serialized_pages: Optional[List[SerializedPage]] = None) -> None:
+    """Writes an XFBIN object to a path without blocking the event loop.\n
+    If writing fails or is cancelled, the partially written file is removed.
+    """
+    f = await run_step(executor, open, path, 'wb')
+    try:
+        await write_xfbin_to_stream_async(xfbin, f, executor, serialized_pages)
+    except BaseException:
+        await run_step(executor, f.close)
+        await run_step(executor, os.remove, path)
+        raise
+
+    await run_step(executor, f.close)
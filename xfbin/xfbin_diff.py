@@ -0,0 +1,344 @@
+import io
+from enum import Enum
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+from .structure.br.br_xfbin import *
+from .structure.nucc import NuccChunk
+from .util import *
+from .xfbin_reader import create_chunks
+
+# Chunks are matched by their (type, path, name), and only the chunks with different data hashes are decoded.
+# Null, page, and index chunks are not compared, as they are rebuilt on every write.
+SKIPPED_CHUNK_TYPES = ('nuccChunkNull', 'nuccChunkPage', 'nuccChunkIndex')
+
+# Lists with more items than this are reported as a count of the changed items, instead of each changed item
+MAX_LISTED_ITEMS = 16
+
+# Max number of semantic changes to report for each chunk
+MAX_CHANGES = 50
+
+
+class ChunkDiff:
+    """The difference of a single chunk between two XFBINs.\n
+    Status is one of "added", "removed", or "changed". Changed chunks have a list of the decoded changes.
+    """
+
+    def __init__(self, key: Tuple[str, str, str], status: str, changes: List[str] = None):
+        self.type, self.path, self.name = key
+        self.status = status
+        self.changes = changes or list()
+
+    def __str__(self):
+        symbol = {'added': '+', 'removed': '-', 'changed': '~'}[self.status]
+        lines = [f'{symbol} {self.type} "{self.name}" ({self.path})']
+        lines.extend(f'    {c}' for c in self.changes)
+
+        return '\n'.join(lines)
+
+
+class XfbinDiff:
+    """The difference between two XFBINs, at the chunk table level and at the chunk level."""
+
+    def __init__(self):
+        self.page_counts: Tuple[int, int] = (0, 0)
+
+        # Chunk maps that exist in only one of the chunk tables, as (type, path, name) tuples
+        self.added_chunk_maps: List[Tuple[str, str, str]] = list()
+        self.removed_chunk_maps: List[Tuple[str, str, str]] = list()
+
+        # Chunk references that exist in only one of the chunk tables, as (name, (type, path, name)) tuples
+        self.added_references: List[Tuple[str, Tuple[str, str, str]]] = list()
+        self.removed_references: List[Tuple[str, Tuple[str, str, str]]] = list()
+
+        self.chunks: List[ChunkDiff] = list()
+
+        # Number of chunks that were compared and were equal
+        self.equal_count = 0
+
+    def __bool__(self):
+        # True if there are any differences
+        return (self.page_counts[0] != self.page_counts[1] or bool(self.added_chunk_maps or self.removed_chunk_maps
+                or self.added_references or self.removed_references or self.chunks))
+
+    def __str__(self):
+        lines = list()
+
+        if self.page_counts[0] != self.page_counts[1]:
+            lines.append(f'Page count: {self.page_counts[0]} -> {self.page_counts[1]}')
+
+        lines.extend(f'+ chunk map {m}' for m in self.added_chunk_maps)
+        lines.extend(f'- chunk map {m}' for m in self.removed_chunk_maps)
+        lines.extend(f'+ reference "{name}" -> {m}' for name, m in self.added_references)
+        lines.extend(f'- reference "{name}" -> {m}' for name, m in self.removed_references)
+        lines.extend(map(str, self.chunks))
+
+        lines.append(f'{len(self.chunks)} chunk(s) differ, {self.equal_count} chunk(s) are equal')
+
+        return '\n'.join(lines)
+
+
+class DiffChunkEntry:
+    """A raw chunk that was read for diffing, with enough info for decoding it later if needed."""
+
+    def __init__(self, br_chunk: 'BrChunk', digest: bytes, page_indices: List[int], page_references: List['BrChunkReference'],
+                 page_context: tuple):
+        self.br_chunk = br_chunk
+        self.digest = digest
+        self.page_indices = page_indices
+        self.page_references = page_references
+
+        # The (type, path, name) of each of the page's chunk indices, and the (name, (type, path, name)) of each of its
+        # references. Chunk data refers to other chunks by these page local indices, so chunks with the same data
+        # can still refer to different chunks if these are different
+        self.page_context = page_context
+
+
+class DiffSide:
+    """Reads the chunk table and the raw chunks of one of the XFBINs being compared, without decoding the chunks."""
+
+    def __init__(self, file: Union[str, bytearray, BinaryIO]):
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                self.read(f)
+        else:
+            self.read(file if hasattr(file, 'read') else io.BytesIO(file))
+
+    def read(self, stream: BinaryIO):
+        br_stream = BrXfbinStream(stream)
+        self.table = table = br_stream.chunkTable
+
+        # Chunk entries by (type, path, name). Lists are used in case the same chunk map has data in multiple pages
+        self.entries: Dict[Tuple[str, str, str], List[DiffChunkEntry]] = dict()
+        self.page_count = 0
+
+        for br_page in br_stream.read_pages(False, True):
+            self.page_count += 1
+
+            page_context = (tuple(table.get_props_from_chunk_map(table.chunkMaps[i]) for i in br_page.pageChunkIndices),
+                            tuple((table.chunkNames[r.chunkNameIndex],
+                                   table.get_props_from_chunk_map(table.chunkMaps[r.chunkMapIndex]))
+                                  for r in br_page.pageChunkReferences))
+
+            for index, br_chunk in br_page.rawChunksDict.items():
+                key = table.get_props_from_chunk_map(table.chunkMaps[br_page.pageChunkIndices[index]])
+                if key[0] in SKIPPED_CHUNK_TYPES:
+                    continue
+
+                self.entries.setdefault(key, list()).append(
+                    DiffChunkEntry(br_chunk, br_page.chunkHashes[index], br_page.pageChunkIndices, br_page.pageChunkReferences,
+                                   page_context))
+
+        self.chunk_maps = list(map(table.get_props_from_chunk_map, table.chunkMaps))
+        self.references = list(map(lambda x: (table.chunkNames[x.chunkNameIndex], self.chunk_maps[x.chunkMapIndex]),
+                                   table.chunkMapReferences))
+
+        # NuccChunks are only created when a chunk has to be decoded
+        self.chunks: Optional[List[NuccChunk]] = None
+
+    def decode(self, key: Tuple[str, str, str], entry: DiffChunkEntry) -> NuccChunk:
+        if self.chunks is None:
+            self.chunks = create_chunks(self.table)
+
+        br_nucc_chunk = BrNuccChunk.create_from_nucc_type(*key, entry.br_chunk.data)
+
+        chunk = self.chunks[entry.page_indices[entry.br_chunk.chunkMapIndex]]
+        chunk.init_data(br_nucc_chunk, self.chunks, entry.page_indices, entry.page_references)
+
+        return chunk
+
+
+def get_chunk_key(chunk: NuccChunk) -> Tuple[str, str, str]:
+    return (NuccChunk.get_nucc_str_from_type(type(chunk)), chunk.filePath, chunk.name)
+
+
+def compare_values(a, b, path: str, changes: Optional[List[str]]) -> bool:
+    """Compares two decoded values recursively, and returns True if they are equal.\n
+    If changes is not None, a description of each difference will be added to it.
+    """
+    if isinstance(a, NuccChunk) or isinstance(b, NuccChunk):
+        # Referenced chunks are compared by their chunk maps only
+        if isinstance(a, NuccChunk) and isinstance(b, NuccChunk) and get_chunk_key(a) == get_chunk_key(b):
+            return True
+
+        if changes is not None:
+            changes.append(f'{path}: {describe(a)} -> {describe(b)}')
+        return False
+
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        if len(a) != len(b):
+            if changes is not None:
+                changes.append(f'{path}: {len(a)} items -> {len(b)} items')
+            return False
+
+        # Short lists of simple values are shown as they are
+        if len(a) <= MAX_LISTED_ITEMS and not any(map(has_attributes, a)):
+            if a == b or all(compare_values(x, y, '', None) for x, y in zip(a, b)):
+                return True
+
+            if changes is not None:
+                changes.append(f'{path}: {describe(a)} -> {describe(b)}')
+            return False
+
+        if len(a) > MAX_LISTED_ITEMS:
+            changed = sum(1 for x, y in zip(a, b) if not compare_values(x, y, '', None))
+            if changed and changes is not None:
+                changes.append(f'{path}: {changed} of {len(a)} items changed')
+            return changed == 0
+
+        equal = True
+        for i, (x, y) in enumerate(zip(a, b)):
+            equal &= compare_values(x, y, f'{path}[{i}]', changes)
+            if not equal and changes is None:
+                return False
+
+        return equal
+
+    if has_attributes(a) and has_attributes(b) and type(a) == type(b):
+        return compare_attributes(a, b, path, changes)
+
+    if a == b:
+        return True
+
+    if changes is not None:
+        changes.append(f'{path}: {describe(a)} -> {describe(b)}')
+    return False
+
+
+def compare_attributes(a, b, path: str, changes: Optional[List[str]]) -> bool:
+    """Compares the attributes of two objects of the same type using `compare_values`."""
+    equal = True
+
+    # Keep the order of the attributes for consistent output
+    names = list(vars(a)) + [n for n in vars(b) if n not in vars(a)]
+
+    # Attributes that are loaded on first access might not be in either object yet
+    names += [n for n in getattr(type(a), 'lazy_attributes', ()) if n not in names]
+
+    # Raw data, caches, and references back to other objects are declared by each class
+    skipped = getattr(type(a), 'transient_attributes', ())
+
+    for name in names:
+        if name in skipped:
+            continue
+
+        equal &= compare_values(getattr(a, name, None), getattr(b, name, None), f'{path}.{name}'.lstrip('.'), changes)
+        if not equal and changes is None:
+            return False
+
+    return equal
+
+
+def has_attributes(value) -> bool:
+    return hasattr(value, '__dict__') and not isinstance(value, (type, Enum))
+
+
+def describe(value) -> str:
+    if isinstance(value, NuccChunk):
+        return f'{get_chunk_key(value)}'
+
+    if isinstance(value, (list, tuple)):
+        return f'({", ".join(map(describe, value))})'
+
+    if isinstance(value, float):
+        return f'{value:g}'
+
+    return repr(value)
+
+
+def describe_payload(data: Optional[Union[bytes, bytearray]]) -> str:
+    """Describes raw data by its size and the start of its hash."""
+    if data is None:
+        return 'None'
+
+    return f'{len(data)} bytes ({get_chunk_hash(data).hex()[:16]})'
+
+
+def diff_chunk(key: Tuple[str, str, str], side_a: DiffSide, entry_a: DiffChunkEntry,
+               side_b: DiffSide, entry_b: DiffChunkEntry) -> List[str]:
+    """Decodes a chunk that has different data or a different page context in both XFBINs, and returns a list of its changes.\n
+    Chunks with the same data are only different if they refer to different chunks, so an empty list is returned otherwise.
+    """
+    chunk_a = side_a.decode(key, entry_a)
+    chunk_b = side_b.decode(key, entry_b)
+
+    same_data = entry_a.digest == entry_b.digest
+
+    changes = list()
+    if not chunk_a.has_props:
+        # Chunks that are not decoded cannot refer to other chunks
+        if same_data:
+            return changes
+
+        # There is nothing to decode
+        changes.append(f'data: {describe_payload(entry_a.br_chunk.data)} -> {describe_payload(entry_b.br_chunk.data)}')
+    else:
+        # The chunks themselves are compared by their attributes, while referenced chunks are compared by their chunk maps
+        compare_attributes(chunk_a, chunk_b, '', changes)
+
+        # Payloads that are not decoded yet (e.g. NUT textures) are skipped by compare_attributes, so compare their hashes
+        file_data_a = getattr(chunk_a, 'file_data', None)
+        file_data_b = getattr(chunk_b, 'file_data', None)
+        if not same_data and describe_payload(file_data_a) != describe_payload(file_data_b):
+            changes.append(f'file_data: {describe_payload(file_data_a)} -> {describe_payload(file_data_b)}')
+
+        # The rest of the raw data changed, even though every decoded field is equal
+        if not changes and not same_data:
+            changes.append(f'raw data: {describe_payload(entry_a.br_chunk.data)} -> {describe_payload(entry_b.br_chunk.data)} '
+                           '(the decoded fields are equal)')
+
+    if len(changes) > MAX_CHANGES:
+        changes = changes[:MAX_CHANGES] + [f'... and {len(changes) - MAX_CHANGES} more change(s)']
+
+    return changes
+
+
+def diff_xfbin(a: Union[str, bytearray, BinaryIO], b: Union[str, bytearray, BinaryIO], decode=True) -> XfbinDiff:
+    """Compares two XFBIN files and returns an XfbinDiff.\n
+    Chunks are matched by their type, path, and name, and are compared by the hashes of their data and the chunks
+    that their pages' local indices refer to. Only the chunks that are different are decoded to find what changed (if decode is True).
+    :param a: Path to file as a string, bytes-like object, or binary file-like object (same as `read_xfbin`)
+    :param b: Same as a
+    :param decode: If False, changed chunks will not be decoded, and will not have a list of changes
+    :return: The XfbinDiff
+    """
+    side_a = DiffSide(a)
+    side_b = DiffSide(b)
+
+    result = XfbinDiff()
+    result.page_counts = (side_a.page_count, side_b.page_count)
+
+    maps_a = set(side_a.chunk_maps)
+    maps_b = set(side_b.chunk_maps)
+    result.added_chunk_maps = [m for m in side_b.chunk_maps if m not in maps_a]
+    result.removed_chunk_maps = [m for m in side_a.chunk_maps if m not in maps_b]
+
+    refs_a = set(side_a.references)
+    refs_b = set(side_b.references)
+    result.added_references = [r for r in side_b.references if r not in refs_a]
+    result.removed_references = [r for r in side_a.references if r not in refs_b]
+
+    # Keep the order of the chunks in the first file, followed by the chunks that were added in the second file
+    keys = list(side_a.entries) + [k for k in side_b.entries if k not in side_a.entries]
+
+    for key in keys:
+        entries_a = side_a.entries.get(key, list())
+        entries_b = side_b.entries.get(key, list())
+
+        for i in range(max(len(entries_a), len(entries_b))):
+            if i >= len(entries_a):
+                result.chunks.append(ChunkDiff(key, 'added'))
+            elif i >= len(entries_b):
+                result.chunks.append(ChunkDiff(key, 'removed'))
+            elif entries_a[i].digest == entries_b[i].digest and entries_a[i].page_context == entries_b[i].page_context:
+                result.equal_count += 1
+            elif not decode:
+                result.chunks.append(ChunkDiff(key, 'changed'))
+            else:
+                # Chunks with the same data but a different page context are equal if they still refer to the same chunks
+                changes = diff_chunk(key, side_a, entries_a[i], side_b, entries_b[i])
+                if changes:
+                    result.chunks.append(ChunkDiff(key, 'changed', changes))
+                else:
+                    result.equal_count += 1
+
+    return result
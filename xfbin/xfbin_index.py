@@ -0,0 +1,192 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .structure.br.br_xfbin import *
+from .util import *
+
+# The index stores the chunk maps of every XFBIN in a folder, along with the size and hash of each chunk's data.
+# Files are only read again if their size or modification time changed since the last scan.
+
+INDEX_VERSION = 1
+
+INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    hash BLOB
+);
+CREATE INDEX IF NOT EXISTS chunks_file ON chunks(file_id);
+CREATE INDEX IF NOT EXISTS chunks_name ON chunks(name);
+CREATE INDEX IF NOT EXISTS chunks_type ON chunks(type);
+CREATE INDEX IF NOT EXISTS chunks_hash ON chunks(hash);
+'''
+
+# Null, page, and index chunks do not contain anything that is worth indexing
+SKIPPED_CHUNK_TYPES = ('nuccChunkNull', 'nuccChunkPage', 'nuccChunkIndex')
+
+# (page, type, path, name, size, hash)
+ChunkRow = Tuple[int, str, str, str, int, Optional[bytes]]
+
+
+def get_chunk_rows(path: str, hash_data=True) -> List[ChunkRow]:
+    """Reads the chunk table and the raw chunks of an XFBIN without decoding the chunks, and returns a row for each chunk."""
+    rows = list()
+
+    with open(path, 'rb') as f:
+        br_stream = BrXfbinStream(f)
+        table = br_stream.chunkTable
+
+        for page, br_page in enumerate(br_stream.read_pages(False, hash_data)):
+            for index, br_chunk in br_page.rawChunksDict.items():
+                chunk_type, file_path, name = table.get_props_from_chunk_map(table.chunkMaps[br_page.pageChunkIndices[index]])
+                if chunk_type in SKIPPED_CHUNK_TYPES:
+                    continue
+
+                rows.append((page, chunk_type, file_path, name, br_chunk.size, br_page.chunkHashes.get(index)))
+
+    return rows
+
+
+def index_worker(path: str, hash_data: bool) -> Tuple[str, List[ChunkRow], Optional[str]]:
+    """Returns the path, the chunk rows, and the error message (if reading failed) of a single XFBIN."""
+    try:
+        return path, get_chunk_rows(path, hash_data), None
+    except Exception as e:
+        return path, [], str(e) or type(e).__name__
+
+
+class XfbinIndex:
+    """A SQLite database of the chunks of every XFBIN inside one or more folders.\n
+    Can be used as a context manager, which closes the database on exit.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(INDEX_SCHEMA)
+
+        version = self.connection.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+        if version and int(version[0]) != INDEX_VERSION:
+            raise Exception(f'Unsupported index version: {version[0]}')
+
+        self.connection.execute("INSERT OR REPLACE INTO info VALUES ('version', ?)", (str(INDEX_VERSION),))
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def scan(self, directory: str, extension='.xfbin', jobs=1, hash_data=True,
+             progress: Optional[Callable[[str, int, Optional[str]], None]] = None) -> Tuple[int, int, int]:
+        """Indexes every file with the extension inside the directory (recursively).\n
+        Files that were already indexed are skipped if their size and modification time did not change,
+        and files that no longer exist are removed from the index.\n
+        progress is called with the path, the number of chunks, and the error message of each newly indexed file.
+        :return: A tuple of the number of (indexed, skipped, removed) files
+        """
+        directory = os.path.abspath(directory)
+
+        # Stats of the files that were already indexed
+        prefix = os.path.join(directory, '')
+        indexed = {path: (id, size, mtime) for id, path, size, mtime in self.connection.execute(
+            'SELECT id, path, size, mtime FROM files WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))}
+
+        # Files that have to be read, and their current stats
+        changed = dict()
+        found = set()
+        skipped = 0
+
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if not name.lower().endswith(extension):
+                    continue
+
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                found.add(path)
+
+                if path in indexed and indexed[path][1:] == (stat.st_size, stat.st_mtime_ns):
+                    skipped += 1
+                else:
+                    changed[path] = (stat.st_size, stat.st_mtime_ns)
+
+        # Remove the files that were deleted
+        removed = [(id,) for path, (id, _, _) in indexed.items() if path not in found]
+        self.connection.executemany('DELETE FROM files WHERE id = ?', removed)
+
+        for path, rows, error in self.read_files(list(changed), jobs, hash_data):
+            self.connection.execute('DELETE FROM files WHERE path = ?', (path,))
+
+            file_id = self.connection.execute('INSERT INTO files (path, size, mtime, error) VALUES (?, ?, ?, ?)',
+                                              (path, *changed[path], error)).lastrowid
+            self.connection.executemany('INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                        ((file_id, *row) for row in rows))
+
+            if progress:
+                progress(path, len(rows), error)
+
+        self.connection.commit()
+
+        return len(changed), skipped, len(removed)
+
+    @staticmethod
+    def read_files(paths: List[str], jobs: int, hash_data: bool) -> Iterator[Tuple[str, List[ChunkRow], Optional[str]]]:
+        if jobs > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(jobs) as executor:
+                yield from executor.map(index_worker, paths, [hash_data] * len(paths), chunksize=4)
+        else:
+            yield from map(index_worker, paths, [hash_data] * len(paths))
+
+    def find(self, name: str = None, chunk_type: str = None, path: str = None,
+             digest: bytes = None) -> List[Tuple[str, int, str, str, str, int, Optional[bytes]]]:
+        """Returns the chunks that match all of the given filters, as (archive path, page, type, path, name, size, hash) tuples.\n
+        name, chunk_type and path are matched using SQL LIKE patterns (case insensitive, with % and _ as wildcards).
+        """
+        conditions = list()
+        values = list()
+
+        for column, value in (('chunks.name', name), ('chunks.type', chunk_type), ('chunks.path', path)):
+            if value is not None:
+                conditions.append(f'{column} LIKE ?')
+                values.append(value)
+
+        if digest is not None:
+            conditions.append('chunks.hash = ?')
+            values.append(digest)
+
+        query = ('SELECT files.path, chunks.page, chunks.type, chunks.path, chunks.name, chunks.size, chunks.hash '
+                 'FROM chunks JOIN files ON files.id = chunks.file_id')
+
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        return self.connection.execute(query + ' ORDER BY files.path, chunks.page', values).fetchall()
+
+    def errors(self) -> List[Tuple[str, str]]:
+        """Returns the (path, error message) of each file that could not be read."""
+        return self.connection.execute('SELECT path, error FROM files WHERE error IS NOT NULL ORDER BY path').fetchall()
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
@@ -1,55 +1,79 @@
-from typing import List, Union
+from typing import BinaryIO, Iterable, List, Union
 
+from .cpk import decompress_crilayla, is_crilayla
 from .structure.br.br_xfbin import *
 from .structure.nucc import NuccChunk
 from .structure.xfbin import Page, Xfbin
 from .util import *
 
 
-def read_xfbin(file: Union[str, bytearray]) -> Xfbin:
+def read_xfbin(file: Union[str, bytearray, BinaryIO], hash_chunks=False, nud_level=NudParseLevel.FULL) -> Xfbin:
     """Reads an XFBIN file and returns an Xfbin object.
-    :param file: Path to file as a string, or bytes-like object containing the file
+    :param file: Path to file as a string, bytes-like object containing the file, or binary file-like object
+    Files and file-like objects (including pipes and archive members) are read one page at a time.
+    CRILAYLA compressed XFBINs are decompressed first.
+    :param hash_chunks: If True, the content hash of each chunk's data will be set to the NuccChunk's content_hash
+    :param nud_level: NudParseLevel of the NUDs inside model chunks. With NudParseLevel.FACES or METADATA, the vertices
+    (and the faces with METADATA) of each NudMesh are only read when they are first accessed
     :return: The Xfbin object
     """
     if isinstance(file, str):
         with open(file, 'rb') as f:
-            file_bytes = f.read()
-    else:
-        file_bytes = file
+            return read_xfbin(f, hash_chunks, nud_level)
 
-    with BinaryReader(file_bytes, Endian.BIG, 'cp932') as br:
-        br_xfbin: BrXfbin = br.read_struct(BrXfbin)
+    if hasattr(file, 'read'):
+        br_stream = BrXfbinStream(file)
+        return create_xfbin(br_stream.chunkTable, br_stream.read_pages(True, hash_chunks, nud_level))
 
-    table = br_xfbin.chunkTable
+    if is_crilayla(file):
+        file = decompress_crilayla(file)
 
-    # Create NuccChunks with the correct type from the chunk map
-    chunks: List[NuccChunk] = list()
-    for m in table.chunkMaps:
-        chunks.append(NuccChunk.create_from_nucc_type(*table.get_props_from_chunk_map(m)))
+    with BinaryReader(file, Endian.BIG, 'cp932') as br:
+        br_xfbin: BrXfbin = br.read_struct(BrXfbin, None, hash_chunks, nud_level)
+
+    return create_xfbin(br_xfbin.chunkTable, br_xfbin.pages)
+
+
+def create_xfbin(table: BrChunkTable, br_pages: Iterable[BrPage]) -> Xfbin:
+    """Creates an Xfbin from a chunk table and its BrPages. Each BrPage is converted as soon as it is given."""
+    chunks = create_chunks(table)
 
     xfbin = Xfbin()
-    for br_page in br_xfbin.pages:
-        page = Page()
+    for br_page in br_pages:
+        # Add the page to the xfbin
+        xfbin.pages.append(create_page(table, chunks, br_page))
 
-        # Used for writing the page's JSON for repacking
-        page.initial_page_chunks = list(map(lambda x: chunks[x], br_page.pageChunkIndices))
+    return xfbin
 
-        # Create ChunkReferences and add them to the page's list
-        page.chunk_references = list(map(lambda x: ChunkReference(
-            table.chunkNames[x.chunkNameIndex], chunks[x.chunkMapIndex]), br_page.pageChunkReferences))
 
-        for index in br_page.chunksDict:
-            # Get the NuccChunk corresponding to the current BrNuccChunk
-            chunk: NuccChunk = chunks[br_page.pageChunkIndices[index]]
+def create_chunks(table: BrChunkTable) -> List[NuccChunk]:
+    """Creates NuccChunks with the correct type for each chunk map in the chunk table."""
+    return list(map(lambda m: NuccChunk.create_from_nucc_type(*table.get_props_from_chunk_map(m)), table.chunkMaps))
 
-            # Initialize the NuccChunk's data using the BrNuccChunk, the list of chunks, and the indices from the page
-            chunk.init_data(br_page.chunksDict[index], chunks,
-                            br_page.pageChunkIndices, br_page.pageChunkReferences)
 
-            # Add the chunk to the page
-            page.chunks.append(chunk)
+def create_page(table: BrChunkTable, chunks: List[NuccChunk], br_page: BrPage) -> Page:
+    """Creates a Page from a BrPage, and initializes the data of the page's NuccChunks."""
+    page = Page()
 
-        # Add the page to the xfbin
-        xfbin.pages.append(page)
+    # Used for writing the page's JSON for repacking
+    page.initial_page_chunks = list(map(lambda x: chunks[x], br_page.pageChunkIndices))
 
-    return xfbin
+    # Create ChunkReferences and add them to the page's list
+    page.chunk_references = list(map(lambda x: ChunkReference(
+        table.chunkNames[x.chunkNameIndex], chunks[x.chunkMapIndex]), br_page.pageChunkReferences))
+
+    for index in br_page.chunksDict:
+        # Get the NuccChunk corresponding to the current BrNuccChunk
+        chunk: NuccChunk = chunks[br_page.pageChunkIndices[index]]
+
+        # Initialize the NuccChunk's data using the BrNuccChunk, the list of chunks, and the indices from the page
+        chunk.init_data(br_page.chunksDict[index], chunks,
+                        br_page.pageChunkIndices, br_page.pageChunkReferences)
+
+        # Set the hash that was calculated while reading the page, if any
+        chunk.content_hash = br_page.chunkHashes.get(index)
+
+        # Add the chunk to the page
+        page.chunks.append(chunk)
+
+    return page
@@ -1,23 +1,55 @@
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, List, Optional
+
 from .structure.br.br_xfbin import *
 from .structure.xfbin import Xfbin
 from .util import *
 
+# Default max size of the pages that are kept in memory while streaming an XFBIN
+SPOOL_SIZE = 0x1000000
+
 
-def write_xfbin(xfbin: Xfbin) -> bytearray:
+def write_xfbin(xfbin: Xfbin, serialized_pages: Optional[List[SerializedPage]] = None) -> bytearray:
     """Writes an XFBIN object to memory and returns a bytearray.
     :param xfbin: Xfbin object
+    :param serialized_pages: Optional list with a SerializedPage or None for each page. Pages with a SerializedPage
+    will be copied from it instead of being written, and None entries will be replaced with the newly written pages.
     :return: A bytearray containing the written xfbin
     """
 
     br = BinaryReader(endianness=Endian.BIG)
 
     # Everything will be handled by the BrXfbin
-    br.write_struct(BrXfbin(), xfbin)
+    br.write_struct(BrXfbin(), xfbin, serialized_pages)
 
     return br.buffer()
 
 
-def write_xfbin_to_path(xfbin: Xfbin, path: str) -> None:
-    file = write_xfbin(xfbin)
+def write_xfbin_to_stream(xfbin: Xfbin, stream: BinaryIO, serialized_pages: Optional[List[SerializedPage]] = None,
+                          spool_size=SPOOL_SIZE) -> None:
+    """Writes an XFBIN object to a binary file-like object, one page at a time.\n
+    The chunk table comes before the pages, so the pages are kept in a temporary file (in memory until its size
+    exceeds spool_size) until the table has been written. Only one page is kept in memory at a time otherwise.
+    :param xfbin: Xfbin object
+    :param stream: Writable binary file-like object. Does not have to be seekable
+    :param serialized_pages: Same as in `write_xfbin`
+    :param spool_size: Max size of the pages to keep in memory before moving them to a temporary file
+    """
+    br_xfbin = BrXfbin()
+
+    with SpooledTemporaryFile(spool_size) as pages_file:
+        for data in br_xfbin.write_pages(xfbin, serialized_pages):
+            pages_file.write(data)
+
+        with BinaryReader(endianness=Endian.BIG) as br:
+            br_xfbin.write_table(br)
+            stream.write(br.buffer())
+
+        pages_file.seek(0)
+        copyfileobj(pages_file, stream)
+
+
+def write_xfbin_to_path(xfbin: Xfbin, path: str, serialized_pages: Optional[List[SerializedPage]] = None) -> None:
     with open(path, 'wb') as f:
-        f.write(file)
+        write_xfbin_to_stream(xfbin, f, serialized_pages)